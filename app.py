@@ -1,190 +1,25 @@
 import streamlit as st
 import sqlite3
-import pandas as pd
 import hashlib
-import json
 # CORREÇÃO 1: Importação de timedelta adicionada para resolver o NameError
 from datetime import datetime, timedelta
-from streamlit_calendar import calendar
-from fpdf import FPDF
-import tempfile
-import os
-from PIL import Image
-import io
+from db import connection, transaction, catalog_path, route
+from bootstrap import startup
+import perf
+# pandas, PDF, imagens e calendário não entram aqui: o login não precisa deles (ver bootstrap.py)
 
 # ==========================================
 # 1. CONFIGURAÇÃO E BASE DE DADOS (V35)
 # ==========================================
 st.set_page_config(page_title="GK Manager Pro v35", layout="wide", page_icon="🧤")
 
-def get_db_connection():
-    # V35: Base de dados nova para garantir estrutura limpa
-    conn = sqlite3.connect('gk_master_v35.db') 
-    return conn
-
 def make_hashes(password):
     return hashlib.sha256(str.encode(password)).hexdigest()
 
-def init_db():
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # USERS
-    c.execute('''CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT)''')
-    
-    # ATLETAS
-    c.execute('''CREATE TABLE IF NOT EXISTS goalkeepers (
-                    id INTEGER PRIMARY KEY, user_id TEXT, name TEXT, age INTEGER, status TEXT, notes TEXT,
-                    height REAL, wingspan REAL, arm_len_left REAL, arm_len_right REAL, glove_size TEXT,
-                    jump_front_2 REAL, jump_front_l REAL, jump_front_r REAL, jump_lat_l REAL, jump_lat_r REAL,
-                    test_res TEXT, test_agil TEXT, test_vel TEXT)''')
-    
-    # EXERCÍCIOS
-    c.execute('''CREATE TABLE IF NOT EXISTS exercises (
-                    id INTEGER PRIMARY KEY, user_id TEXT, title TEXT, moment TEXT, training_type TEXT, 
-                    description TEXT, objective TEXT, materials TEXT, space TEXT, image BLOB)''')
-    
-    # SESSÕES
-    c.execute('''CREATE TABLE IF NOT EXISTS sessions (
-                    id INTEGER PRIMARY KEY, user_id TEXT, type TEXT, title TEXT, start_date TEXT, drills_list TEXT, report TEXT)''')
-    
-    # MICROCICLOS
-    c.execute('''CREATE TABLE IF NOT EXISTS microcycles (
-                    id INTEGER PRIMARY KEY, user_id TEXT, title TEXT, start_date TEXT, goal TEXT, report TEXT)''')
-    
-    # NOTAS
-    c.execute('''CREATE TABLE IF NOT EXISTS training_ratings (
-                    id INTEGER PRIMARY KEY, user_id TEXT, date TEXT, gk_id INTEGER, rating INTEGER, notes TEXT)''')
-    
-    # JOGOS - ESTRUTURA BLINDADA (63 CAMPOS DE DADOS + ID)
-    # CORREÇÃO 2: Garantir que a tabela tem exatamente as colunas que vamos inserir
-    c.execute('''CREATE TABLE IF NOT EXISTS matches (
-                    id INTEGER PRIMARY KEY, 
-                    user_id TEXT, date TEXT, opponent TEXT, gk_id INTEGER, goals_conceded INTEGER, saves INTEGER, result TEXT, report TEXT, rating INTEGER, 
-                    -- Bloqueios (6)
-                    db_bloq_sq_rast INTEGER, db_bloq_sq_med INTEGER, db_bloq_sq_alt INTEGER, db_bloq_cq_rast INTEGER, db_bloq_cq_med INTEGER, db_bloq_cq_alt INTEGER, 
-                    -- Rececoes (6)
-                    db_rec_sq_med INTEGER, db_rec_sq_alt INTEGER, db_rec_cq_rast INTEGER, db_rec_cq_med INTEGER, db_rec_cq_alt INTEGER, db_rec_cq_varr INTEGER, 
-                    -- Desvios (10)
-                    db_desv_sq_pe INTEGER, db_desv_sq_mfr INTEGER, db_desv_sq_mlat INTEGER, db_desv_sq_a1 INTEGER, db_desv_sq_a2 INTEGER, db_desv_cq_varr INTEGER, db_desv_cq_r1 INTEGER, db_desv_cq_r2 INTEGER, db_desv_cq_a1 INTEGER, db_desv_cq_a2 INTEGER, 
-                    -- Ext/Voo (7)
-                    db_ext_rec INTEGER, db_ext_desv_1 INTEGER, db_ext_desv_2 INTEGER, db_voo_rec INTEGER, db_voo_desv_1 INTEGER, db_voo_desv_2 INTEGER, db_voo_desv_mc INTEGER, 
-                    -- Espaco (4)
-                    de_cabeca INTEGER, de_carrinho INTEGER, de_alivio INTEGER, de_rececao INTEGER, 
-                    -- Duelos (4)
-                    duelo_parede INTEGER, duelo_abafo INTEGER, duelo_estrela INTEGER, duelo_frontal INTEGER, 
-                    -- Tactica (10)
-                    pa_curto_1 INTEGER, pa_curto_2 INTEGER, pa_longo_1 INTEGER, pa_longo_2 INTEGER, dist_curta_mao INTEGER, dist_longa_mao INTEGER, dist_picada_mao INTEGER, dist_volley INTEGER, dist_curta_pe INTEGER, dist_longa_pe INTEGER, 
-                    -- Cruzamentos (4)
-                    cruz_rec_alta INTEGER, cruz_soco_1 INTEGER, cruz_soco_2 INTEGER, cruz_int_rast INTEGER,
-                    -- ETO (3)
-                    eto_pb_curto INTEGER, eto_pb_medio INTEGER, eto_pb_longo INTEGER
-                    )''')
-    conn.commit()
-    conn.close()
-
-init_db()
+startup()
 
 # ==========================================
-# 2. FUNÇÕES AUXILIARES
-# ==========================================
-def parse_drills(drills_str):
-    if not drills_str: return []
-    try: return json.loads(drills_str)
-    except:
-        titles = drills_str.split(", ")
-        return [{"title": t, "reps": "", "sets": "", "time": ""} for t in titles if t]
-
-class PDF(FPDF):
-    def header(self):
-        self.set_font('Helvetica', 'B', 16)
-        self.cell(0, 10, 'GK MANAGER PRO - FICHA DE TREINO', 0, 1, 'C')
-        self.ln(5)
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('Helvetica', 'I', 8)
-        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
-
-def create_training_pdf(user, session_info, athletes, drills_config, drills_details_df):
-    pdf = PDF()
-    pdf.add_page()
-    pdf.set_font("Helvetica", size=12)
-    pdf.set_fill_color(240, 240, 240)
-    pdf.cell(0, 10, txt=f"Treinador: {user}", ln=1, align='L')
-    pdf.cell(0, 10, txt=f"Data: {session_info['start_date']} | Tipo: {session_info['type']}", ln=1, align='L', fill=True)
-    pdf.cell(0, 10, txt=f"Foco Principal: {session_info['title']}", ln=1, align='L')
-    pdf.ln(5)
-    
-    pdf.set_font("Helvetica", 'B', 14)
-    pdf.cell(0, 10, "Lista de Presencas", ln=1)
-    pdf.set_font("Helvetica", 'B', 10)
-    pdf.cell(80, 10, "Nome do Atleta", 1)
-    pdf.cell(30, 10, "Presenca", 1)
-    pdf.cell(30, 10, "Obs", 1)
-    pdf.ln()
-    pdf.set_font("Helvetica", size=10)
-    if not athletes.empty:
-        for _, row in athletes.iterrows():
-            pdf.cell(80, 10, f"{row['name']} ({row['status']})", 1)
-            pdf.cell(30, 10, "[   ]", 1)
-            pdf.cell(30, 10, "", 1)
-            pdf.ln()
-    else: pdf.cell(0, 10, "Sem atletas registados", 1, 1)
-    pdf.ln(10)
-    
-    pdf.add_page()
-    pdf.set_font("Helvetica", 'B', 16)
-    pdf.cell(0, 10, "Plano de Exercicios", ln=1, align='C')
-    pdf.ln(5)
-    
-    if drills_config:
-        for i, config in enumerate(drills_config):
-            title = config['title']
-            details = drills_details_df[drills_details_df['title'] == title]
-            if not details.empty:
-                row = details.iloc[0]
-                pdf.set_font("Helvetica", 'B', 14)
-                pdf.set_fill_color(230, 230, 250)
-                pdf.cell(0, 10, f"Ex {i+1}: {title}", 1, 1, 'L', fill=True)
-                
-                pdf.set_font("Helvetica", 'B', 10)
-                pdf.set_fill_color(255, 255, 224) 
-                load_text = f"Series: {config.get('sets','-')} | Repeticoes: {config.get('reps','-')} | Tempo: {config.get('time','-')}"
-                pdf.cell(0, 8, load_text, 1, 1, 'L', fill=True)
-                
-                pdf.set_font("Helvetica", size=10)
-                pdf.write(5, f"Momento: {row['moment']} | Tipo: {row['training_type']}")
-                if row['space']: pdf.write(5, f" | Espaco: {row['space']}")
-                pdf.ln(6)
-                if row['objective']: 
-                    pdf.set_font("Helvetica", 'B', 10); pdf.write(5, "Objetivo: ")
-                    pdf.set_font("Helvetica", '', 10); pdf.write(5, f"{row['objective']}"); pdf.ln(6)
-                if row['materials']: 
-                    pdf.set_font("Helvetica", 'B', 10); pdf.write(5, "Material: ")
-                    pdf.set_font("Helvetica", '', 10); pdf.write(5, f"{row['materials']}"); pdf.ln(6)
-                pdf.ln(2)
-                if row['image']:
-                    try:
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as temp_img:
-                            img = Image.open(io.BytesIO(row['image']))
-                            img.save(temp_img.name)
-                            pdf.image(temp_img.name, x=10, w=100)
-                            pdf.ln(5)
-                        os.unlink(temp_img.name)
-                    except: pass
-                pdf.set_font("Helvetica", 'B', 11)
-                pdf.cell(0, 8, "Descricao / Processo:", 0, 1)
-                pdf.set_font("Helvetica", size=10)
-                pdf.multi_cell(0, 6, row['description'])
-                pdf.ln(10)
-                if pdf.get_y() > 240: pdf.add_page()
-    else: pdf.cell(0, 10, "Sem exercicios.", 0, 1)
-    
-    # CORREÇÃO 3: Retornar bytes diretamente (sem encode) para evitar erro do PDF
-    return bytes(pdf.output())
-
-# ==========================================
-# 3. SISTEMA DE LOGIN
+# 2. SISTEMA DE LOGIN
 # ==========================================
 if 'logged_in' not in st.session_state: st.session_state['logged_in'] = False
 if 'username' not in st.session_state: st.session_state['username'] = ''
@@ -197,10 +32,9 @@ def login_page():
         user = st.text_input("Utilizador")
         pwd = st.text_input("Password", type='password')
         if st.button("Entrar"):
-            conn = get_db_connection()
-            c = conn.cursor()
-            c.execute("SELECT * FROM users WHERE username=? AND password=?", (user, make_hashes(pwd)))
-            if c.fetchall():
+            with connection(catalog_path()) as conn:
+                ok = conn.execute("SELECT 1 FROM users WHERE username=? AND password=?", (user, make_hashes(pwd))).fetchone()
+            if ok:
                 st.session_state['logged_in'] = True
                 st.session_state['username'] = user
                 st.rerun()
@@ -209,29 +43,198 @@ def login_page():
         new_u = st.text_input("Novo User")
         new_p = st.text_input("Nova Pass", type='password')
         if st.button("Registar"):
-            conn = get_db_connection()
             try:
-                conn.cursor().execute("INSERT INTO users VALUES (?,?)", (new_u, make_hashes(new_p)))
-                conn.commit()
+                with transaction(catalog_path()) as conn:
+                    conn.execute("INSERT INTO users (username, password) VALUES (?,?)", (new_u, make_hashes(new_p)))
                 st.success("Conta criada!")
-            except: st.warning("Já existe.")
-            conn.close()
+            except sqlite3.IntegrityError: st.warning("Já existe.")
 
 # ==========================================
-# 4. APLICAÇÃO PRINCIPAL
+# 3. APLICAÇÃO PRINCIPAL
 # ==========================================
+def _shift_page(key, delta): st.session_state[key] = st.session_state.get(key, 0) + delta
+
+def paged(key, sig, fetch):
+    # fetch(page) -> SearchPage; a página volta ao início quando a pesquisa/filtros (sig) mudam
+    if st.session_state.get(f"{key}_sig") != sig:
+        st.session_state[key] = 0; st.session_state[f"{key}_sig"] = sig
+    page = max(0, st.session_state.get(key, 0))
+    res = fetch(page)
+    pages = max(1, -(-res.total // res.page_size))
+    if page >= pages:
+        page = st.session_state[key] = pages - 1
+        res = fetch(page)
+    if pages > 1:
+        c1, c2, c3 = st.columns([1, 6, 1])
+        c1.button("◀", key=f"{key}_prev", disabled=page == 0, on_click=_shift_page, args=(key, -1))
+        c2.caption(f"Página {page + 1} de {pages} · {res.total} exercícios")
+        c3.button("▶", key=f"{key}_next", disabled=page >= pages - 1, on_click=_shift_page, args=(key, 1))
+    return res
+
+def exercise_card(user, r, usage):
+    from images import delete_exercise_image, get_thumbnail
+    from cache import invalidate
+    with st.expander(f"[{r['training_type']}] {r['title']}"):
+        c_act, c_img, c_txt = st.columns([1, 2, 4])
+        with c_act:
+            if st.button("✏️", key=f"ed_{r['id']}"): st.session_state['edit_drill_id'] = r['id']; st.rerun()
+            if st.button("🗑️", key=f"dl_{r['id']}"):
+                with transaction() as conn:
+                    conn.execute("DELETE FROM exercises WHERE id=?", (int(r['id']),))
+                    # Sai do catálogo, mas os planos onde foi usado mantêm o título
+                    conn.execute("UPDATE session_drills SET exercise_id=NULL, title=? WHERE exercise_id=?", (r['title'], int(r['id'])))
+                    delete_exercise_image(conn, int(r['id']))
+                invalidate(user, 'exercises', 'exercise_images', 'session_drills')
+                st.rerun()
+        with c_txt:
+            st.write(f"**Obj:** {r['objective']}"); st.write(f"**Mat:** {r['materials']}")
+            st.caption(r['description'])
+            n_used, last_used = usage.get(int(r['id']), (0, None))
+            if n_used: st.caption(f"📊 Usado em {n_used} sessões (última: {last_used})")
+        with c_img:
+            # Miniatura só é lida quando pedida
+            if r['image_hash'] and st.toggle("🖼️", key=f"img_{r['id']}"): st.image(get_thumbnail(r['image_hash']))
+
+# Jogo ao vivo: cada botão acrescenta um evento (um INSERT); os contadores são somados a partir do registo
+LIVE_HEADER_LABELS = {'saves': "🧤 Defesa", 'goals_conceded': "⚽ Golo sofrido"}
+
+def fold_match_events(user, match_id, date):
+    # Soma aos contadores os eventos ainda pendentes (só escreve quando há algum)
+    from queries import pending_match_events, apply_match_events
+    from cache import invalidate
+    from analytics import refresh_match
+    with connection() as conn:
+        if not pending_match_events(conn, match_id): return 0
+    with transaction() as conn: n = apply_match_events(conn.cursor(), match_id)
+    invalidate(user, 'matches', 'match_stats')
+    refresh_match(user, date)
+    return n
+
+def _live_tag(user, date, opponent, metric, delta=1):
+    # Callback dos botões: corre antes do fragmento, fora de main_app, daí o route()
+    from queries import ensure_match, log_match_event
+    from cache import invalidate
+    gk, minute, mid_key = st.session_state.get('live_gk'), st.session_state.get('live_min', 0), f"live_mid_{user}_{date}"
+    with route(user), transaction() as conn:
+        c = conn.cursor()
+        # O evento fica com o guarda-redes da ficha (o seletor pode estar desatualizado noutra sessão)
+        match_id, gk = ensure_match(c, user, date, opponent, gk)
+        log_match_event(c, match_id, minute, metric, gk, delta)
+    invalidate(user, 'matches')
+    st.session_state[mid_key] = match_id
+
+def _live_undo(user, date, target):
+    # Anular = acrescentar o evento contrário (o registo não é alterado)
+    from queries import log_match_event
+    with route(user), transaction() as conn:
+        log_match_event(conn.cursor(), target['match_id'], target['minute'], target['metric'], target['gk_id'], -target['delta'])
+
+@st.fragment
+def live_match_panel(user, date, opponent, names, match_id):
+    # Só este bloco volta a correr a cada ação, não a página inteira (os reruns do fragmento não passam por main_app)
+    import pandas as pd
+    from queries import load_match_events, load_match
+    from metrics import METRIC_CATEGORIES, METRICS_BY_CODE, MATCH_CATEGORIES
+    with route(user):
+        # Um guarda-redes por ficha: escolhido até à primeira ação, depois fixo (trocar só na ficha completa)
+        header, _ = load_match(user, date)
+        locked = header['gk_id'] if header and header['gk_id'] in names else None
+        if locked is not None: st.session_state['live_gk'] = locked
+        c1, c2 = st.columns([3, 1])
+        c1.selectbox("GR", list(names), format_func=names.get, key="live_gk", disabled=locked is not None,
+                     help="O guarda-redes da ficha; para o trocar, usar a ficha completa" if locked is not None else None)
+        c2.number_input("Minuto", 0, 130, key="live_min")
+        hc = st.columns(len(LIVE_HEADER_LABELS))
+        for col, (code, label) in zip(hc, LIVE_HEADER_LABELS.items()):
+            col.button(label, key=f"lv_{code}", on_click=_live_tag, args=(user, date, opponent, code), use_container_width=True)
+        for tab, cat in zip(st.tabs([c.name for c in METRIC_CATEGORIES]), METRIC_CATEGORIES):
+            with tab:
+                metrics = [m for col in cat.columns for m in col]
+                for col, m in zip(st.columns(4) * (len(metrics) // 4 + 1), metrics):
+                    col.button(m.label, key=f"lv_{m.code}", on_click=_live_tag, args=(user, date, opponent, m.code), use_container_width=True)
+
+        match_id = match_id or st.session_state.get(f"live_mid_{user}_{date}")
+        if match_id is None: st.caption("Sem ações registadas neste jogo."); return
+        fold_match_events(user, match_id, date)
+        ev = load_match_events(match_id)
+        if ev.empty: return
+        label = lambda code: LIVE_HEADER_LABELS.get(code) or (METRICS_BY_CODE[code].label if code in METRICS_BY_CODE else code)
+        # Última ação ainda não anulada (cada evento negativo anula o positivo anterior)
+        skip, target = 0, None
+        for e in ev.to_dict('records'):
+            if e['delta'] < 0: skip += 1
+            elif skip: skip -= 1
+            else: target = dict(e, match_id=match_id); break
+        if target:
+            st.button(f"↩️ Anular: {label(target['metric'])} ({target['minute']}')", key="lv_undo", on_click=_live_undo, args=(user, date, target))
+        cat_of = {code: name for name, codes in MATCH_CATEGORIES.items() for code in codes}
+        cat_of.update(LIVE_HEADER_LABELS)
+        timeline = ev.assign(cat=ev['metric'].map(lambda m: cat_of.get(m, m))).pivot_table(
+            index='minute', columns='cat', values='delta', aggfunc='sum', fill_value=0)
+        st.caption("Ações por minuto")
+        st.bar_chart(timeline)
+        with st.expander(f"Registo ({len(ev)} eventos)"):
+            st.dataframe(ev.assign(metric=ev['metric'].map(label), gk_id=ev['gk_id'].map(lambda g: names.get(g, g)))
+                           .rename(columns={'minute': "Min", 'metric': "Ação", 'gk_id': "GR", 'delta': "±", 'created_at': "Registado"})
+                           .drop(columns=['id']), use_container_width=True, hide_index=True)
+
+def job_box(user, key):
+    # Estado do trabalho em segundo plano guardado em session_state[key]; devolve-o quando termina.
+    # Enquanto corre só este bloco é atualizado (fragmento), não a página inteira.
+    from jobs import get_job, ACTIVE
+    job = get_job(user, st.session_state.get(key))
+    if job is None: return None
+    if job.status in ACTIVE:
+        @st.fragment(run_every=1.0)
+        def poll():
+            j = get_job(user, job.id)
+            if j is None or j.status not in ACTIVE: st.rerun()
+            st.progress(j.progress, text=j.message or ("Em espera..." if j.status == 'queued' else "A processar..."))
+        poll()
+        return None
+    if job.status == 'failed': st.error(f"Falhou: {job.error}"); return None
+    return job
+
+def perf_panel(stats):
+    # Painel de debug: medições deste rerun, agregados por página e cache de consultas
+    import pandas as pd
+    from bootstrap import loaded_stacks
+    from cache import query_cache
+    with st.sidebar.expander("⏱️ Desempenho", expanded=True):
+        d = stats.as_dict()
+        st.caption(f"**{d['page']}** · {d['total_ms']:.0f} ms total")
+        st.caption(f"SQL: {d['queries']} queries · {d['sql_ms']:.1f} ms · {d['rows']} linhas · {d['bytes'] / 1024:.1f} KB")
+        if d['pdfs']: st.caption(f"PDF: {d['pdfs']} · {d['pdf_ms']:.0f} ms")
+        for k, v in stats.sections.items(): st.caption(f"{k}: {v * 1000:.0f} ms")
+        qs = query_cache.stats()
+        st.caption(f"Cache: {qs['entries']} entradas · {qs['hits']} hits / {qs['misses']} misses ({qs['hit_rate']:.0%}) · {qs['invalidations']} invalidações")
+        st.caption("Carregado: " + ", ".join(k for k, v in loaded_stacks().items() if v) + f" · arranque {startup()['init_db_ms']:.0f} ms")
+        summ = perf.summary()
+        if summ: st.dataframe(pd.DataFrame(summ).T.round(1), use_container_width=True)
+        if st.button("💾 Guardar em log", key="perf_dump"):
+            st.caption(f"Escrito em {perf.dump(extra={'cache': qs})}")
+
 def main_app():
+    # Dados (pandas) só depois do login; PDF, plantel, análise de jogos, calendário e imagens no ramo de cada página
+    import pandas as pd
+    from queries import load_week, load_session_plan, load_exercise, load_drill_usage, attach_exercise_images, save_session_drills, upsert_training_ratings, save_match, load_calendar_month, refresh_rating_rollups, load_rating_rollups, search_exercises, load_match, load_goalkeeper_names, load_microcycles, load_games, load_day_session, load_day_ratings
+    from metrics import METRIC_CATEGORIES
+    from cache import cached_query, invalidate
+    from jobs import submit as submit_job, job_result
     user = st.session_state['username']
     st.sidebar.title(f"👤 {user}")
     menu = st.sidebar.radio("Navegação", 
-        ["Gestão Semanal", "Relatórios & Avaliações", "Evolução do Atleta", "Centro de Jogo", "Calendário", "Meus Atletas", "Exercícios"])
+        ["Gestão Semanal", "Relatórios & Avaliações", "Evolução do Atleta", "Comparar Plantel", "Centro de Jogo", "Calendário", "Meus Atletas", "Exercícios"], key="menu")
     
     if st.sidebar.button("Sair"):
         st.session_state['logged_in'] = False
         st.rerun()
+    st.sidebar.toggle("🐞 Debug", key="perf_debug")
+    perf.set_page(menu)
 
     # --- 1. GESTÃO SEMANAL ---
     if menu == "Gestão Semanal":
+        from pdf_export import training_pdf_key, cached_training_pdf, pdf_cache
         st.header("📆 Planeamento")
         tab1, tab2 = st.tabs(["1. Criar Semana", "2. Planear Dias"])
         with tab1:
@@ -241,105 +244,120 @@ def main_app():
                 sd = c2.date_input("Início", datetime.today())
                 mg = st.text_area("Objetivo")
                 if st.form_submit_button("Criar Semana"):
-                    conn = get_db_connection()
-                    c = conn.cursor()
-                    c.execute("INSERT INTO microcycles (user_id, title, start_date, goal) VALUES (?,?,?,?)", (user, mt, sd, mg))
-                    conn.commit()
-                    conn.close()
+                    with transaction() as conn:
+                        conn.execute("INSERT INTO microcycles (user_id, title, start_date, goal) VALUES (?,?,?,?)", (user, mt, sd, mg))
+                        # As notas desses 7 dias passam a contar para o microciclo
+                        refresh_rating_rollups(conn.cursor(), user, [sd + timedelta(days=i) for i in range(7)])
+                    invalidate(user, 'microcycles', 'rating_rollups')
                     st.success("Criado!")
         with tab2:
-            conn = get_db_connection()
-            micros = pd.read_sql_query("SELECT * FROM microcycles WHERE user_id = ? ORDER BY start_date DESC", conn, params=(user,))
-            conn.close()
-            if not micros.empty:
-                sel_micro = st.selectbox("Escolher Semana", micros['title'].unique())
-                micro_data = micros[micros['title'] == sel_micro].iloc[0]
-                base_date = datetime.strptime(micro_data['start_date'], '%Y-%m-%d')
-                st.info(f"Objetivo: {micro_data['goal']}")
-                
-                for i in range(7):
-                    curr = base_date + timedelta(days=i)
-                    d_str = curr.strftime("%Y-%m-%d")
-                    d_name = curr.strftime("%A")
-                    
-                    conn_d = get_db_connection()
-                    sess = pd.read_sql_query("SELECT * FROM sessions WHERE user_id=? AND start_date=?", conn_d, params=(user, d_str))
-                    conn_d.close()
+            micros = load_microcycles(user)
+            if micros.rows:
+                sel_micro = st.selectbox("Escolher Semana", list(micros.by))
+                micro_data = micros.by[sel_micro]
+                st.info(f"Objetivo: {micro_data.goal}")
+
+                with st.expander("📦 Exportar Semana / Período"):
+                    w_start = datetime.strptime(micro_data.start_date, "%Y-%m-%d")
+                    c1, c2 = st.columns(2)
+                    ex_range = c1.date_input("Período", (w_start, w_start + timedelta(days=6)), key="exp_range")
+                    ex_mode = c2.radio("Formato", ["ZIP (um PDF por sessão)", "PDF único"], key="exp_mode")
+                    if st.button("Exportar", key="exp_go") and len(ex_range) == 2:
+                        # Gerado em segundo plano; a página continua utilizável
+                        ext = 'zip' if ex_mode.startswith("ZIP") else 'pdf'
+                        st.session_state['export_job'] = submit_job(user, 'training_export', {'start': ex_range[0], 'end': ex_range[1], 'mode': ext})
+                    job = job_box(user, 'export_job')
+                    if job:
+                        timings = job.meta['timings']
+                        if timings: st.dataframe(pd.DataFrame(timings), use_container_width=True)
+                        else: st.info("Sem sessões de treino no período.")
+                        # O ficheiro só é lido ao clicar (não a cada rerun enquanto o trabalho fica na sessão)
+                        if job.result_size:
+                            st.download_button(f"⬇️ Descarregar ({job.result_size / 1024:.0f} KB)", lambda: job_result(user, job.id),
+                                               job.result_name, job.result_mime, key="exp_dl")
+
+                # Uma única leitura para a semana inteira: sessões dos 7 dias, catálogo e plantel
+                week = load_week(user, micro_data.start_date)
+                a_df, ddb = week.roster, week.exercises
+
+                for d_str in week.days:
+                    d_name = datetime.strptime(d_str, "%Y-%m-%d").strftime("%A")
+                    s_data = week.sessions.get(d_str)
                     
                     icon = "⚪"
-                    if not sess.empty:
-                        t = sess.iloc[0]['type']
+                    if s_data is not None:
+                        t = s_data['type']
                         icon = "⚽" if t=="Treino" else ("🔴" if t=="Jogo" else "🟢")
                     
                     with st.expander(f"{icon} {d_name} ({d_str})"):
-                        if not sess.empty and sess.iloc[0]['type'] == 'Treino':
+                        if s_data is not None and s_data['type'] == 'Treino':
                             col_pdf, _ = st.columns([1,3])
                             with col_pdf:
-                                s_data = sess.iloc[0]
-                                drills_config = parse_drills(s_data['drills_list'])
-                                drill_names = [d['title'] for d in drills_config]
-                                if drill_names:
-                                    ph = ','.join('?' for _ in drill_names)
-                                    q = f"SELECT * FROM exercises WHERE user_id=? AND title IN ({ph})"
-                                    p = [user] + drill_names
-                                    conn_pdf = get_db_connection()
-                                    d_df = pd.read_sql_query(q, conn_pdf, params=p)
-                                    a_df = pd.read_sql_query("SELECT name, status FROM goalkeepers WHERE user_id=?", conn_pdf, params=(user,))
-                                    conn_pdf.close()
-                                    try:
-                                        pdf_data = create_training_pdf(user, s_data, a_df, drills_config, d_df)
-                                        st.download_button("📄 PDF do Treino", pdf_data, f"Treino_{d_str}.pdf", "application/pdf")
-                                    except Exception as e: st.error(f"Erro PDF: {e}")
+                                drills_config = week.drills[int(s_data['id'])]
+                                if drills_config:
+                                    d_df = ddb[ddb['id'].isin([d['exercise_id'] for d in drills_config])]
+                                    # PDF só é gerado a pedido; sessões sem alterações reutilizam a cache
+                                    pdf_key = training_pdf_key(user, s_data, a_df, drills_config, d_df)
+                                    pdf_data = pdf_cache.get(pdf_key)
+                                    if pdf_data is None and st.button("📄 Gerar PDF", key=f"gen_pdf_{d_str}"):
+                                        try: pdf_data = cached_training_pdf(pdf_key, user, s_data, a_df, drills_config, attach_exercise_images(d_df))
+                                        except Exception as e: st.error(f"Erro PDF: {e}")
+                                    if pdf_data is not None:
+                                        st.download_button("📄 PDF do Treino", pdf_data, f"Treino_{d_str}.pdf", "application/pdf", key=f"dl_pdf_{d_str}")
 
                         with st.form(f"f_{d_str}"):
-                            prev_t = sess.iloc[0]['type'] if not sess.empty else "Treino"
+                            prev_t = s_data['type'] if s_data is not None else "Treino"
                             opts = ["Treino", "Jogo", "Descanso"]
                             idx = opts.index(prev_t) if prev_t in opts else 0
                             type_d = st.radio("Tipo", opts, index=idx, horizontal=True, key=f"rd_{d_str}")
                             
-                            def_t = sess.iloc[0]['title'] if not sess.empty else ""
-                            current_config = parse_drills(sess.iloc[0]['drills_list']) if not sess.empty else []
-                            current_titles = [d['title'] for d in current_config]
+                            def_t = s_data['title'] if s_data is not None else ""
+                            current_config = week.drills[int(s_data['id'])] if s_data is not None else []
+                            current_ids = [d['exercise_id'] for d in current_config]
                             sess_t = st.text_input("Foco", value=def_t, key=f"tit_{d_str}")
                             
-                            conn_ex = get_db_connection()
-                            ddb = pd.read_sql_query("SELECT title, moment FROM exercises WHERE user_id=?", conn_ex, params=(user,))
-                            conn_ex.close()
-                            
                             st.write("---")
                             st.caption("Selecionar Exercícios por Momento:")
                             moms = ["Defesa de Baliza", "Defesa do Espaço", "Cruzamento", "Duelos", "Distribuição", "Passe Atrasado"]
                             selected_in_tabs = []
                             drill_tabs = st.tabs(moms)
+                            # Opções por id (os títulos só servem para mostrar): mudar o nome não parte o plano
+                            ex_titles = dict(zip(ddb['id'].astype(int), ddb['title']))
                             for k, mom in enumerate(moms):
                                 with drill_tabs[k]:
-                                    options = ddb[ddb['moment'] == mom]['title'].tolist()
-                                    defaults = [t for t in current_titles if t in options]
-                                    sel = st.multiselect(f"Exercícios ({mom})", options, default=defaults, key=f"ms_{d_str}_{mom}")
+                                    options = ddb[ddb['moment'] == mom]['id'].astype(int).tolist()
+                                    defaults = [i for i in current_ids if i in options]
+                                    sel = st.multiselect(f"Exercícios ({mom})", options, default=defaults, format_func=ex_titles.get, key=f"ms_{d_str}_{mom}")
                                     selected_in_tabs.extend(sel)
+                            # Títulos de planos antigos sem exercício no catálogo: não são escolhidos aqui, mas mantêm-se ao guardar
+                            legacy = [d for d in current_config if d['exercise_id'] is None]
+                            if legacy: st.caption(f"Sem ficha no catálogo: {', '.join(d['title'] for d in legacy)}")
                             
                             if selected_in_tabs:
                                 st.markdown("###### Carga:")
                                 new_config = []
-                                for title in selected_in_tabs:
-                                    old_vals = next((item for item in current_config if item["title"] == title), {'reps':'', 'sets':'', 'time':''})
+                                for ex_id in selected_in_tabs:
+                                    old_vals = next((item for item in current_config if item["exercise_id"] == ex_id), {'reps':'', 'sets':'', 'time':''})
                                     c1, c2, c3, c4 = st.columns([2, 1, 1, 1])
-                                    with c1: st.markdown(f"**{title}**")
-                                    with c2: r = st.text_input("Reps", value=old_vals.get('reps',''), key=f"r_{d_str}_{title}")
-                                    with c3: s = st.text_input("Séries", value=old_vals.get('sets',''), key=f"s_{d_str}_{title}")
-                                    with c4: t = st.text_input("Tempo", value=old_vals.get('time',''), key=f"tm_{d_str}_{title}")
-                                    new_config.append({"title": title, "reps": r, "sets": s, "time": t})
+                                    with c1: st.markdown(f"**{ex_titles[ex_id]}**")
+                                    with c2: r = st.text_input("Reps", value=old_vals.get('reps',''), key=f"r_{d_str}_{ex_id}")
+                                    with c3: s = st.text_input("Séries", value=old_vals.get('sets',''), key=f"s_{d_str}_{ex_id}")
+                                    with c4: t = st.text_input("Tempo", value=old_vals.get('time',''), key=f"tm_{d_str}_{ex_id}")
+                                    new_config.append({"exercise_id": ex_id, "reps": r, "sets": s, "time": t})
                             else: new_config = []
                             
                             if st.form_submit_button("Guardar Planeamento"):
-                                drills_json = json.dumps(new_config)
-                                conn_s = get_db_connection()
-                                c = conn_s.cursor()
-                                chk = c.execute("SELECT id FROM sessions WHERE user_id=? AND start_date=?", (user, d_str)).fetchone()
-                                if chk: c.execute("UPDATE sessions SET type=?, title=?, drills_list=? WHERE id=?", (type_d, sess_t, drills_json, chk[0]))
-                                else: c.execute("INSERT INTO sessions (user_id, type, title, start_date, drills_list) VALUES (?,?,?,?,?)", (user, type_d, sess_t, d_str, drills_json))
-                                conn_s.commit()
-                                conn_s.close()
+                                with transaction() as conn:
+                                    c = conn.cursor()
+                                    chk = c.execute("SELECT id FROM sessions WHERE user_id=? AND start_date=?", (user, d_str)).fetchone()
+                                    if chk:
+                                        sid = chk[0]
+                                        c.execute("UPDATE sessions SET type=?, title=?, drills_list=NULL WHERE id=?", (type_d, sess_t, sid))
+                                    else:
+                                        c.execute("INSERT INTO sessions (user_id, type, title, start_date) VALUES (?,?,?,?)", (user, type_d, sess_t, d_str))
+                                        sid = c.lastrowid
+                                    save_session_drills(c, sid, legacy + new_config)
+                                invalidate(user, 'sessions', 'session_drills')
                                 st.success("Guardado")
                                 st.rerun()
             else: st.warning("Cria uma semana.")
@@ -351,224 +369,184 @@ def main_app():
         with tab_dia:
             rep_date = st.date_input("Dia do Treino", datetime.today(), key="main_dp")
             d_str = rep_date.strftime("%Y-%m-%d")
-            conn = get_db_connection()
-            sess = pd.read_sql_query("SELECT * FROM sessions WHERE user_id=? AND start_date=?", conn, params=(user, d_str))
-            gks = pd.read_sql_query("SELECT id, name FROM goalkeepers WHERE user_id=?", conn, params=(user,))
-            existing = pd.read_sql_query("SELECT gk_id, rating, notes FROM training_ratings WHERE user_id=? AND date=?", conn, params=(user, d_str))
-            conn.close()
-            ex_map = {}
-            if not existing.empty:
-                for _, r in existing.iterrows(): ex_map[int(r['gk_id'])] = {'r': r['rating'], 'n': r['notes']}
-            if not sess.empty:
-                s_data = sess.iloc[0]
-                st.info(f"**{s_data['type']}** | {s_data['title']}")
-                drills = parse_drills(s_data['drills_list'])
+            s_data = load_day_session(user, d_str)
+            gks = load_goalkeeper_names(user).rows
+            ex_map = load_day_ratings(user, d_str)
+            if s_data is not None:
+                st.info(f"**{s_data.type}** | {s_data.title}")
+                drills = load_session_plan(user, s_data.id)
                 if drills:
                     txt_list = [f"{d['title']} ({d['sets']}x{d['reps']})" if d['sets'] else d['title'] for d in drills]
                     st.caption(f"📋 Plano: {', '.join(txt_list)}")
                 with st.form("daily_rep"):
                     st.markdown("### Análise da Sessão")
-                    r_txt = st.text_area("Relatório do Treinador", value=s_data['report'] if s_data['report'] else "")
+                    r_txt = st.text_area("Relatório do Treinador", value=s_data.report or "")
                     st.markdown("### Notas Individuais")
                     r_save = {}
                     n_save = {}
-                    if not gks.empty:
-                        for _, gk in gks.iterrows():
-                            gid = int(gk['id'])
-                            d_r = ex_map[gid]['r'] if gid in ex_map else 5
-                            d_n = ex_map[gid]['n'] if gid in ex_map else ""
-                            with st.expander(f"{gk['name']}"):
-                                c1, c2 = st.columns([1,3])
-                                with c1: r_save[gid] = st.slider("Nota", 1, 10, int(d_r), key=f"sl_{gid}_{d_str}")
-                                with c2: n_save[gid] = st.text_input("Obs", value=d_n, key=f"tx_{gid}_{d_str}")
+                    for gk in gks:
+                        gid = gk.id
+                        d_r = ex_map[gid].rating if gid in ex_map else 5
+                        d_n = ex_map[gid].notes if gid in ex_map else ""
+                        with st.expander(f"{gk.name}"):
+                            c1, c2 = st.columns([1,3])
+                            with c1: r_save[gid] = st.slider("Nota", 1, 10, int(d_r), key=f"sl_{gid}_{d_str}")
+                            with c2: n_save[gid] = st.text_input("Obs", value=d_n, key=f"tx_{gid}_{d_str}")
                     if st.form_submit_button("Guardar Relatório e Notas"):
-                        conn = get_db_connection()
-                        c = conn.cursor()
-                        c.execute("UPDATE sessions SET report=? WHERE id=?", (r_txt, int(s_data['id'])))
-                        for gid, val in r_save.items():
-                            c.execute("DELETE FROM training_ratings WHERE user_id=? AND date=? AND gk_id=?", (user, d_str, gid))
-                            c.execute("INSERT INTO training_ratings (user_id, date, gk_id, rating, notes) VALUES (?,?,?,?,?)", (user, d_str, gid, val, n_save[gid]))
-                        conn.commit(); conn.close(); st.success("Guardado!"); st.rerun()
+                        with transaction() as conn:
+                            c = conn.cursor()
+                            c.execute("UPDATE sessions SET report=? WHERE id=?", (r_txt, s_data.id))
+                            upsert_training_ratings(c, user, [(d_str, gid, val, n_save[gid]) for gid, val in r_save.items()])
+                            refresh_rating_rollups(c, user, [d_str])
+                        invalidate(user, 'sessions', 'training_ratings', 'rating_rollups')
+                        st.success("Guardado!"); st.rerun()
             else: st.warning("Sem sessão para este dia.")
+            with st.expander("📥 Importar notas (CSV)"):
+                st.caption("Colunas: date, gk_id ou goalkeeper (nome), rating (1-10), notes. Notas já existentes no mesmo dia são atualizadas.")
+                csv_file = st.file_uploader("Ficheiro CSV", type=['csv'], key="rat_csv")
+                if csv_file and st.button("Importar", key="rat_imp"):
+                    st.session_state['rat_job'] = submit_job(user, 'ratings_import', data=csv_file.getvalue())
+                job = job_box(user, 'rat_job')
+                if job:
+                    errors = job.meta['errors']
+                    if job.meta['imported']: st.success(f"{job.meta['imported']} notas importadas.")
+                    for e in errors[:20]: st.warning(e)
+                    if len(errors) > 20: st.warning(f"... e mais {len(errors) - 20} linhas com erros.")
         with tab_sem:
-            conn = get_db_connection()
-            micros = pd.read_sql_query("SELECT * FROM microcycles WHERE user_id=? ORDER BY start_date DESC", conn, params=(user,))
-            conn.close()
-            if not micros.empty:
-                sel_m = st.selectbox("Escolher Semana", micros['title'].unique())
-                m_data = micros[micros['title'] == sel_m].iloc[0]
-                st.info(f"Objetivo: {m_data['goal']}")
+            micros = load_microcycles(user)
+            if micros.rows:
+                sel_m = st.selectbox("Escolher Semana", list(micros.by))
+                m_data = micros.by[sel_m]
+                st.info(f"Objetivo: {m_data.goal}")
                 with st.form("weekly_rep_form"):
-                    wr = st.text_area("Relatório Semanal", value=m_data['report'] if m_data['report'] else "", height=200)
+                    wr = st.text_area("Relatório Semanal", value=m_data.report or "", height=200)
                     if st.form_submit_button("Guardar Semanal"):
-                        conn = get_db_connection()
-                        conn.cursor().execute("UPDATE microcycles SET report=? WHERE id=?", (wr, int(m_data['id'])))
-                        conn.commit(); conn.close(); st.success("Guardado!"); st.rerun()
+                        with transaction() as conn:
+                            conn.execute("UPDATE microcycles SET report=? WHERE id=?", (wr, m_data.id))
+                        invalidate(user, 'microcycles')
+                        st.success("Guardado!"); st.rerun()
             else: st.warning("Cria semanas primeiro.")
 
     # --- 3. EVOLUÇÃO ---
     elif menu == "Evolução do Atleta":
         st.header("📈 Evolução")
-        conn = get_db_connection()
-        gks = pd.read_sql_query("SELECT id, name FROM goalkeepers WHERE user_id=?", conn, params=(user,))
-        conn.close()
-        if not gks.empty:
-            sel_gk = st.selectbox("Atleta", gks['name'].tolist())
-            gid = int(gks[gks['name']==sel_gk].iloc[0]['id'])
-            conn = get_db_connection()
-            hist = pd.read_sql_query("SELECT date, rating, notes FROM training_ratings WHERE user_id=? AND gk_id=? ORDER BY date ASC", conn, params=(user, gid))
-            conn.close()
-            if not hist.empty:
-                st.line_chart(hist.set_index("date")['rating'])
-                st.dataframe(hist, use_container_width=True)
-                st.metric("Média", f"{hist['rating'].mean():.1f}")
+        gk_names = {g.id: g.name for g in load_goalkeeper_names(user).rows}
+        if gk_names:
+            gid = st.selectbox("Atleta", list(gk_names), format_func=gk_names.get)
+            # Agregados pré-calculados (rating_rollups); o histórico diário só é lido a pedido
+            periods = {"Semana": 'week', "Mês": 'month', "Microciclo": 'micro'}
+            per = st.radio("Agrupar por", list(periods), horizontal=True, key="evo_period")
+            roll = load_rating_rollups(user, gid, periods[per])
+            months = roll if per == "Mês" else load_rating_rollups(user, gid, 'month')
+            if not months.empty:
+                c1, c2, c3 = st.columns(3)
+                c1.metric("Média", f"{(months['avg_rating'] * months['n']).sum() / months['n'].sum():.1f}")
+                c2.metric("Treinos avaliados", int(months['n'].sum()))
+                if not roll.empty:
+                    slope = roll['slope'].iloc[-1]
+                    c3.metric(f"Tendência ({per.lower()} atual)", f"{0 if pd.isna(slope) else slope:+.2f}/dia")
+                    st.line_chart(roll.set_index("period_start")[['avg_rating', 'min_rating', 'max_rating']])
+                    st.dataframe(roll.rename(columns={'period_start': 'Início', 'n': 'Treinos', 'avg_rating': 'Média', 'min_rating': 'Mín',
+                                                      'max_rating': 'Máx', 'slope': 'Tendência/dia'}).round(2), use_container_width=True)
+                else: st.info("Sem notas em microciclos.")
+                if st.toggle("Ver registos diários", key="evo_raw"):
+                    hist = cached_query(user, ('training_ratings',), "SELECT date, rating, notes FROM training_ratings WHERE user_id=? AND gk_id=? ORDER BY date ASC", (user, gid))
+                    st.dataframe(hist, use_container_width=True)
             else: st.info("Sem dados.")
         else: st.warning("Crie atletas.")
 
+    # --- 3b. COMPARAR PLANTEL ---
+    elif menu == "Comparar Plantel":
+        from squad import load_squad
+        st.header("⚖️ Comparar Plantel")
+        sq = load_squad(user)
+        if not sq.values.empty:
+            views = {"Valores": 'values', "Ranking": 'ranks', "Percentis": 'percentiles', "Z-scores": 'zscores'}
+            kind = st.radio("Ver", list(views), horizontal=True, key="sq_view")
+            st.dataframe(sq.table(views[kind]).round(2), use_container_width=True)
+            st.caption("Ranking, percentis e z-scores já orientados: maior é sempre melhor (ex: menos golos sofridos por jogo).")
+            st.subheader("Índice global (média dos z-scores)")
+            st.bar_chart(sq.overall())
+        else: st.warning("Crie atletas.")
+
     # --- 4. CENTRO DE JOGO ---
     elif menu == "Centro de Jogo":
+        from analytics import get_match_analytics, refresh_match, ROLLING_WINDOW
         st.header("🏟️ Ficha de Jogo (Completa)")
-        conn = get_db_connection()
-        games = pd.read_sql_query("SELECT start_date, title FROM sessions WHERE user_id=? AND type='Jogo' ORDER BY start_date DESC", conn, params=(user,))
-        gks = pd.read_sql_query("SELECT id, name FROM goalkeepers WHERE user_id=?", conn, params=(user,))
-        conn.close()
-        if not games.empty:
-            game_opt = [f"{r['start_date']} | {r['title']}" for _, r in games.iterrows()]
-            sel_game = st.selectbox("Jogo", game_opt)
-            sel_date = sel_game.split(" | ")[0]
-            sel_opp = sel_game.split(" | ")[1]
+        games = load_games(user)
+        gk_names = {g.id: g.name for g in load_goalkeeper_names(user).rows}
+        if games.rows:
+            sel_date = st.selectbox("Jogo", list(games.by), format_func=lambda d: f"{d} | {games.by[d].title}")
+            sel_opp = games.by[sel_date].title
             st.markdown("---")
-            with st.form("match_stats"):
-                # Header
-                c1, c2, c3, c4, c5 = st.columns(5)
-                gk = c1.selectbox("GR", gks['name'].tolist() if not gks.empty else [])
-                rt = c2.slider("Nota", 1, 10, 5)
-                res = c3.text_input("Resultado")
-                gls = c4.number_input("Golos Sofridos", 0, 20)
-                svs = c5.number_input("Defesas", 0, 50)
-
-                with st.expander("🧱 1. DEFESA DE BALIZA: BLOQUEIOS"):
-                    b1, b2 = st.columns(2)
-                    with b1:
-                        bloq_sq_r = st.number_input("Rasteiro (SQ)", 0, 20, key="b1")
-                        bloq_sq_m = st.number_input("Médio (SQ)", 0, 20, key="b2")
-                        bloq_sq_a = st.number_input("Alto (SQ)", 0, 20, key="b3")
-                    with b2:
-                        bloq_cq_r = st.number_input("Rasteiro (CQ)", 0, 20, key="b4")
-                        bloq_cq_m = st.number_input("Médio (CQ)", 0, 20, key="b5")
-                        bloq_cq_a = st.number_input("Alto (CQ)", 0, 20, key="b6")
-
-                with st.expander("👐 2. DEFESA DE BALIZA: RECEÇÕES"):
-                    r1, r2 = st.columns(2)
-                    with r1:
-                        rec_sq_m = st.number_input("Médio (SQ)", 0, 20, key="r1")
-                        rec_sq_a = st.number_input("Alto (SQ)", 0, 20, key="r2")
-                    with r2:
-                        rec_cq_r = st.number_input("Rasteiro (CQ)", 0, 20, key="r3")
-                        rec_cq_m = st.number_input("Médio (CQ)", 0, 20, key="r4")
-                        rec_cq_a = st.number_input("Alto (CQ)", 0, 20, key="r5")
-                        rec_cq_v = st.number_input("Varrimento", 0, 20, key="r6")
-
-                with st.expander("🧤 3. DEFESA DE BALIZA: DESVIOS"):
-                    d1, d2 = st.columns(2)
-                    with d1:
-                        desv_sq_p = st.number_input("Pé", 0, 20, key="d1")
-                        desv_sq_mf = st.number_input("Médio Frontal", 0, 20, key="d2")
-                        desv_sq_ml = st.number_input("Médio Lateral", 0, 20, key="d3")
-                        desv_sq_a1 = st.number_input("Alto 1 Mão", 0, 20, key="d4")
-                        desv_sq_a2 = st.number_input("Alto 2 Mãos", 0, 20, key="d5")
-                    with d2:
-                        desv_cq_v = st.number_input("Varrimento", 0, 20, key="d6")
-                        desv_cq_r1 = st.number_input("Rasteiro 1 Mão", 0, 20, key="d7")
-                        desv_cq_r2 = st.number_input("Rasteiro 2 Mãos", 0, 20, key="d8")
-                        desv_cq_a1 = st.number_input("Alto 1 Mão (CQ)", 0, 20, key="d9")
-                        desv_cq_a2 = st.number_input("Alto 2 Mãos (CQ)", 0, 20, key="d10")
-
-                with st.expander("✈️ 4. DEFESA DE BALIZA: EXTENSÃO E VOO"):
-                    e1, e2 = st.columns(2)
-                    with e1:
-                        ext_rec = st.number_input("Ext. Receção", 0, 20, key="e1")
-                        ext_d1 = st.number_input("Ext. Desvio 1", 0, 20, key="e2")
-                        ext_d2 = st.number_input("Ext. Desvio 2", 0, 20, key="e3")
-                    with e2:
-                        voo_rec = st.number_input("Voo Receção", 0, 20, key="v1")
-                        voo_d1 = st.number_input("Voo Desvio 1", 0, 20, key="v2")
-                        voo_d2 = st.number_input("Voo Desvio 2", 0, 20, key="v3")
-                        voo_dmc = st.number_input("Voo Mão Contrária", 0, 20, key="v4")
-
-                with st.expander("🚀 5. DEFESA DO ESPAÇO"):
-                    de_cab = st.number_input("Cabeceamento", 0, 20)
-                    de_car = st.number_input("Carrinho", 0, 20)
-                    de_ali = st.number_input("Alívio", 0, 20)
-                    de_rec = st.number_input("Receção", 0, 20)
-
-                with st.expander("⚔️ 6. DUELOS (1x1)"):
-                    du_par = st.number_input("Parede", 0, 20)
-                    du_aba = st.number_input("Abafo", 0, 20)
-                    du_est = st.number_input("Estrela", 0, 20)
-                    du_fro = st.number_input("Frontal", 0, 20)
-
-                with st.expander("🎯 7. DISTRIBUIÇÃO (TÁTICA)"):
-                    pa_c1 = st.number_input("Passe Curto 1T", 0, 50)
-                    pa_c2 = st.number_input("Passe Curto 2T", 0, 50)
-                    pa_l1 = st.number_input("Passe Longo 1T", 0, 50)
-                    pa_l2 = st.number_input("Passe Longo 2T", 0, 50)
-                    di_cm = st.number_input("Mão Curta", 0, 50)
-                    di_lm = st.number_input("Mão Longa", 0, 50)
-                    di_pm = st.number_input("Mão Picada", 0, 50)
-                    di_vo = st.number_input("Volley", 0, 50)
-                    di_cp = st.number_input("Pé Curta", 0, 50)
-                    di_lp = st.number_input("Pé Longa", 0, 50)
-
-                with st.expander("⚽ 8. ESQUEMAS TÁTICOS OFENSIVOS"):
-                    eto_pb_curto = st.number_input("Pontapé Baliza Curto", 0, 50)
-                    eto_pb_medio = st.number_input("Pontapé Baliza Meia Distância", 0, 50)
-                    eto_pb_longo = st.number_input("Pontapé Baliza Longo", 0, 50)
-
-                with st.expander("🥅 9. CRUZAMENTOS"):
-                    cr_rec = st.number_input("Cruz. Receção", 0, 50)
-                    cr_s1 = st.number_input("Cruz. Soco 1", 0, 50)
-                    cr_s2 = st.number_input("Cruz. Soco 2", 0, 50)
-                    cr_int = st.number_input("Cruz. Interceção", 0, 50)
-
-                rep = st.text_area("Relatório Final")
+            # Eventos ao vivo por somar (ex: sessão interrompida) entram nos contadores antes de mostrar a ficha
+            header, cur = load_match(user, sel_date)
+            if header and fold_match_events(user, header['id'], sel_date): header, cur = load_match(user, sel_date)
+            header = header or {}
+            mode = st.radio("Modo", ["📝 Ficha completa", "🔴 Ao vivo"], horizontal=True, key="match_mode")
+            if mode == "🔴 Ao vivo":
+                if not gk_names: st.warning("Cria atletas primeiro.")
+                else: live_match_panel(user, sel_date, sel_opp, gk_names, header.get('id'))
+            else:
+                with st.form("match_stats"):
+                    # Header (com os valores já guardados para este jogo)
+                    c1, c2, c3, c4, c5 = st.columns(5)
+                    gk_list = list(gk_names)
+                    gk = c1.selectbox("GR", gk_list, index=gk_list.index(header['gk_id']) if header.get('gk_id') in gk_names else 0, format_func=gk_names.get)
+                    rt = c2.slider("Nota", 1, 10, int(header.get('rating') or 5))
+                    res = c3.text_input("Resultado", value=header.get('result') or "")
+                    gls = c4.number_input("Golos Sofridos", 0, max(20, int(header.get('goals_conceded') or 0)), int(header.get('goals_conceded') or 0))
+                    svs = c5.number_input("Defesas", 0, max(50, int(header.get('saves') or 0)), int(header.get('saves') or 0))
+
+                    # Contadores gerados a partir do registo de métricas (metrics.py)
+                    stats = {}
+                    for cat in METRIC_CATEGORIES:
+                        with st.expander(cat.header):
+                            for col, metrics in zip(st.columns(len(cat.columns)), cat.columns):
+                                with col:
+                                    for m in metrics:
+                                        v = int(cur.get(m.code, 0))
+                                        stats[m.code] = st.number_input(m.label, 0, max(m.max_value, v), v, key=f"{m.key}_{sel_date}")
+
+                    rep = st.text_area("Relatório Final", value=header.get('report') or "")
                 
-                if st.form_submit_button("Guardar Ficha de Jogo"):
-                    conn = get_db_connection()
-                    gid = int(gks[gks['name']==gk].iloc[0]['id']) if not gks.empty else 0
-                    c = conn.cursor()
-                    c.execute("DELETE FROM matches WHERE user_id=? AND date=?", (user, sel_date))
-                    
-                    # CORREÇÃO CRÍTICA DO ERRO SQL (Lista explícita para evitar mismatch)
-                    # Geração dinâmica dos ? para não falhar
-                    vals = (
-                        user, sel_date, sel_opp, gid, gls, svs, res, rep, rt, # 9
-                        bloq_sq_r, bloq_sq_m, bloq_sq_a, bloq_cq_r, bloq_cq_m, bloq_cq_a, # 6
-                        rec_sq_m, rec_sq_a, rec_cq_r, rec_cq_m, rec_cq_a, rec_cq_v, # 6
-                        desv_sq_p, desv_sq_mf, desv_sq_ml, desv_sq_a1, desv_sq_a2, # 5
-                        desv_cq_v, desv_cq_r1, desv_cq_r2, desv_cq_a1, desv_cq_a2, # 5
-                        ext_rec, ext_d1, ext_d2, voo_rec, voo_d1, voo_d2, voo_dmc, # 7
-                        de_cab, de_car, de_ali, de_rec, # 4
-                        du_par, du_aba, du_est, du_fro, # 4
-                        pa_c1, pa_c2, pa_l1, pa_l2, di_cm, di_lm, di_pm, di_vo, di_cp, di_lp, # 10
-                        cr_rec, cr_s1, cr_s2, cr_int, # 4
-                        eto_pb_curto, eto_pb_medio, eto_pb_longo # 3
-                    )
-                    
-                    placeholders = ",".join(["?"] * len(vals))
-                    
-                    c.execute(f'''INSERT INTO matches VALUES (NULL, {placeholders})''', vals)
-                    conn.commit(); conn.close(); st.success("Ficha Guardada com Sucesso!")
-                    st.rerun()
+                    if st.form_submit_button("Guardar Ficha de Jogo"):
+                        header = {'opponent': sel_opp, 'gk_id': gk or 0, 'goals_conceded': gls, 'saves': svs, 'result': res, 'report': rep, 'rating': rt}
+                        with transaction() as conn:
+                            save_match(conn.cursor(), user, sel_date, header, stats)
+                        invalidate(user, 'matches', 'match_stats')
+                        refresh_match(user, sel_date)
+                        st.success("Ficha Guardada com Sucesso!")
+                        st.rerun()
             
             # --- HISTÓRICO VISÍVEL (NOVO) ---
             st.markdown("---")
             st.subheader("Histórico de Jogos Guardados")
-            conn = get_db_connection()
-            hist = pd.read_sql_query("SELECT date, opponent, result, rating, goals_conceded FROM matches WHERE user_id=? ORDER BY date DESC", conn, params=(user,))
-            conn.close()
+            hist = cached_query(user, ('matches',), "SELECT date, opponent, result, rating, goals_conceded FROM matches WHERE user_id=? ORDER BY date DESC", (user,))
             if not hist.empty:
                 st.dataframe(hist, use_container_width=True)
+
+                # --- ANÁLISE (agregados em cache, atualizados a cada ficha guardada) ---
+                st.markdown("---")
+                st.subheader("📊 Análise")
+                an = get_match_analytics(user)
+                tab_gk, tab_cat, tab_roll, tab_ep = st.tabs(["Por Guarda-Redes", "Categorias", "Médias Móveis", "Épocas"])
+                with tab_gk:
+                    st.dataframe(an.per_goalkeeper().rename(index=gk_names).round(2), use_container_width=True)
+                with tab_cat:
+                    cat = an.category_totals().rename(index=gk_names)
+                    st.bar_chart(cat.T)
+                    st.dataframe(cat, use_container_width=True)
+                with tab_roll:
+                    gk_opts = [g for g in an.gk_sums.index if g in gk_names] or list(an.gk_sums.index)
+                    r_gk = st.selectbox("GR", gk_opts, format_func=lambda g: gk_names.get(g, str(g)), key="an_gk")
+                    if r_gk is not None:
+                        st.caption(f"Média móvel dos últimos {ROLLING_WINDOW} jogos")
+                        st.line_chart(an.rolling(r_gk)[["rating", "goals_conceded", "saves"]])
+                with tab_ep:
+                    seasons = an.season_splits().reset_index()
+                    seasons['gk_id'] = seasons['gk_id'].map(lambda g: gk_names.get(g, str(g)))
+                    st.dataframe(seasons.rename(columns={'gk_id': 'GR', 'season': 'Época'}).round(2), use_container_width=True)
             else:
                 st.info("Ainda sem jogos registados.")
 
@@ -576,25 +554,25 @@ def main_app():
 
     # --- 5. CALENDÁRIO ---
     elif menu == "Calendário":
+        from streamlit_calendar import calendar
         st.header("📅 Calendário")
-        conn = get_db_connection()
-        sess = pd.read_sql_query("SELECT type, title, start_date FROM sessions WHERE user_id=?", conn, params=(user,))
-        conn.close()
-        evs = []
-        for _, r in sess.iterrows():
-            c = "#3788d8"
-            if r['type']=="Jogo": c="#d9534f"
-            elif r['type']=="Descanso": c="#28a745"
-            evs.append({"title": r['title'], "start": r['start_date'], "end": r['start_date'], "backgroundColor": c})
-        calendar(events=evs, options={"initialView": "dayGridMonth"})
+        # Navegação feita aqui: o calendário só recebe os eventos do mês visível
+        if 'cal_month' not in st.session_state: st.session_state['cal_month'] = datetime.today().date().replace(day=1)
+        cm = st.session_state['cal_month']
+        c1, c2, c3, _ = st.columns([1, 1, 1, 5])
+        if c1.button("◀", key="cal_prev"): cm = (cm - timedelta(days=1)).replace(day=1)
+        if c2.button("Hoje", key="cal_today"): cm = datetime.today().date().replace(day=1)
+        if c3.button("▶", key="cal_next"): cm = (cm + timedelta(days=31)).replace(day=1)
+        st.session_state['cal_month'] = cm
+        evs = load_calendar_month(user, cm.year, cm.month)
+        calendar(events=evs, options={"initialView": "dayGridMonth", "initialDate": cm.isoformat(),
+                                      "headerToolbar": {"left": "", "center": "title", "right": ""}}, key=f"cal_{cm:%Y_%m}")
 
     # --- 6. ATLETAS ---
     elif menu == "Meus Atletas":
         st.header("📋 Plantel")
         mode = st.radio("Opções", ["Novo", "Editar", "Eliminar"], horizontal=True)
-        conn = get_db_connection()
-        all_gks = pd.read_sql_query("SELECT * FROM goalkeepers WHERE user_id=?", conn, params=(user,))
-        conn.close()
+        all_gks = cached_query(user, ('goalkeepers',), "SELECT * FROM goalkeepers WHERE user_id=?", (user,))
         
         d_n, d_a, d_s = "", 18, "Apto"
         d_h, d_w, d_al, d_ar, d_gl = 0.0, 0.0, 0.0, 0.0, ""
@@ -614,9 +592,10 @@ def main_app():
             
         if mode=="Eliminar" and e_id:
             if st.button("🗑️ Eliminar"):
-                conn = get_db_connection()
-                conn.cursor().execute("DELETE FROM goalkeepers WHERE id=?", (e_id,))
-                conn.commit(); conn.close(); st.success("Apagado"); st.rerun()
+                with transaction() as conn:
+                    conn.execute("DELETE FROM goalkeepers WHERE id=?", (e_id,))
+                invalidate(user, 'goalkeepers')
+                st.success("Apagado"); st.rerun()
         
         elif mode!="Eliminar":
             with st.form("gk_form"):
@@ -647,28 +626,28 @@ def main_app():
                 tv=t3.text_input("Velocidade", value=d_tv)
                 
                 if st.form_submit_button("Guardar"):
-                    conn = get_db_connection()
-                    c = conn.cursor()
-                    if mode=="Novo":
-                        c.execute('''INSERT INTO goalkeepers (user_id, name, age, status, height, wingspan, arm_len_left, arm_len_right, glove_size, jump_front_2, jump_front_l, jump_front_r, jump_lat_l, jump_lat_r, test_res, test_agil, test_vel) VALUES (?,?,?,?, ?,?,?,?,?, ?,?,?,?,?, ?,?,?)''', 
-                                  (user, nm, ag, stt, ht, ws, al, ar, gl, jf2, jfl, jfr, jll, jlr, tr, ta, tv))
-                    elif e_id:
-                        c.execute('''UPDATE goalkeepers SET name=?, age=?, status=?, height=?, wingspan=?, arm_len_left=?, arm_len_right=?, glove_size=?, jump_front_2=?, jump_front_l=?, jump_front_r=?, jump_lat_l=?, jump_lat_r=?, test_res=?, test_agil=?, test_vel=? WHERE id=?''', 
-                                  (nm, ag, stt, ht, ws, al, ar, gl, jf2, jfl, jfr, jll, jlr, tr, ta, tv, e_id))
-                    conn.commit(); conn.close(); st.success("Guardado"); st.rerun()
+                    with transaction() as conn:
+                        c = conn.cursor()
+                        if mode=="Novo":
+                            c.execute('''INSERT INTO goalkeepers (user_id, name, age, status, height, wingspan, arm_len_left, arm_len_right, glove_size, jump_front_2, jump_front_l, jump_front_r, jump_lat_l, jump_lat_r, test_res, test_agil, test_vel) VALUES (?,?,?,?, ?,?,?,?,?, ?,?,?,?,?, ?,?,?)''', 
+                                      (user, nm, ag, stt, ht, ws, al, ar, gl, jf2, jfl, jfr, jll, jlr, tr, ta, tv))
+                        elif e_id:
+                            c.execute('''UPDATE goalkeepers SET name=?, age=?, status=?, height=?, wingspan=?, arm_len_left=?, arm_len_right=?, glove_size=?, jump_front_2=?, jump_front_l=?, jump_front_r=?, jump_lat_l=?, jump_lat_r=?, test_res=?, test_agil=?, test_vel=? WHERE id=?''', 
+                                      (nm, ag, stt, ht, ws, al, ar, gl, jf2, jfl, jfr, jll, jlr, tr, ta, tv, e_id))
+                    invalidate(user, 'goalkeepers')
+                    st.success("Guardado"); st.rerun()
         if not all_gks.empty: st.dataframe(all_gks.drop(columns=['user_id', 'notes']), use_container_width=True)
 
     # --- 7. EXERCÍCIOS ---
     elif menu == "Exercícios":
+        from images import store_exercise_image
         st.header("⚽ Biblioteca Técnica")
         if 'edit_drill_id' not in st.session_state: st.session_state['edit_drill_id'] = None
-        conn = get_db_connection()
-        all_ex = pd.read_sql_query("SELECT * FROM exercises WHERE user_id=?", conn, params=(user,))
-        conn.close()
+        usage = load_drill_usage(user)
         
         d_tit, d_mom, d_typ, d_desc, d_obj, d_mat, d_spa = "", "Defesa de Baliza", "Técnico", "", "", "", ""
-        if st.session_state['edit_drill_id'] and not all_ex.empty:
-            edit_row = all_ex[all_ex['id'] == st.session_state['edit_drill_id']].iloc[0]
+        edit_row = load_exercise(user, st.session_state['edit_drill_id']) if st.session_state['edit_drill_id'] else None
+        if edit_row is not None:
             d_tit = edit_row['title']; d_mom = edit_row['moment']; d_typ = edit_row['training_type']
             d_desc = edit_row['description']; d_obj = edit_row['objective'] if edit_row['objective'] else ""
             d_mat = edit_row['materials'] if edit_row['materials'] else ""; d_spa = edit_row['space'] if edit_row['space'] else ""
@@ -692,47 +671,52 @@ def main_app():
             
             if st.form_submit_button("Guardar"):
                 b_img = img.read() if img else None
-                conn = get_db_connection()
-                c = conn.cursor()
-                if not st.session_state['edit_drill_id']:
-                    c.execute('''INSERT INTO exercises (user_id, title, moment, training_type, description, objective, materials, space, image) 
-                                 VALUES (?,?,?,?,?,?,?,?,?)''', (user, title, moment, train_type, desc, objective, materials, space, b_img))
-                    st.success("Criado!")
+                try:
+                    with transaction() as conn:
+                        c = conn.cursor()
+                        if not st.session_state['edit_drill_id']:
+                            c.execute('''INSERT INTO exercises (user_id, title, moment, training_type, description, objective, materials, space) 
+                                         VALUES (?,?,?,?,?,?,?,?)''', (user, title, moment, train_type, desc, objective, materials, space))
+                            eid = c.lastrowid
+                        else:
+                            eid = int(st.session_state['edit_drill_id'])
+                            c.execute('''UPDATE exercises SET title=?, moment=?, training_type=?, description=?, objective=?, materials=?, space=? WHERE id=?''', (title, moment, train_type, desc, objective, materials, space, eid))
+                        # Imagem normalizada e com miniatura, na mesma transação
+                        if b_img: store_exercise_image(c, eid, b_img)
+                except Exception as e: st.error(f"Erro ao guardar: {e}")
                 else:
-                    eid = st.session_state['edit_drill_id']
-                    if b_img: c.execute('''UPDATE exercises SET title=?, moment=?, training_type=?, description=?, objective=?, materials=?, space=?, image=? WHERE id=?''', (title, moment, train_type, desc, objective, materials, space, b_img, eid))
-                    else: c.execute('''UPDATE exercises SET title=?, moment=?, training_type=?, description=?, objective=?, materials=?, space=? WHERE id=?''', (title, moment, train_type, desc, objective, materials, space, eid))
-                    st.success("Atualizado!")
-                    st.session_state['edit_drill_id'] = None
-                conn.commit(); conn.close(); st.rerun()
+                    invalidate(user, 'exercises', 'exercise_images')
+                    if not st.session_state['edit_drill_id']: st.success("Criado!")
+                    else:
+                        st.success("Atualizado!")
+                        st.session_state['edit_drill_id'] = None
+                    st.rerun()
 
         st.markdown("---")
         st.subheader("Catálogo")
-        tabs = st.tabs(moms)
-        if not all_ex.empty:
-            for i, mom in enumerate(moms):
-                with tabs[i]:
-                    filt = all_ex[all_ex['moment'] == mom]
-                    if not filt.empty:
-                        for _, r in filt.iterrows():
-                            with st.expander(f"[{r['training_type']}] {r['title']}"):
-                                c_act, c_img, c_txt = st.columns([1, 2, 4])
-                                with c_act:
-                                    if st.button("✏️", key=f"ed_{r['id']}"): st.session_state['edit_drill_id'] = r['id']; st.rerun()
-                                    if st.button("🗑️", key=f"dl_{r['id']}"):
-                                        conn = get_db_connection()
-                                        conn.cursor().execute("DELETE FROM exercises WHERE id=?", (r['id'],))
-                                        conn.commit(); conn.close(); st.rerun()
-                                with c_txt:
-                                    st.write(f"**Obj:** {r['objective']}"); st.write(f"**Mat:** {r['materials']}")
-                                    st.caption(r['description'])
-                                with c_img:
-                                    if r['image']: st.image(r['image'])
-                    else: st.info("Vazio.")
+        s1, s2, s3, s4 = st.columns([3, 1, 1, 1])
+        q = s1.text_input("🔎 Pesquisar", key="ex_q", placeholder="título, descrição, objetivo, material, espaço")
+        f_mom = s2.selectbox("Momento", ["Todos"] + moms, key="ex_f_mom")
+        f_typ = s3.selectbox("Tipo", ["Todos"] + typs, key="ex_f_typ")
+        page_size = s4.selectbox("Por página", [10, 20, 50], index=1, key="ex_page_size")
+        f_mom, f_typ = (None if f_mom == "Todos" else f_mom), (None if f_typ == "Todos" else f_typ)
+        if q.strip() or f_mom or f_typ:
+            # Pesquisa no índice FTS5, ordenada por relevância e paginada na base de dados
+            res = paged("ex_search_pg", (q, f_mom, f_typ, page_size), lambda p: search_exercises(user, q, f_mom, f_typ, page=p, page_size=page_size))
+            for _, r in res.rows.iterrows(): exercise_card(user, r, usage)
+            if res.rows.empty: st.info("Sem resultados.")
         else:
-            for t in tabs: t.info("Vazio.")
+            # Cada separador lê e desenha só a sua página (LIMIT/OFFSET na base de dados)
+            for i, (mom, tab) in enumerate(zip(moms, st.tabs(moms))):
+                with tab:
+                    res = paged(f"ex_pg_{i}", page_size, lambda p: search_exercises(user, "", mom, page=p, page_size=page_size))
+                    for _, r in res.rows.iterrows(): exercise_card(user, r, usage)
+                    if res.rows.empty: st.info("Vazio.")
 
 if st.session_state['logged_in']:
-    main_app()
+    # Sem o toggle de debug (ou GK_PERF=1) não há medições; as consultas do rerun vão para o ficheiro do utilizador
+    with route(st.session_state['username']), perf.rerun(st.session_state.get('perf_debug', False)) as stats:
+        main_app()
+    if stats is not None: perf_panel(stats)
 else:
     login_page()
\ No newline at end of file
@@ -0,0 +1,325 @@
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+
+# ==========================================
+# BENCHMARKS DOS CAMINHOS DE DADOS
+# ==========================================
+# Gera uma base de dados sintética (vários treinadores, épocas de microciclos, sessões com plano,
+# notas, fichas de jogo completas, exercícios com imagens) e mede as funções reais da app sobre ela.
+# Uso:
+#   python bench.py                       -> gera bench_scratch.db e compara com bench_baseline.json
+#   python bench.py --save-baseline       -> grava os tempos atuais como referência
+#   python bench.py --reuse --repeat 10   -> reutiliza a base já gerada
+#   python bench.py --reuse --startup     -> arranque a frio: página de login e 1.º render de cada página
+# Sai com código 1 se algum caminho ficar mais lento do que a referência além da tolerância, e com
+# código 2 se faltar a referência de algum caminho. Os tempos dependem da máquina: a referência não
+# vem no repositório, grava-se uma vez em cada máquina com --save-baseline.
+BENCH_DB = 'bench_scratch.db'
+BENCH_BASELINE = 'bench_baseline.json'
+BENCH_TOLERANCE = 0.25
+BENCH_MIN_DELTA_MS = 2.0
+STARTUP_REPEAT = 3
+
+MOMENTS = ["Defesa de Baliza", "Defesa do Espaço", "Cruzamento", "Duelos", "Distribuição", "Passe Atrasado"]
+TYPES = ["Técnico", "Tático", "Técnico-Tático", "Físico", "Psicológico"]
+WORDS = ("bola alta baixa receção desvio queda lateral frontal voo extensão reação apoio cruzamento saída "
+         "passe curto longo pé mão controlo orientação espaço duelo abafo bloqueio posição").split()
+
+# ==========================================
+# GERADOR DE DADOS SINTÉTICOS
+# ==========================================
+def _text(rng, n): return " ".join(rng.choice(WORDS) for _ in range(n))
+
+def _images(n, rng):
+    from PIL import Image, ImageDraw
+    from images import normalize_image
+    out = []
+    for i in range(n):
+        img = Image.new('RGB', (1200, 800), (40, 120 + i % 100, 40))
+        draw = ImageDraw.Draw(img)
+        for _ in range(30):
+            x, y = rng.randrange(1200), rng.randrange(800)
+            draw.ellipse((x, y, x + 40, y + 40), fill=(255, 255, 255))
+        buf = io.BytesIO(); img.save(buf, 'JPEG', quality=90)
+        out.append(normalize_image(buf.getvalue()))
+    return out
+
+def generate(coaches=5, goalkeepers=6, seasons=3, exercises=150, images=20, seed=42):
+    from db import connection, transaction
+    from metrics import METRIC_COLUMNS
+    from queries import save_session_drills, save_match, refresh_rating_rollups
+    rng = random.Random(seed)
+    imgs = _images(images, rng)
+    first = date(date.today().year - seasons, 7, 1)
+    days = seasons * 365
+    counts = dict.fromkeys(['sessions', 'ratings', 'matches', 'exercises'], 0)
+    for ci in range(coaches):
+        user = f"coach{ci:02d}"
+        with transaction() as conn:
+            c = conn.cursor()
+            c.execute("INSERT OR IGNORE INTO users VALUES (?, 'x')", (user,))
+            gks = []
+            for g in range(goalkeepers):
+                c.execute('''INSERT INTO goalkeepers (user_id, name, age, status, height, wingspan, arm_len_left, arm_len_right, glove_size,
+                             jump_front_2, jump_front_l, jump_front_r, jump_lat_l, jump_lat_r, test_res, test_agil, test_vel)
+                             VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)''',
+                          (user, f"GR {ci}-{g}", rng.randint(15, 35), "Apto", rng.uniform(175, 200), rng.uniform(180, 210),
+                           rng.uniform(60, 80), rng.uniform(60, 80), str(rng.randint(8, 11)), rng.uniform(40, 70), rng.uniform(30, 55),
+                           rng.uniform(30, 55), rng.uniform(150, 250), rng.uniform(150, 250), str(rng.randint(10, 20)),
+                           f"{rng.uniform(9, 13):.2f}", f"{rng.uniform(2.5, 4):.2f}"))
+                gks.append(c.lastrowid)
+            ex_ids = []
+            for e in range(exercises):
+                c.execute('''INSERT INTO exercises (user_id, title, moment, training_type, description, objective, materials, space)
+                             VALUES (?,?,?,?,?,?,?,?)''', (user, f"{_text(rng, 3).capitalize()} {e}", rng.choice(MOMENTS), rng.choice(TYPES),
+                                                           _text(rng, 40), _text(rng, 8), _text(rng, 5), _text(rng, 3)))
+                ex_ids.append(c.lastrowid)
+            c.executemany('''INSERT INTO exercise_images (exercise_id, content_hash, mime, width, height, original, thumbnail, print_rendition)
+                             VALUES (?,?,?,?,?,?,?,?)''', [(eid, n['content_hash'], n['mime'], n['width'], n['height'], n['original'], n['thumbnail'],
+                                                           n['print_rendition']) for eid in ex_ids if rng.random() < 0.6 for n in [rng.choice(imgs)]])
+            counts['exercises'] += len(ex_ids)
+            c.executemany("INSERT INTO microcycles (user_id, title, start_date, goal) VALUES (?,?,?,?)",
+                          [(user, f"Semana {w + 1}", (first + timedelta(weeks=w)).isoformat(), _text(rng, 6)) for w in range(days // 7)])
+            ratings = []
+            for d in range(days):
+                day = (first + timedelta(days=d)).isoformat()
+                wd = (first + timedelta(days=d)).weekday()
+                if wd == 6:
+                    # Jogo ao domingo, com as ~60 métricas da ficha preenchidas
+                    c.execute("INSERT INTO sessions (user_id, type, title, start_date) VALUES (?,?,?,?)", (user, "Jogo", f"Adversário {d % 30}", day))
+                    header = {'opponent': f"Adversário {d % 30}", 'gk_id': rng.choice(gks), 'goals_conceded': rng.randint(0, 4),
+                              'saves': rng.randint(0, 10), 'result': f"{rng.randint(0, 4)}-{rng.randint(0, 4)}", 'report': _text(rng, 20),
+                              'rating': rng.randint(3, 10)}
+                    save_match(c, user, day, header, {m: rng.randint(0, 5) for m in METRIC_COLUMNS})
+                    counts['matches'] += 1
+                elif wd == 0: c.execute("INSERT INTO sessions (user_id, type, title, start_date) VALUES (?,?,?,?)", (user, "Descanso", "Folga", day))
+                else:
+                    c.execute("INSERT INTO sessions (user_id, type, title, start_date, report) VALUES (?,?,?,?,?)",
+                              (user, "Treino", _text(rng, 3), day, _text(rng, 25)))
+                    save_session_drills(c, c.lastrowid, [{'exercise_id': eid, 'sets': str(rng.randint(2, 4)), 'reps': str(rng.randint(5, 12)),
+                                                          'time': str(rng.randint(5, 20))} for eid in rng.sample(ex_ids, rng.randint(3, 6))])
+                    ratings += [(user, day, g, rng.randint(3, 10), _text(rng, 4)) for g in gks]
+                counts['sessions'] += 1
+            c.executemany("INSERT INTO training_ratings (user_id, date, gk_id, rating, notes) VALUES (?,?,?,?,?)", ratings)
+            counts['ratings'] += len(ratings)
+            refresh_rating_rollups(c, user)
+    with transaction() as conn: conn.execute("ANALYZE")
+    with connection() as conn: conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return counts
+
+# ==========================================
+# CAMINHOS MEDIDOS
+# ==========================================
+def _context(user):
+    from db import connection
+    with connection() as conn:
+        micro = conn.execute("SELECT start_date FROM microcycles WHERE user_id=? ORDER BY start_date DESC LIMIT 1 OFFSET 4", (user,)).fetchone()[0]
+        sess = conn.execute("SELECT id, start_date FROM sessions WHERE user_id=? AND type='Treino' AND start_date >= ? ORDER BY start_date LIMIT 1",
+                            (user, micro)).fetchone()
+        game = conn.execute("SELECT date FROM matches WHERE user_id=? ORDER BY date DESC LIMIT 1", (user,)).fetchone()[0]
+        gks = [r[0] for r in conn.execute("SELECT id FROM goalkeepers WHERE user_id=?", (user,))]
+    return {'user': user, 'micro': micro, 'session_id': sess[0], 'day': sess[1], 'game': game, 'gks': gks}
+
+def benchmarks():
+    from db import transaction
+    from metrics import METRIC_COLUMNS
+    from queries import (load_week, load_session_plan, upsert_training_ratings, refresh_rating_rollups, save_match,
+                         load_rating_rollups, search_exercises, load_calendar_month, attach_exercise_images,
+                         ensure_match, log_match_event, apply_match_events, load_day_session, load_goalkeeper_names, load_day_ratings)
+    from analytics import get_match_analytics, refresh_match, _cache as analytics_cache
+    from squad import load_squad
+    from pdf_export import create_training_pdf
+
+    def week(x): load_week(x['user'], x['micro'])
+
+    def daily_report_load(x):
+        u, d = x['user'], x['day']
+        load_day_session(u, d); load_goalkeeper_names(u); load_day_ratings(u, d)
+        load_session_plan(u, x['session_id'])
+
+    def daily_report_save(x):
+        with transaction() as conn:
+            c = conn.cursor()
+            c.execute("UPDATE sessions SET report=? WHERE id=?", ("bench", x['session_id']))
+            upsert_training_ratings(c, x['user'], [(x['day'], g, random.randint(1, 10), "bench") for g in x['gks']])
+            refresh_rating_rollups(c, x['user'], [x['day']])
+
+    def match_save(x):
+        get_match_analytics(x['user'])
+        header = {'opponent': "Bench", 'gk_id': x['gks'][0], 'goals_conceded': 1, 'saves': 4, 'result': "1-1", 'report': "", 'rating': 6}
+        with transaction() as conn: save_match(conn.cursor(), x['user'], x['game'], header, {m: random.randint(0, 5) for m in METRIC_COLUMNS})
+        refresh_match(x['user'], x['game'])
+
+    def live_tag(x):
+        # Uma ação ao vivo: o INSERT no registo e a soma incremental aos contadores
+        with transaction() as conn:
+            c = conn.cursor()
+            match_id, gk = ensure_match(c, x['user'], x['game'], "Bench", x['gks'][0])
+            log_match_event(c, match_id, 45, random.choice(METRIC_COLUMNS), gk)
+        with transaction() as conn:
+            c = conn.cursor()
+            apply_match_events(c, ensure_match(c, x['user'], x['game'], "Bench", x['gks'][0])[0])
+
+    def match_analytics(x):
+        analytics_cache.pop(x['user'], None)
+        an = get_match_analytics(x['user'])
+        an.per_goalkeeper(); an.season_splits(); an.rolling(x['gks'][0])
+
+    def evolution(x):
+        for p in ('week', 'month', 'micro'): load_rating_rollups(x['user'], x['gks'][0], p)
+
+    def squad(x): load_squad(x['user'])
+
+    def catalog(x):
+        for m in MOMENTS: search_exercises(x['user'], "", m, page=0, page_size=20)
+
+    def catalog_search(x): search_exercises(x['user'], "bola receção", page=0, page_size=20)
+
+    def calendar_month(x):
+        d = date.fromisoformat(x['day'])
+        load_calendar_month(x['user'], d.year, d.month)
+
+    def training_pdf(x):
+        w = load_week(x['user'], x['micro'])
+        s = next(s for s in w.sessions.values() if s['type'] == 'Treino')
+        cfg = w.drills[int(s['id'])]
+        details = w.exercises[w.exercises['id'].isin([d['exercise_id'] for d in cfg])]
+        create_training_pdf(x['user'], s, w.roster, cfg, attach_exercise_images(details))
+
+    return [week, daily_report_load, daily_report_save, match_save, live_tag, match_analytics, evolution, squad,
+            catalog, catalog_search, calendar_month, training_pdf]
+
+def run(repeat=5, user="coach00"):
+    from cache import query_cache
+    ctx = _context(user)
+    results = {}
+    for fn in benchmarks():
+        fn(ctx)  # aquecimento (imports, page cache do SQLite)
+        times = []
+        for _ in range(repeat):
+            # Sempre a frio em relação à cache de consultas: mede o caminho até à base de dados
+            query_cache.clear()
+            t0 = time.perf_counter(); fn(ctx); times.append((time.perf_counter() - t0) * 1000)
+        results[fn.__name__] = {'median_ms': statistics.median(times), 'min_ms': min(times)}
+    return results
+
+# ==========================================
+# ARRANQUE A FRIO
+# ==========================================
+# Cada medição corre num processo Python novo (sys.modules vazio), como um servidor acabado de
+# arrancar: startup_login é a primeira execução de app.py (página de login), first_* o primeiro
+# render de cada página com a sessão já iniciada, logo a seguir ao login.
+STARTUP_PAGES = [
+    ("first_semana", "Gestão Semanal"), ("first_relatorios", "Relatórios & Avaliações"),
+    ("first_evolucao", "Evolução do Atleta"), ("first_plantel", "Comparar Plantel"), ("first_jogo", "Centro de Jogo"),
+    ("first_calendario", "Calendário"), ("first_atletas", "Meus Atletas"), ("first_exercicios", "Exercícios"),
+]
+
+def _probe(page, user):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py'), default_timeout=120)
+    t0 = time.perf_counter(); at.run()
+    out = {'login_ms': (time.perf_counter() - t0) * 1000}
+    from bootstrap import loaded_stacks
+    out['login_stacks'] = [k for k, v in loaded_stacks().items() if v]
+    if page:
+        at.session_state['logged_in'] = True; at.session_state['username'] = user; at.session_state['menu'] = page
+        t0 = time.perf_counter(); at.run()
+        out['page_ms'] = (time.perf_counter() - t0) * 1000
+        out['page_stacks'] = [k for k, v in loaded_stacks().items() if v]
+    if at.exception: raise RuntimeError(f"{page or 'login'}: {at.exception}")
+    return out
+
+def _spawn_probe(db, page, user):
+    cmd = [sys.executable, os.path.abspath(__file__), '--db', db, '--probe', page, '--user', user]
+    res = subprocess.run(cmd, capture_output=True, text=True, env=dict(os.environ, GK_DB_PATH=db))
+    if res.returncode != 0: raise RuntimeError(res.stderr.strip().splitlines()[-1] if res.stderr.strip() else f"probe '{page}' falhou")
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+def run_startup(db, repeat=STARTUP_REPEAT, user="coach00"):
+    samples = {name: [] for name in ['startup_login'] + [n for n, _ in STARTUP_PAGES]}
+    stacks = {}
+    for _ in range(repeat):
+        for name, page in [('startup_login', '')] + STARTUP_PAGES:
+            out = _spawn_probe(db, page, user)
+            if page: samples[name].append(out['page_ms']); stacks[name] = out['page_stacks']
+            else: samples[name].append(out['login_ms']); stacks[name] = out['login_stacks']
+    for name, libs in stacks.items(): print(f"  {name:<20} carregado: {', '.join(libs) or '-'}")
+    return {name: {'median_ms': statistics.median(t), 'min_ms': min(t)} for name, t in samples.items()}
+
+def compare(results, baseline, tolerance):
+    # Compara pelo mínimo (menos ruído que a mediana); diferenças abaixo de BENCH_MIN_DELTA_MS não contam
+    regressions = []
+    print(f"{'caminho':<20} {'mediana':>10} {'mínimo':>10} {'referência':>11}  variação")
+    for name, r in results.items():
+        base = baseline.get(name, {}).get('min_ms')
+        delta = f"{(r['min_ms'] / base - 1) * 100:+.0f}%" if base else "-"
+        flag = ""
+        if base and r['min_ms'] > base * (1 + tolerance) and r['min_ms'] - base > BENCH_MIN_DELTA_MS:
+            flag = "  ⚠ REGRESSÃO"; regressions.append(name)
+        print(f"{name:<20} {r['median_ms']:>8.1f}ms {r['min_ms']:>8.1f}ms {(f'{base:.1f}ms' if base else '-'):>11}  {delta}{flag}")
+    return regressions
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmarks dos caminhos de dados do GK Manager")
+    p.add_argument('--db', default=BENCH_DB)
+    p.add_argument('--reuse', action='store_true', help="não regenerar a base de dados se já existir")
+    p.add_argument('--coaches', type=int, default=5)
+    p.add_argument('--goalkeepers', type=int, default=6)
+    p.add_argument('--seasons', type=int, default=3)
+    p.add_argument('--exercises', type=int, default=150)
+    p.add_argument('--repeat', type=int, default=5)
+    p.add_argument('--baseline', default=BENCH_BASELINE)
+    p.add_argument('--save-baseline', action='store_true')
+    p.add_argument('--tolerance', type=float, default=BENCH_TOLERANCE)
+    p.add_argument('--startup', action='store_true', help="medir o arranque a frio em vez dos caminhos de dados")
+    p.add_argument('--startup-repeat', type=int, default=STARTUP_REPEAT)
+    p.add_argument('--user', default="coach00")
+    p.add_argument('--probe', help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+
+    if args.probe is not None:
+        # Processo filho de run_startup(): uma medição, resultado em JSON na última linha
+        print(json.dumps(_probe(args.probe, args.user), ensure_ascii=False)); return 0
+
+    # O caminho da base de dados tem de estar definido antes de importar os módulos da app
+    os.environ['GK_DB_PATH'] = args.db
+    if not (args.reuse and os.path.exists(args.db)):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix): os.unlink(args.db + suffix)
+        from db import init_db
+        init_db()
+        t0 = time.perf_counter()
+        counts = generate(args.coaches, args.goalkeepers, args.seasons, args.exercises)
+        print(f"{args.db}: gerado em {time.perf_counter() - t0:.1f}s {counts}")
+    else:
+        from db import init_db
+        init_db()
+
+    results = run_startup(os.path.abspath(args.db), args.startup_repeat, args.user) if args.startup else run(args.repeat, args.user)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f: baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    missing = [name for name in results if not baseline.get(name, {}).get('min_ms')]
+    if args.save_baseline:
+        # Junta à referência existente: as medições de arranque e as dos caminhos de dados gravam-se em separado
+        with open(args.baseline, 'w', encoding='utf-8') as f: json.dump({**baseline, **results}, f, indent=1)
+        print(f"Referência gravada em {args.baseline}")
+    elif missing:
+        # Sem referência não há comparação: falha em vez de passar em silêncio
+        print(f"ERRO: sem referência em {args.baseline} para {', '.join(missing)}; gravar com --save-baseline", file=sys.stderr)
+        return 2
+    elif regressions: return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
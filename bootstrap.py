@@ -0,0 +1,36 @@
+import sys
+import threading
+import time
+
+from db import init_catalog
+
+# ==========================================
+# ARRANQUE DO PROCESSO
+# ==========================================
+# O Streamlit volta a executar app.py a cada rerun e a cada sessão nova: o que só deve correr
+# uma vez por processo (esquema/migrações; com shards, o catálogo) passa por startup().
+# As bibliotecas pesadas não são importadas no arranque: a página de login não usa nenhuma,
+# e cada página importa a sua no próprio ramo de app.py (o import seguinte é só uma consulta a sys.modules).
+HEAVY_STACKS = {
+    'dados': ('pandas', 'numpy'),
+    'pdf': ('fpdf',),
+    'imagens': ('PIL.Image',),
+    'calendário': ('streamlit_calendar',),
+}
+
+_started = {}
+_lock = threading.Lock()
+
+def startup():
+    # Devolve {'at', 'init_db_ms'} do primeiro arranque deste processo
+    if _started: return _started
+    with _lock:
+        if not _started:
+            t0 = time.perf_counter()
+            init_catalog()
+            _started.update(at=time.time(), init_db_ms=(time.perf_counter() - t0) * 1000)
+    return _started
+
+def loaded_stacks():
+    # Quais das bibliotecas pesadas já foram carregadas neste processo
+    return {name: any(m in sys.modules for m in mods) for name, mods in HEAVY_STACKS.items()}
@@ -0,0 +1,115 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+import pandas as pd
+
+from db import connection
+
+# ==========================================
+# CACHE DE CONSULTAS (POR UTILIZADOR E TABELA)
+# ==========================================
+# Cada entrada fica indexada pelas tabelas de onde foi lida; as escritas chamam invalidate()
+# com o utilizador e as tabelas que alteraram, e só essas entradas são descartadas.
+# Os valores devolvidos são partilhados: quem os usa não os deve alterar.
+QUERY_CACHE_MAX_ENTRIES = 512
+
+class QueryCache:
+    def __init__(self, max_entries=QUERY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._by_table = {}
+        # Geração por (utilizador, tabela), incrementada a cada invalidate: um valor lido enquanto
+        # uma escrita o invalidava (outro separador, trabalho em segundo plano) já nasce desatualizado
+        self._generation = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.invalidations = 0
+
+    def get_or_load(self, user, tables, key, loader):
+        full_key = (user, tuple(tables), key)
+        with self._lock:
+            if full_key in self._data:
+                self._data.move_to_end(full_key)
+                self.hits += 1
+                return self._data[full_key]
+            self.misses += 1
+            gen = [self._generation.get((user, t), 0) for t in tables]
+        value = loader()
+        with self._lock:
+            if gen != [self._generation.get((user, t), 0) for t in tables]: return value
+            self._data[full_key] = value
+            for t in tables: self._by_table.setdefault((user, t), set()).add(full_key)
+            while len(self._data) > self.max_entries: self._forget(next(iter(self._data)))
+        return value
+
+    def _forget(self, full_key):
+        self._data.pop(full_key, None)
+        user, tables, _ = full_key
+        for t in tables:
+            keys = self._by_table.get((user, t))
+            if keys is not None:
+                keys.discard(full_key)
+                if not keys: del self._by_table[(user, t)]
+
+    def invalidate(self, user, *tables):
+        with self._lock:
+            for t in tables:
+                self._generation[(user, t)] = self._generation.get((user, t), 0) + 1
+                for full_key in list(self._by_table.get((user, t), ())):
+                    self._forget(full_key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear(); self._by_table.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations,
+                    'entries': len(self._data), 'hit_rate': self.hits / total if total else 0.0}
+
+query_cache = QueryCache()
+
+def cached_query(user, tables, sql, params=()):
+    def load():
+        with connection() as conn: return pd.read_sql_query(sql, conn, params=params)
+    return query_cache.get_or_load(user, tables, (sql, tuple(params)), load)
+
+# ==========================================
+# REGISTOS LEVES (SEM PANDAS)
+# ==========================================
+# Para as consultas pequenas de cada rerun (listas de atletas, sessão do dia, notas do dia) um
+# DataFrame custa mais a construir e a indexar do que a própria consulta: estas devolvem tuplos de
+# namedtuples (__slots__ vazio, acesso por atributo) e, opcionalmente, um dict por uma coluna.
+# O pandas fica para as vistas analíticas (gráficos, tabelas, agregados).
+Lookup = namedtuple('Lookup', ['rows', 'by'])
+
+_row_types = {}
+
+def _row_type(fields):
+    # Uma classe por conjunto de colunas, reutilizada entre consultas
+    t = _row_types.get(fields)
+    if t is None: t = _row_types[fields] = namedtuple('Row', fields, rename=True)
+    return t
+
+def fetch_rows(conn, sql, params=()):
+    cur = conn.execute(sql, params)
+    make = _row_type(tuple(d[0] for d in cur.description))._make
+    return tuple(make(r) for r in cur.fetchall())
+
+def cached_rows(user, tables, sql, params=()):
+    def load():
+        with connection() as conn: return fetch_rows(conn, sql, params)
+    return query_cache.get_or_load(user, tables, ('rows', sql, tuple(params)), load)
+
+def cached_lookup(user, tables, sql, params=(), key='id'):
+    # Registos + {registo.<key>: registo}; com chaves repetidas fica o primeiro (pela ordem do SQL)
+    def load():
+        with connection() as conn: rows = fetch_rows(conn, sql, params)
+        by = {}
+        for r in rows: by.setdefault(getattr(r, key), r)
+        return Lookup(rows, by)
+    return query_cache.get_or_load(user, tables, ('lookup', key, sql, tuple(params)), load)
+
+def invalidate(user, *tables):
+    query_cache.invalidate(user, *tables)
@@ -0,0 +1,16 @@
+# Na raiz do projeto: o pytest acrescenta esta pasta ao sys.path e os testes importam os módulos da app
+import pytest
+
+import analytics
+import db
+from cache import query_cache
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    # Base de dados nova e já migrada, só para o teste
+    path = str(tmp_path / "gk.db")
+    monkeypatch.setattr(db, "DB_PATH", path)
+    db.init_db(path)
+    analytics._cache.clear(); query_cache.clear()
+    yield path
+    analytics._cache.clear(); query_cache.clear()
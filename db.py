@@ -0,0 +1,434 @@
+import hashlib
+import os
+import queue
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from perf import TimedConnection
+
+# ==========================================
+# CAMADA DE ACESSO À BASE DE DADOS
+# ==========================================
+# Um pool de ligações por processo (e por ficheiro), partilhado pelas threads de script do Streamlit.
+DB_PATH = os.environ.get('GK_DB_PATH', 'gk_master_v35.db')
+POOL_SIZE = int(os.environ.get('GK_DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = 30
+# Com GK_SHARD_DIR definido cada clube tem o seu ficheiro (ver ENCAMINHAMENTO mais abaixo)
+SHARD_DIR = os.environ.get('GK_SHARD_DIR')
+SHARD_POOL_SIZE = int(os.environ.get('GK_SHARD_POOL_SIZE', '4'))
+# Pools abertos ao mesmo tempo (um por ficheiro): com muitos clubes, os usados há mais tempo são fechados
+MAX_OPEN_POOLS = int(os.environ.get('GK_MAX_OPEN_POOLS', '32'))
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",        # leitores não bloqueiam o escritor
+    "PRAGMA synchronous=NORMAL",      # seguro em WAL, evita fsync por commit
+    "PRAGMA cache_size=-16000",       # ~16 MB de page cache por ligação
+    "PRAGMA mmap_size=268435456",     # 256 MB de leitura via mmap
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.closed = False
+
+    def _connect(self):
+        # isolation_level=None: autocommit, as transações são abertas explicitamente em transaction()
+        # TimedConnection: SQL contado/medido só quando o rerun está a ser instrumentado (perf.py)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False, factory=TimedConnection)
+        for pragma in PRAGMAS: conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=POOL_TIMEOUT):
+            raise sqlite3.OperationalError(f"Pool de ligações esgotado ({self.path})")
+        try: return self._idle.get_nowait()
+        except queue.Empty:
+            try: return self._connect()
+            except BaseException:
+                self._slots.release(); raise
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction: conn.rollback()
+            # Pool fechado enquanto a ligação estava em uso: não volta para a fila
+            if self.closed: conn.close()
+            else: self._idle.put(conn)
+        finally: self._slots.release()
+
+    def close_all(self):
+        self.closed = True
+        while True:
+            try: self._idle.get_nowait().close()
+            except queue.Empty: break
+
+_pools = OrderedDict()
+_pools_lock = threading.Lock()
+
+def get_pool(path=None):
+    # LRU por ficheiro: o pool que sai fecha as ligações paradas (as que estão em uso fecham-se ao ser devolvidas)
+    path = _resolve(path)
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None: pool = _pools[path] = ConnectionPool(path, SHARD_POOL_SIZE if SHARD_DIR else POOL_SIZE)
+        else: _pools.move_to_end(path)
+        while len(_pools) > MAX_OPEN_POOLS: _pools.popitem(last=False)[1].close_all()
+        return pool
+
+# ==========================================
+# ENCAMINHAMENTO (UMA BASE DE DADOS POR CLUBE)
+# ==========================================
+# Com GK_SHARD_DIR, as contas ficam num catálogo central (catalog.db) e os dados de cada clube no
+# seu próprio ficheiro, cada um com o seu lock de escrita: um clube a gravar não bloqueia os outros.
+# users.shard diz qual é o ficheiro (vários treinadores do mesmo clube podem partilhá-lo);
+# vazio = um ficheiro por treinador. Sem GK_SHARD_DIR tudo continua em DB_PATH, como antes.
+# As consultas não mudam: route(user) fixa o ficheiro da thread atual (um rerun do Streamlit)
+# e connection()/snapshot()/transaction() sem caminho explícito usam-no.
+CATALOG_NAME = 'catalog.db'
+
+_route = threading.local()
+_shard_of = {}
+_shard_lock = threading.Lock()
+
+def catalog_path():
+    return os.path.join(SHARD_DIR, CATALOG_NAME) if SHARD_DIR else DB_PATH
+
+def default_shard(user):
+    # Nome legível + hash (utilizadores diferentes nunca dão o mesmo ficheiro)
+    slug = re.sub(r'[^A-Za-z0-9_-]+', '_', user)[:40]
+    return f"club_{slug}_{hashlib.sha1(user.encode('utf-8')).hexdigest()[:8]}.db"
+
+def shard_path(user):
+    # Ficheiro de dados do utilizador (lido do catálogo uma vez por processo; mudar users.shard requer reiniciar)
+    if not SHARD_DIR: return DB_PATH
+    path = _shard_of.get(user)
+    if path is not None: return path
+    with _shard_lock:
+        if user not in _shard_of:
+            init_catalog()
+            with connection(catalog_path()) as conn:
+                row = conn.execute("SELECT shard FROM users WHERE username=?", (user,)).fetchone()
+            path = os.path.join(SHARD_DIR, (row and row[0]) or default_shard(user))
+            init_db(path)
+            _shard_of[user] = path
+        return _shard_of[user]
+
+@contextmanager
+def route(user):
+    prev = getattr(_route, 'path', None)
+    _route.path = shard_path(user)
+    try: yield _route.path
+    finally: _route.path = prev
+
+def _resolve(path):
+    if path: return path
+    routed = getattr(_route, 'path', None)
+    if routed: return routed
+    # Com shards, uma ligação sem utilizador iria parar a um ficheiro errado: melhor falhar já
+    if SHARD_DIR: raise RuntimeError("Sem encaminhamento: use route(user) ou indique o ficheiro")
+    return DB_PATH
+
+@contextmanager
+def connection(path=None):
+    pool = get_pool(path)
+    conn = pool.acquire()
+    try: yield conn
+    finally: pool.release(conn)
+
+@contextmanager
+def snapshot(path=None):
+    # Várias leituras sobre a mesma versão da base de dados, numa só transação de leitura
+    with connection(path) as conn:
+        conn.execute("BEGIN")
+        try: yield conn
+        finally:
+            if conn.in_transaction: conn.rollback()
+
+@contextmanager
+def transaction(path=None):
+    # BEGIN IMMEDIATE reserva logo o lock de escrita: falha cedo em vez de a meio da transação
+    with connection(path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try: yield conn
+        except BaseException:
+            conn.rollback(); raise
+        conn.commit()
+
+# ==========================================
+# ESQUEMA E MIGRAÇÕES
+# ==========================================
+# Cada migração corre uma única vez por ficheiro e fica registada em schema_version.
+# Bases de dados antigas (ex: gk_master_v34.db) são atualizadas no próprio ficheiro.
+def _create_base_tables(c):
+    # USERS
+    c.execute('''CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT)''')
+    
+    # ATLETAS
+    c.execute('''CREATE TABLE IF NOT EXISTS goalkeepers (
+                    id INTEGER PRIMARY KEY, user_id TEXT, name TEXT, age INTEGER, status TEXT, notes TEXT,
+                    height REAL, wingspan REAL, arm_len_left REAL, arm_len_right REAL, glove_size TEXT,
+                    jump_front_2 REAL, jump_front_l REAL, jump_front_r REAL, jump_lat_l REAL, jump_lat_r REAL,
+                    test_res TEXT, test_agil TEXT, test_vel TEXT)''')
+    
+    # EXERCÍCIOS
+    c.execute('''CREATE TABLE IF NOT EXISTS exercises (
+                    id INTEGER PRIMARY KEY, user_id TEXT, title TEXT, moment TEXT, training_type TEXT, 
+                    description TEXT, objective TEXT, materials TEXT, space TEXT, image BLOB)''')
+    
+    # SESSÕES
+    c.execute('''CREATE TABLE IF NOT EXISTS sessions (
+                    id INTEGER PRIMARY KEY, user_id TEXT, type TEXT, title TEXT, start_date TEXT, drills_list TEXT, report TEXT)''')
+    
+    # MICROCICLOS
+    c.execute('''CREATE TABLE IF NOT EXISTS microcycles (
+                    id INTEGER PRIMARY KEY, user_id TEXT, title TEXT, start_date TEXT, goal TEXT, report TEXT)''')
+    
+    # NOTAS
+    c.execute('''CREATE TABLE IF NOT EXISTS training_ratings (
+                    id INTEGER PRIMARY KEY, user_id TEXT, date TEXT, gk_id INTEGER, rating INTEGER, notes TEXT)''')
+    
+    # JOGOS - ESTRUTURA BLINDADA (63 CAMPOS DE DADOS + ID)
+    # CORREÇÃO 2: Garantir que a tabela tem exatamente as colunas que vamos inserir
+    c.execute('''CREATE TABLE IF NOT EXISTS matches (
+                    id INTEGER PRIMARY KEY, 
+                    user_id TEXT, date TEXT, opponent TEXT, gk_id INTEGER, goals_conceded INTEGER, saves INTEGER, result TEXT, report TEXT, rating INTEGER, 
+                    -- Bloqueios (6)
+                    db_bloq_sq_rast INTEGER, db_bloq_sq_med INTEGER, db_bloq_sq_alt INTEGER, db_bloq_cq_rast INTEGER, db_bloq_cq_med INTEGER, db_bloq_cq_alt INTEGER, 
+                    -- Rececoes (6)
+                    db_rec_sq_med INTEGER, db_rec_sq_alt INTEGER, db_rec_cq_rast INTEGER, db_rec_cq_med INTEGER, db_rec_cq_alt INTEGER, db_rec_cq_varr INTEGER, 
+                    -- Desvios (10)
+                    db_desv_sq_pe INTEGER, db_desv_sq_mfr INTEGER, db_desv_sq_mlat INTEGER, db_desv_sq_a1 INTEGER, db_desv_sq_a2 INTEGER, db_desv_cq_varr INTEGER, db_desv_cq_r1 INTEGER, db_desv_cq_r2 INTEGER, db_desv_cq_a1 INTEGER, db_desv_cq_a2 INTEGER, 
+                    -- Ext/Voo (7)
+                    db_ext_rec INTEGER, db_ext_desv_1 INTEGER, db_ext_desv_2 INTEGER, db_voo_rec INTEGER, db_voo_desv_1 INTEGER, db_voo_desv_2 INTEGER, db_voo_desv_mc INTEGER, 
+                    -- Espaco (4)
+                    de_cabeca INTEGER, de_carrinho INTEGER, de_alivio INTEGER, de_rececao INTEGER, 
+                    -- Duelos (4)
+                    duelo_parede INTEGER, duelo_abafo INTEGER, duelo_estrela INTEGER, duelo_frontal INTEGER, 
+                    -- Tactica (10)
+                    pa_curto_1 INTEGER, pa_curto_2 INTEGER, pa_longo_1 INTEGER, pa_longo_2 INTEGER, dist_curta_mao INTEGER, dist_longa_mao INTEGER, dist_picada_mao INTEGER, dist_volley INTEGER, dist_curta_pe INTEGER, dist_longa_pe INTEGER, 
+                    -- Cruzamentos (4)
+                    cruz_rec_alta INTEGER, cruz_soco_1 INTEGER, cruz_soco_2 INTEGER, cruz_int_rast INTEGER,
+                    -- ETO (3)
+                    eto_pb_curto INTEGER, eto_pb_medio INTEGER, eto_pb_longo INTEGER
+                    )''')
+
+def _m001_base_schema(c):
+    _create_base_tables(c)
+    # Ficheiros de versões anteriores podem ter tabelas com menos colunas: acrescenta as que faltam
+    ref = sqlite3.connect(':memory:')
+    try:
+        _create_base_tables(ref.cursor())
+        for (table,) in ref.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall():
+            have = {r[1] for r in c.execute(f"PRAGMA table_info({table})")}
+            for _, col, ctype, *_ in ref.execute(f"PRAGMA table_info({table})"):
+                if col not in have: c.execute(f"ALTER TABLE {table} ADD COLUMN {col} {ctype}")
+    finally: ref.close()
+
+def _m002_indexes(c):
+    # Todos os ecrãs filtram por user_id + data/atleta
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_date ON sessions(user_id, start_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ratings_user_gk_date ON training_ratings(user_id, gk_id, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ratings_user_date ON training_ratings(user_id, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_matches_user_date ON matches(user_id, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_exercises_user_moment ON exercises(user_id, moment)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_exercises_user_title ON exercises(user_id, title)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_microcycles_user_date ON microcycles(user_id, start_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_goalkeepers_user ON goalkeepers(user_id)")
+    c.execute("ANALYZE")
+
+def _m003_exercise_images(c):
+    # IMAGENS: original normalizado + miniatura, fora da tabela exercises
+    c.execute('''CREATE TABLE IF NOT EXISTS exercise_images (
+                    exercise_id INTEGER PRIMARY KEY, content_hash TEXT, mime TEXT, width INTEGER, height INTEGER,
+                    original BLOB, thumbnail BLOB, print_rendition BLOB)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_exercise_images_hash ON exercise_images(content_hash)")
+    # Imagens antigas passam de exercises.image para a nova tabela (as ilegíveis ficam onde estavam)
+    from images import store_exercise_image
+    for ex_id, raw in c.execute("SELECT id, image FROM exercises WHERE image IS NOT NULL").fetchall():
+        try: store_exercise_image(c, ex_id, raw)
+        except Exception: continue
+        c.execute("UPDATE exercises SET image=NULL WHERE id=?", (ex_id,))
+
+def _m004_print_renditions(c):
+    # Versão de impressão (PDF) gerada uma vez, em vez de a cada ficha; preenche as linhas antigas
+    have = {r[1] for r in c.execute("PRAGMA table_info(exercise_images)")}
+    if 'print_rendition' not in have: c.execute("ALTER TABLE exercise_images ADD COLUMN print_rendition BLOB")
+    from images import print_rendition_from_original
+    for ex_id, original in c.execute("SELECT exercise_id, original FROM exercise_images WHERE print_rendition IS NULL").fetchall():
+        try: c.execute("UPDATE exercise_images SET print_rendition=? WHERE exercise_id=?", (print_rendition_from_original(original), ex_id))
+        except Exception: continue
+
+def _m005_session_drills(c):
+    # PLANO DAS SESSÕES: uma linha por exercício, em vez do JSON em sessions.drills_list
+    c.execute('''CREATE TABLE IF NOT EXISTS session_drills (
+                    session_id INTEGER NOT NULL, exercise_id INTEGER, position INTEGER NOT NULL,
+                    sets TEXT, reps TEXT, time TEXT, title TEXT, PRIMARY KEY (session_id, position))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_session_drills_exercise ON session_drills(exercise_id, session_id)")
+    # Os títulos do JSON passam a ids (o primeiro exercício do treinador com esse título); títulos
+    # sem exercício correspondente (apagado ou renomeado) ficam com exercise_id NULL e o título
+    # guardado em session_drills.title: continuam no "📋 Plano" do relatório diário, como antes
+    from queries import parse_drills
+    ids = {}
+    for ex_id, user_id, title in c.execute("SELECT id, user_id, title FROM exercises ORDER BY id").fetchall():
+        ids.setdefault((user_id, title), ex_id)
+    for sid, user_id, drills_list in c.execute("SELECT id, user_id, drills_list FROM sessions WHERE drills_list IS NOT NULL").fetchall():
+        drills = [d for d in parse_drills(drills_list) if d.get('title')]
+        c.executemany("INSERT OR REPLACE INTO session_drills (session_id, exercise_id, position, sets, reps, time, title) VALUES (?,?,?,?,?,?,?)",
+                      [(sid, ids.get((user_id, d['title'])), pos, d.get('sets', ''), d.get('reps', ''), d.get('time', ''),
+                        None if (user_id, d['title']) in ids else d['title']) for pos, d in enumerate(drills)])
+    # drills_list fica intacto (só deixa de ser lido); é limpo quando a sessão volta a ser guardada
+
+def _m006_ratings_unique(c):
+    # Uma nota por atleta e dia: fica a mais recente de cada duplicado e a chave passa a única,
+    # o que permite guardar com INSERT ... ON CONFLICT em vez de DELETE + INSERT
+    c.execute("""DELETE FROM training_ratings WHERE id NOT IN
+                 (SELECT MAX(id) FROM training_ratings GROUP BY user_id, date, gk_id)""")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_ratings_user_date_gk ON training_ratings(user_id, date, gk_id)")
+    # O novo índice começa por (user_id, date) e cobre as pesquisas do antigo
+    c.execute("DROP INDEX IF EXISTS idx_ratings_user_date")
+
+def _m007_match_stats(c):
+    # FICHAS DE JOGO: contadores numa tabela longa (match_id, metric, value), só os diferentes de 0;
+    # matches fica só com o cabeçalho e passa a ter uma ficha por dia (upsert por user_id + date)
+    c.execute('''CREATE TABLE IF NOT EXISTS match_stats (
+                    match_id INTEGER NOT NULL, metric TEXT NOT NULL, value INTEGER NOT NULL,
+                    PRIMARY KEY (match_id, metric)) WITHOUT ROWID''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_match_stats_metric ON match_stats(metric, match_id)")
+    c.execute("DELETE FROM matches WHERE id NOT IN (SELECT MAX(id) FROM matches GROUP BY user_id, date)")
+    header = ["id", "user_id", "date", "opponent", "gk_id", "goals_conceded", "saves", "result", "report", "rating"]
+    # Todas as colunas que não são cabeçalho eram contadores (também as acrescentadas à mão em bases antigas)
+    for col in [r[1] for r in c.execute("PRAGMA table_info(matches)").fetchall() if r[1] not in header]:
+        c.execute(f"INSERT OR REPLACE INTO match_stats SELECT id, ?, CAST({col} AS INTEGER) FROM matches WHERE CAST(COALESCE({col}, 0) AS INTEGER) <> 0", (col,))
+    c.execute('''CREATE TABLE matches_new (
+                    id INTEGER PRIMARY KEY, user_id TEXT, date TEXT, opponent TEXT, gk_id INTEGER, goals_conceded INTEGER,
+                    saves INTEGER, result TEXT, report TEXT, rating INTEGER, version INTEGER NOT NULL DEFAULT 1)''')
+    c.execute(f"INSERT INTO matches_new ({', '.join(header)}) SELECT {', '.join(header)} FROM matches")
+    c.execute("DROP TABLE matches")
+    c.execute("ALTER TABLE matches_new RENAME TO matches")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_matches_user_date ON matches(user_id, date)")
+
+def _m008_rating_rollups(c):
+    # EVOLUÇÃO: médias, contagens, mín/máx e tendência por atleta e semana/mês/microciclo,
+    # mantidas a cada gravação de notas (queries.refresh_rating_rollups)
+    c.execute('''CREATE TABLE IF NOT EXISTS rating_rollups (
+                    user_id TEXT NOT NULL, gk_id INTEGER NOT NULL, period TEXT NOT NULL, period_start TEXT NOT NULL,
+                    n INTEGER, avg_rating REAL, min_rating INTEGER, max_rating INTEGER, slope REAL,
+                    PRIMARY KEY (user_id, gk_id, period, period_start)) WITHOUT ROWID''')
+    from queries import refresh_rating_rollups
+    refresh_rating_rollups(c)
+
+def _m009_exercises_fts(c):
+    # PESQUISA: índice FTS5 sobre o texto dos exercícios (conteúdo externo, sem duplicar o texto),
+    # mantido pelos triggers; acentos ignorados ("rececao" encontra "receção"; a grafia "recepcao" não)
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS exercises_fts USING fts5(
+                    title, description, objective, materials, space,
+                    content='exercises', content_rowid='id', tokenize='unicode61 remove_diacritics 2')''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS exercises_fts_ai AFTER INSERT ON exercises BEGIN
+                    INSERT INTO exercises_fts(rowid, title, description, objective, materials, space)
+                    VALUES (new.id, new.title, new.description, new.objective, new.materials, new.space);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS exercises_fts_ad AFTER DELETE ON exercises BEGIN
+                    INSERT INTO exercises_fts(exercises_fts, rowid, title, description, objective, materials, space)
+                    VALUES ('delete', old.id, old.title, old.description, old.objective, old.materials, old.space);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS exercises_fts_au AFTER UPDATE OF title, description, objective, materials, space ON exercises BEGIN
+                    INSERT INTO exercises_fts(exercises_fts, rowid, title, description, objective, materials, space)
+                    VALUES ('delete', old.id, old.title, old.description, old.objective, old.materials, old.space);
+                    INSERT INTO exercises_fts(rowid, title, description, objective, materials, space)
+                    VALUES (new.id, new.title, new.description, new.objective, new.materials, new.space);
+                 END''')
+    c.execute("INSERT INTO exercises_fts(exercises_fts) VALUES ('rebuild')")
+
+def _m010_jobs(c):
+    # TRABALHOS EM SEGUNDO PLANO (jobs.py): estado, progresso e resultado, apagados ao fim de um TTL;
+    # o resultado fica num ficheiro (jobs.JOB_SPOOL_DIR) e a linha guarda só o caminho e o tamanho
+    c.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, kind TEXT NOT NULL, job_key TEXT NOT NULL,
+                    params TEXT, input BLOB, status TEXT NOT NULL, progress REAL NOT NULL DEFAULT 0, message TEXT, error TEXT,
+                    result_path TEXT, result_size INTEGER, result_name TEXT, result_mime TEXT, meta TEXT, pid INTEGER,
+                    created_at REAL, started_at REAL, finished_at REAL, expires_at REAL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user_key ON jobs(user_id, job_key, status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_expires ON jobs(expires_at)")
+
+def _m011_match_events(c):
+    # JOGO AO VIVO: registo só de acréscimos (uma linha por ação, com minuto e guarda-redes);
+    # matches.events_applied é o último evento já somado a match_stats/matches (queries.apply_match_events)
+    c.execute('''CREATE TABLE IF NOT EXISTS match_events (
+                    id INTEGER PRIMARY KEY, match_id INTEGER NOT NULL, minute INTEGER NOT NULL, metric TEXT NOT NULL,
+                    gk_id INTEGER, delta INTEGER NOT NULL DEFAULT 1, created_at TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_match_events_match ON match_events(match_id, id)")
+    have = {r[1] for r in c.execute("PRAGMA table_info(matches)")}
+    if 'events_applied' not in have: c.execute("ALTER TABLE matches ADD COLUMN events_applied INTEGER NOT NULL DEFAULT 0")
+
+MIGRATIONS = [
+    (1, "esquema base (v35)", _m001_base_schema),
+    (2, "índices compostos por utilizador", _m002_indexes),
+    (3, "imagens e miniaturas dos exercícios", _m003_exercise_images),
+    (4, "versão de impressão das imagens", _m004_print_renditions),
+    (5, "plano das sessões em session_drills", _m005_session_drills),
+    (6, "nota única por atleta e dia", _m006_ratings_unique),
+    (7, "estatísticas de jogo em match_stats", _m007_match_stats),
+    (8, "agregados da evolução dos atletas", _m008_rating_rollups),
+    (9, "pesquisa de texto nos exercícios (FTS5)", _m009_exercises_fts),
+    (10, "trabalhos em segundo plano", _m010_jobs),
+    (11, "registo de eventos dos jogos ao vivo", _m011_match_events),
+]
+
+def schema_version(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT, applied_at TEXT)")
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def migrate(path=None):
+    applied = []
+    with connection(path) as conn:
+        for version, name, fn in MIGRATIONS:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Verificado dentro da transação: outro processo pode ter migrado entretanto
+                if version > schema_version(conn):
+                    fn(conn.cursor())
+                    conn.execute("INSERT INTO schema_version VALUES (?,?,datetime('now'))", (version, name))
+                    applied.append(version)
+            except BaseException:
+                conn.rollback(); raise
+            conn.commit()
+    return applied
+
+_initialized = set()
+_init_lock = threading.Lock()
+
+def init_db(path=None):
+    # Corre as migrações uma vez por processo; os reruns seguintes do Streamlit não tocam no esquema
+    path = path or DB_PATH
+    if path in _initialized: return
+    with _init_lock:
+        if path in _initialized: return
+        migrate(path)
+        _initialized.add(path)
+
+# Catálogo central (só com GK_SHARD_DIR): contas e o ficheiro de cada uma
+def init_catalog():
+    if not SHARD_DIR: return init_db(DB_PATH)
+    path = catalog_path()
+    if path in _initialized: return
+    with _init_lock:
+        if path in _initialized: return
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        with transaction(path) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT, shard TEXT)")
+        _initialized.add(path)
+
+if __name__ == "__main__":
+    # Uso: python db.py [ficheiro.db]  -> atualiza o ficheiro indicado para o esquema atual
+    import sys
+    target = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    done = migrate(target)
+    with connection(target) as conn: current = schema_version(conn)
+    print(f"{target}: versão {current}" + (f" (aplicadas: {done})" if done else " (já atualizado)"))
@@ -0,0 +1,79 @@
+import hashlib
+import io
+from functools import lru_cache
+
+from db import connection
+
+# ==========================================
+# IMAGENS DOS EXERCÍCIOS
+# ==========================================
+# Os uploads são normalizados no momento em que são guardados: orientação EXIF aplicada,
+# lado maior limitado a ORIGINAL_MAX_PX, uma versão de impressão de PRINT_MAX_PX para os PDFs
+# (100 mm de largura a ~200 dpi) e uma miniatura de THUMB_MAX_PX para o catálogo.
+# O PIL só é importado quando há uma imagem para processar: ler miniaturas/versões de impressão não o usa.
+ORIGINAL_MAX_PX = 1600
+PRINT_MAX_PX = 800
+THUMB_MAX_PX = 320
+JPEG_QUALITY = 85
+
+def _encode(img, fmt):
+    buf = io.BytesIO()
+    if fmt == 'PNG': img.save(buf, 'PNG', optimize=True)
+    else: img.save(buf, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buf.getvalue()
+
+def normalize_image(raw):
+    from PIL import Image, ImageOps
+    img = Image.open(io.BytesIO(raw))
+    # PNG mantém-se PNG (esquemas com cores planas); tudo o resto passa a JPEG
+    fmt = 'PNG' if img.format == 'PNG' else 'JPEG'
+    img = ImageOps.exif_transpose(img)
+    if fmt == 'JPEG' and img.mode != 'RGB': img = img.convert('RGB')
+    elif fmt == 'PNG' and img.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'): img = img.convert('RGBA')
+    img.thumbnail((ORIGINAL_MAX_PX, ORIGINAL_MAX_PX))
+    original = _encode(img, fmt)
+    return {
+        'content_hash': hashlib.sha256(original).hexdigest(),
+        'mime': 'image/png' if fmt == 'PNG' else 'image/jpeg',
+        'width': img.width, 'height': img.height,
+        'original': original,
+        'print_rendition': _rendition(img, fmt, PRINT_MAX_PX),
+        'thumbnail': _rendition(img, fmt, THUMB_MAX_PX),
+    }
+
+def _rendition(img, fmt, max_px):
+    small = img.copy()
+    small.thumbnail((max_px, max_px))
+    return _encode(small, fmt)
+
+def print_rendition_from_original(original):
+    from PIL import Image
+    img = Image.open(io.BytesIO(original))
+    return _rendition(img, 'PNG' if img.format == 'PNG' else 'JPEG', PRINT_MAX_PX)
+
+def store_exercise_image(c, exercise_id, raw):
+    # Corre dentro da transação de quem guarda o exercício
+    n = normalize_image(raw)
+    c.execute('''INSERT OR REPLACE INTO exercise_images (exercise_id, content_hash, mime, width, height, original, thumbnail, print_rendition)
+                 VALUES (?,?,?,?,?,?,?,?)''', (exercise_id, n['content_hash'], n['mime'], n['width'], n['height'],
+                                               n['original'], n['thumbnail'], n['print_rendition']))
+    return n['content_hash']
+
+def delete_exercise_image(c, exercise_id):
+    c.execute("DELETE FROM exercise_images WHERE exercise_id=?", (exercise_id,))
+
+# Endereçadas pelo hash do conteúdo: uma entrada nunca fica desatualizada
+@lru_cache(maxsize=256)
+def get_thumbnail(content_hash):
+    with connection() as conn:
+        row = conn.execute("SELECT thumbnail FROM exercise_images WHERE content_hash=? LIMIT 1", (content_hash,)).fetchone()
+    return row[0] if row else None
+
+def get_print_renditions(exercise_ids):
+    # {exercise_id: (content_hash, bytes)} — a versão pré-redimensionada que os PDFs embebem
+    ids = [int(i) for i in exercise_ids]
+    if not ids: return {}
+    ph = ','.join('?' for _ in ids)
+    with connection() as conn:
+        rows = conn.execute(f"SELECT exercise_id, content_hash, print_rendition FROM exercise_images WHERE exercise_id IN ({ph})", ids).fetchall()
+    return {ex_id: (h, data) for ex_id, h, data in rows}
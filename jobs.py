@@ -0,0 +1,173 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from db import connection, transaction, route
+
+# ==========================================
+# TRABALHOS EM SEGUNDO PLANO
+# ==========================================
+# O trabalho pesado (exportação de fichas em PDF, importação de notas) corre num pool de threads
+# fora da thread do script: a página cria o trabalho (submit), mostra o progresso (get_job) e
+# descarrega o resultado quando fica pronto (job_result). O estado fica na tabela jobs, na base de
+# dados do utilizador; pedidos repetidos com os mesmos parâmetros enquanto o primeiro ainda não
+# terminou juntam-se a ele. O resultado é escrito à medida num ficheiro em JOB_SPOOL_DIR (não fica
+# todo em memória nem num BLOB) e só é lido quando o utilizador o descarrega.
+# Resultados e erros são apagados JOB_TTL_S depois de terminarem.
+# Assume um processo de servidor por base de dados (streamlit run): trabalhos ativos de outro
+# processo (que entretanto terminou) passam a 'failed' na primeira utilização.
+JOB_WORKERS = int(os.environ.get('GK_JOB_WORKERS', '2'))
+JOB_TTL_S = int(os.environ.get('GK_JOB_TTL_S', '3600'))
+JOB_SPOOL_DIR = os.environ.get('GK_JOB_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'gk_jobs'))
+JOB_PROGRESS_INTERVAL_S = 0.25
+JOB_BATCH_SIZE = 500
+ACTIVE = ('queued', 'running')
+
+Job = namedtuple('Job', 'id kind status progress message error result_name result_mime result_size meta created_at finished_at')
+JOB_COLUMNS = "id, kind, status, progress, message, error, result_name, result_mime, result_size, meta, created_at, finished_at"
+# O que um tipo de trabalho devolve: nome e tipo do ficheiro escrito em `out` (se escreveu) e um dict com detalhes para a página
+JobResult = namedtuple('JobResult', 'name mime meta', defaults=(None, None, None))
+
+_kinds = {}
+
+def job_kind(name):
+    # Regista fn(user, params, data, progress, out) -> JobResult como o tipo `name`; `out` é o ficheiro do resultado
+    def register(fn):
+        _kinds[name] = fn
+        return fn
+    return register
+
+_executor = None
+_executor_lock = threading.Lock()
+_recovered = set()
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None: _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='gk-job')
+        return _executor
+
+def _recover(conn, user):
+    # Uma vez por processo e utilizador: trabalhos deixados a meio por um processo anterior
+    if user in _recovered: return
+    now = time.time()
+    conn.execute("""UPDATE jobs SET status='failed', error='Interrompido (servidor reiniciado)', finished_at=?, expires_at=?
+                    WHERE user_id=? AND status IN ('queued', 'running') AND COALESCE(pid, -1) <> ?""", (now, now + JOB_TTL_S, user, os.getpid()))
+    _recovered.add(user)
+
+def _remove(path):
+    if not path: return
+    try: os.remove(path)
+    except FileNotFoundError: pass
+
+def _expire(conn, now):
+    for (path,) in conn.execute("SELECT result_path FROM jobs WHERE expires_at < ? AND result_path IS NOT NULL", (now,)).fetchall(): _remove(path)
+    conn.execute("DELETE FROM jobs WHERE expires_at < ?", (now,))
+
+def job_key(kind, params=None, data=None):
+    payload = json.dumps(params or {}, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(kind.encode('utf-8') + b"\0" + payload + b"\0" + (data or b"")).hexdigest()
+
+def submit(user, kind, params=None, data=None):
+    # Devolve o id do trabalho (o já existente, se um igual ainda estiver em curso)
+    if kind not in _kinds: raise ValueError(f"Tipo de trabalho desconhecido: {kind}")
+    key, now = job_key(kind, params, data), time.time()
+    with route(user), transaction() as conn:
+        _recover(conn, user)
+        _expire(conn, now)
+        row = conn.execute("SELECT id FROM jobs WHERE user_id=? AND job_key=? AND status IN ('queued', 'running') ORDER BY id DESC LIMIT 1",
+                           (user, key)).fetchone()
+        if row: return row[0]
+        job_id = conn.execute("""INSERT INTO jobs (user_id, kind, job_key, params, input, status, pid, created_at)
+                                 VALUES (?,?,?,?,?,'queued',?,?) RETURNING id""",
+                              (user, kind, key, json.dumps(params or {}, default=str), data, os.getpid(), now)).fetchone()[0]
+    _pool().submit(_run, user, job_id)
+    return job_id
+
+def _run(user, job_id):
+    with route(user):
+        with transaction() as conn:
+            row = conn.execute("UPDATE jobs SET status='running', started_at=?, pid=? WHERE id=? AND status='queued' RETURNING kind, params, input",
+                               (time.time(), os.getpid(), job_id)).fetchone()
+        if row is None: return
+        kind, params, data = row
+        os.makedirs(JOB_SPOOL_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=JOB_SPOOL_DIR, prefix=f"job{job_id}_")
+        # Registado logo: um processo que morra a meio deixa o ficheiro para a expiração apagar
+        with connection() as conn: conn.execute("UPDATE jobs SET result_path=? WHERE id=?", (path, job_id))
+        last = [0.0]
+        def progress(fraction, message=None):
+            # Uma escrita no máximo a cada JOB_PROGRESS_INTERVAL_S
+            now = time.perf_counter()
+            if now - last[0] < JOB_PROGRESS_INTERVAL_S and fraction < 1: return
+            last[0] = now
+            with connection() as conn:
+                conn.execute("UPDATE jobs SET progress=?, message=COALESCE(?, message) WHERE id=?", (min(1.0, fraction), message, job_id))
+        try:
+            with os.fdopen(fd, 'w+b') as out: res = _kinds[kind](user, json.loads(params or "{}"), data, progress, out)
+            status, error = 'done', None
+        except Exception as e:
+            res, status, error = JobResult(), 'failed', f"{type(e).__name__}: {e}"
+        size = os.path.getsize(path) if status == 'done' else 0
+        if not size: _remove(path); path = None
+        now = time.time()
+        with connection() as conn:
+            conn.execute("""UPDATE jobs SET status=?, error=?, progress=CASE WHEN ?='done' THEN 1 ELSE progress END, input=NULL,
+                                result_path=?, result_size=?, result_name=?, result_mime=?, meta=?, finished_at=?, expires_at=? WHERE id=?""",
+                         (status, error, status, path, size or None, res.name, res.mime, json.dumps(res.meta, default=str) if res.meta is not None else None,
+                          now, now + JOB_TTL_S, job_id))
+
+def get_job(user, job_id):
+    # Só o estado (o resultado fica no ficheiro), para ser lido a cada atualização da página
+    if job_id is None: return None
+    with route(user), connection() as conn:
+        _recover(conn, user)
+        row = conn.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id=? AND user_id=?", (job_id, user)).fetchone()
+    if row is None: return None
+    job = Job(*row)
+    return job._replace(meta=json.loads(job.meta) if job.meta else None)
+
+def job_result(user, job_id):
+    # Conteúdo do resultado; chamado só quando o utilizador descarrega (st.download_button com uma função)
+    with route(user), connection() as conn:
+        row = conn.execute("SELECT result_path FROM jobs WHERE id=? AND user_id=? AND status='done'", (job_id, user)).fetchone()
+    if not row or not row[0]: return None
+    try:
+        with open(row[0], 'rb') as f: return f.read()
+    except FileNotFoundError: return None
+
+# ==========================================
+# TIPOS DE TRABALHO
+# ==========================================
+@job_kind('training_export')
+def _training_export(user, params, data, progress, out):
+    # Cada ficha vai para o ficheiro do resultado assim que fica pronta (como na exportação direta)
+    from pdf_export import export_training_pdfs
+    start, end, mode = params['start'], params['end'], params['mode']
+    timings = export_training_pdfs(user, start, end, out, mode=mode, progress=progress)
+    return JobResult(f"Treinos_{start}_{end}.{mode}", "application/zip" if mode == 'zip' else "application/pdf", {'timings': timings})
+
+@job_kind('ratings_import')
+def _ratings_import(user, params, data, progress, out):
+    # Em lotes, cada um na sua transação: o lock de escrita não fica preso durante todo o ficheiro
+    # (o upsert torna a repetição de um ficheiro interrompido segura)
+    from cache import invalidate
+    from queries import parse_ratings_csv, upsert_training_ratings, refresh_rating_rollups, load_goalkeeper_names
+    names = {g.id: g.name for g in load_goalkeeper_names(user).rows}
+    rows, errors = parse_ratings_csv(io.BytesIO(data), names)
+    for i in range(0, len(rows), JOB_BATCH_SIZE):
+        batch = rows[i:i + JOB_BATCH_SIZE]
+        with transaction() as conn:
+            c = conn.cursor()
+            upsert_training_ratings(c, user, batch)
+            refresh_rating_rollups(c, user, sorted({r[0] for r in batch}))
+        # A cada lote gravado: se um lote seguinte falhar, os já gravados não ficam escondidos pela cache
+        invalidate(user, 'training_ratings', 'rating_rollups')
+        progress((i + len(batch)) / len(rows), f"{i + len(batch)} de {len(rows)} notas")
+    return JobResult(meta={'imported': len(rows), 'errors': errors})
@@ -0,0 +1,53 @@
+from collections import namedtuple
+
+# ==========================================
+# REGISTO DE MÉTRICAS DA FICHA DE JOGO
+# ==========================================
+# Fonte única para o formulário, a gravação (match_stats) e a análise.
+# Uma métrica nova é uma linha aqui: não há colunas a acrescentar à tabela matches.
+# code: chave guardada em match_stats.metric (nomes das antigas colunas de matches)
+# key: chave do widget no formulário
+Metric = namedtuple('Metric', 'code label max_value key')
+Category = namedtuple('Category', 'name header columns')
+
+def _m(code, label, max_value=20, key=None): return Metric(code, label, max_value, key or code)
+
+METRIC_CATEGORIES = [
+    Category("Bloqueios", "🧱 1. DEFESA DE BALIZA: BLOQUEIOS", [
+        [_m("db_bloq_sq_rast", "Rasteiro (SQ)", key="b1"), _m("db_bloq_sq_med", "Médio (SQ)", key="b2"), _m("db_bloq_sq_alt", "Alto (SQ)", key="b3")],
+        [_m("db_bloq_cq_rast", "Rasteiro (CQ)", key="b4"), _m("db_bloq_cq_med", "Médio (CQ)", key="b5"), _m("db_bloq_cq_alt", "Alto (CQ)", key="b6")]]),
+    Category("Receções", "👐 2. DEFESA DE BALIZA: RECEÇÕES", [
+        [_m("db_rec_sq_med", "Médio (SQ)", key="r1"), _m("db_rec_sq_alt", "Alto (SQ)", key="r2")],
+        [_m("db_rec_cq_rast", "Rasteiro (CQ)", key="r3"), _m("db_rec_cq_med", "Médio (CQ)", key="r4"),
+         _m("db_rec_cq_alt", "Alto (CQ)", key="r5"), _m("db_rec_cq_varr", "Varrimento", key="r6")]]),
+    Category("Desvios", "🧤 3. DEFESA DE BALIZA: DESVIOS", [
+        [_m("db_desv_sq_pe", "Pé", key="d1"), _m("db_desv_sq_mfr", "Médio Frontal", key="d2"), _m("db_desv_sq_mlat", "Médio Lateral", key="d3"),
+         _m("db_desv_sq_a1", "Alto 1 Mão", key="d4"), _m("db_desv_sq_a2", "Alto 2 Mãos", key="d5")],
+        [_m("db_desv_cq_varr", "Varrimento", key="d6"), _m("db_desv_cq_r1", "Rasteiro 1 Mão", key="d7"), _m("db_desv_cq_r2", "Rasteiro 2 Mãos", key="d8"),
+         _m("db_desv_cq_a1", "Alto 1 Mão (CQ)", key="d9"), _m("db_desv_cq_a2", "Alto 2 Mãos (CQ)", key="d10")]]),
+    Category("Extensão/Voo", "✈️ 4. DEFESA DE BALIZA: EXTENSÃO E VOO", [
+        [_m("db_ext_rec", "Ext. Receção", key="e1"), _m("db_ext_desv_1", "Ext. Desvio 1", key="e2"), _m("db_ext_desv_2", "Ext. Desvio 2", key="e3")],
+        [_m("db_voo_rec", "Voo Receção", key="v1"), _m("db_voo_desv_1", "Voo Desvio 1", key="v2"), _m("db_voo_desv_2", "Voo Desvio 2", key="v3"),
+         _m("db_voo_desv_mc", "Voo Mão Contrária", key="v4")]]),
+    Category("Defesa do Espaço", "🚀 5. DEFESA DO ESPAÇO", [
+        [_m("de_cabeca", "Cabeceamento"), _m("de_carrinho", "Carrinho"), _m("de_alivio", "Alívio"), _m("de_rececao", "Receção")]]),
+    Category("Duelos", "⚔️ 6. DUELOS (1x1)", [
+        [_m("duelo_parede", "Parede"), _m("duelo_abafo", "Abafo"), _m("duelo_estrela", "Estrela"), _m("duelo_frontal", "Frontal")]]),
+    Category("Distribuição", "🎯 7. DISTRIBUIÇÃO (TÁTICA)", [
+        [_m("pa_curto_1", "Passe Curto 1T", 50), _m("pa_curto_2", "Passe Curto 2T", 50), _m("pa_longo_1", "Passe Longo 1T", 50),
+         _m("pa_longo_2", "Passe Longo 2T", 50), _m("dist_curta_mao", "Mão Curta", 50), _m("dist_longa_mao", "Mão Longa", 50),
+         _m("dist_picada_mao", "Mão Picada", 50), _m("dist_volley", "Volley", 50), _m("dist_curta_pe", "Pé Curta", 50),
+         _m("dist_longa_pe", "Pé Longa", 50)]]),
+    Category("ETO", "⚽ 8. ESQUEMAS TÁTICOS OFENSIVOS", [
+        [_m("eto_pb_curto", "Pontapé Baliza Curto", 50), _m("eto_pb_medio", "Pontapé Baliza Meia Distância", 50),
+         _m("eto_pb_longo", "Pontapé Baliza Longo", 50)]]),
+    Category("Cruzamentos", "🥅 9. CRUZAMENTOS", [
+        [_m("cruz_rec_alta", "Cruz. Receção", 50), _m("cruz_soco_1", "Cruz. Soco 1", 50), _m("cruz_soco_2", "Cruz. Soco 2", 50),
+         _m("cruz_int_rast", "Cruz. Interceção", 50)]]),
+]
+
+MATCH_METRICS = [m for cat in METRIC_CATEGORIES for col in cat.columns for m in col]
+METRICS_BY_CODE = {m.code: m for m in MATCH_METRICS}
+# Contadores por categoria (usado pela análise)
+MATCH_CATEGORIES = {cat.name: [m.code for col in cat.columns for m in col] for cat in METRIC_CATEGORIES}
+METRIC_COLUMNS = [m.code for m in MATCH_METRICS]
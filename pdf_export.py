@@ -0,0 +1,257 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from fpdf import FPDF
+
+import perf
+from queries import load_training_range
+
+# ==========================================
+# FICHA DE TREINO EM PDF
+# ==========================================
+class PDF(FPDF):
+    def header(self):
+        self.set_font('Helvetica', 'B', 16)
+        self.cell(0, 10, 'GK MANAGER PRO - FICHA DE TREINO', 0, 1, 'C')
+        self.ln(5)
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Helvetica', 'I', 8)
+        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+
+def create_training_pdf(user, session_info, athletes, drills_config, drills_details_df):
+    with perf.section('pdf'):
+        pdf = PDF()
+        add_training_session(pdf, user, session_info, athletes, drills_config, drills_details_df)
+        # CORREÇÃO 3: Retornar bytes diretamente (sem encode) para evitar erro do PDF
+        return bytes(pdf.output())
+
+def add_training_session(pdf, user, session_info, athletes, drills_config, drills_details_df):
+    # Acrescenta uma ficha completa ao documento (permite juntar várias sessões num só PDF)
+    pdf.add_page()
+    pdf.set_font("Helvetica", size=12)
+    pdf.set_fill_color(240, 240, 240)
+    pdf.cell(0, 10, txt=f"Treinador: {user}", ln=1, align='L')
+    pdf.cell(0, 10, txt=f"Data: {session_info['start_date']} | Tipo: {session_info['type']}", ln=1, align='L', fill=True)
+    pdf.cell(0, 10, txt=f"Foco Principal: {session_info['title']}", ln=1, align='L')
+    pdf.ln(5)
+    
+    pdf.set_font("Helvetica", 'B', 14)
+    pdf.cell(0, 10, "Lista de Presencas", ln=1)
+    pdf.set_font("Helvetica", 'B', 10)
+    pdf.cell(80, 10, "Nome do Atleta", 1)
+    pdf.cell(30, 10, "Presenca", 1)
+    pdf.cell(30, 10, "Obs", 1)
+    pdf.ln()
+    pdf.set_font("Helvetica", size=10)
+    if not athletes.empty:
+        for _, row in athletes.iterrows():
+            pdf.cell(80, 10, f"{row['name']} ({row['status']})", 1)
+            pdf.cell(30, 10, "[   ]", 1)
+            pdf.cell(30, 10, "", 1)
+            pdf.ln()
+    else: pdf.cell(0, 10, "Sem atletas registados", 1, 1)
+    pdf.ln(10)
+    
+    pdf.add_page()
+    pdf.set_font("Helvetica", 'B', 16)
+    pdf.cell(0, 10, "Plano de Exercicios", ln=1, align='C')
+    pdf.ln(5)
+    
+    if drills_config:
+        for i, config in enumerate(drills_config):
+            title = config['title']
+            if 'exercise_id' in config: details = drills_details_df[drills_details_df['id'] == config['exercise_id']]
+            else: details = drills_details_df[drills_details_df['title'] == title]
+            if not details.empty:
+                row = details.iloc[0]
+                pdf.set_font("Helvetica", 'B', 14)
+                pdf.set_fill_color(230, 230, 250)
+                pdf.cell(0, 10, f"Ex {i+1}: {title}", 1, 1, 'L', fill=True)
+                
+                pdf.set_font("Helvetica", 'B', 10)
+                pdf.set_fill_color(255, 255, 224) 
+                load_text = f"Series: {config.get('sets','-')} | Repeticoes: {config.get('reps','-')} | Tempo: {config.get('time','-')}"
+                pdf.cell(0, 8, load_text, 1, 1, 'L', fill=True)
+                
+                pdf.set_font("Helvetica", size=10)
+                pdf.write(5, f"Momento: {row['moment']} | Tipo: {row['training_type']}")
+                if row['space']: pdf.write(5, f" | Espaco: {row['space']}")
+                pdf.ln(6)
+                if row['objective']: 
+                    pdf.set_font("Helvetica", 'B', 10); pdf.write(5, "Objetivo: ")
+                    pdf.set_font("Helvetica", '', 10); pdf.write(5, f"{row['objective']}"); pdf.ln(6)
+                if row['materials']: 
+                    pdf.set_font("Helvetica", 'B', 10); pdf.write(5, "Material: ")
+                    pdf.set_font("Helvetica", '', 10); pdf.write(5, f"{row['materials']}"); pdf.ln(6)
+                pdf.ln(2)
+                if row['image']:
+                    # Embebida diretamente da memória; o fpdf2 indexa as imagens pelo conteúdo,
+                    # por isso a mesma imagem repetida na ficha só é incluída uma vez
+                    try:
+                        pdf.image(io.BytesIO(row['image']), x=10, w=100)
+                        pdf.ln(5)
+                    except Exception: pass
+                pdf.set_font("Helvetica", 'B', 11)
+                pdf.cell(0, 8, "Descricao / Processo:", 0, 1)
+                pdf.set_font("Helvetica", size=10)
+                pdf.multi_cell(0, 6, row['description'])
+                pdf.ln(10)
+                if pdf.get_y() > 240: pdf.add_page()
+    else: pdf.cell(0, 10, "Sem exercicios.", 0, 1)
+
+# ==========================================
+# CACHE DE PDFs (ENDEREÇADA POR CONTEÚDO)
+# ==========================================
+# O módulo só é importado uma vez por processo, por isso a cache sobrevive aos reruns do Streamlit
+PDF_CACHE_MAX_ENTRIES = 32
+PDF_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+class PDFCache:
+    def __init__(self, max_entries=PDF_CACHE_MAX_ENTRIES, max_bytes=PDF_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._data.get(key)
+            if data is not None: self._data.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None: self._bytes -= len(old)
+            self._data[key] = data
+            self._bytes += len(data)
+            # Evicção LRU por número de entradas e por tamanho total
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+pdf_cache = PDFCache()
+
+def _exercise_version(row):
+    # Versão do exercício = hash de todos os campos que entram no PDF (a imagem entra pelo seu content_hash)
+    h = hashlib.sha256()
+    for col in ('id', 'title', 'moment', 'training_type', 'description', 'objective', 'materials', 'space'):
+        h.update(str(row[col]).encode()); h.update(b'\x1f')
+    h.update(str(row['image_hash']).encode())
+    return h.hexdigest()
+
+def training_pdf_key(user, session_info, athletes, drills_config, drills_details_df):
+    h = hashlib.sha256()
+    parts = [user, session_info['id'], session_info['start_date'], session_info['type'], session_info['title'],
+             json.dumps(drills_config, sort_keys=True)]
+    for p in parts:
+        h.update(str(p).encode()); h.update(b'\x1e')
+    if not athletes.empty:
+        for _, row in athletes.iterrows():
+            h.update(f"{row['name']}\x1f{row['status']}\x1e".encode())
+    h.update(b'\x1d')
+    if not drills_details_df.empty:
+        for v in sorted(_exercise_version(row) for _, row in drills_details_df.iterrows()):
+            h.update(v.encode())
+    return h.hexdigest()
+
+def cached_training_pdf(key, user, session_info, athletes, drills_config, drills_details_df):
+    data = pdf_cache.get(key)
+    if data is None:
+        data = create_training_pdf(user, session_info, athletes, drills_config, drills_details_df)
+        pdf_cache.put(key, data)
+    return data
+
+# ==========================================
+# EXPORTAÇÃO EM LOTE (SEMANA / PERÍODO)
+# ==========================================
+# Layout FPDF e imagens são CPU-bound: as fichas do ZIP de um período (mais de uma semana) são geradas
+# num pool de processos. Uma semana (até 7 fichas, ~50 ms cada) fica sempre em série: mesmo com o pool
+# já arrancado pouparia no máximo umas décimas de segundo, e arrancar os workers (spawn) custa mais
+# (~1,6 s para 2 workers, medido numa máquina de 1 CPU). Nunca há mais workers do que CPUs.
+# Cada PDF é escrito no destino assim que fica pronto e descartado, em vez de ficarem todos em memória.
+EXPORT_MAX_WORKERS = max(1, min(4, (os.cpu_count() or 1)))
+EXPORT_POOL_MIN_SESSIONS = 8
+
+def _export_tasks(user, data):
+    for _, s in data.sessions.iterrows():
+        drills_config = data.drills[int(s['id'])]
+        details = data.exercises[data.exercises['id'].isin([d['exercise_id'] for d in drills_config])]
+        yield (user, s.to_dict(), data.roster, drills_config, details)
+
+def _render_task(task):
+    user, session_info, athletes, drills_config, details = task
+    t0 = time.perf_counter()
+    pdf_data = create_training_pdf(user, session_info, athletes, drills_config, details)
+    return f"Treino_{session_info['start_date']}_{session_info['id']}.pdf", pdf_data, time.perf_counter() - t0
+
+def export_training_pdfs(user, start_date, end_date, out, mode='zip', workers=None, progress=None):
+    # Escreve em `out` (ficheiro ou buffer) e devolve o tempo de geração de cada documento;
+    # progress(fração, mensagem) é chamado a cada documento (trabalhos em segundo plano)
+    data = load_training_range(user, start_date, end_date)
+    timings = []
+    total = len(data.sessions)
+    def done():
+        if progress: progress(len(timings) / max(1, total), f"{len(timings)} de {total} fichas")
+    if mode == 'pdf':
+        # PDF único: as fichas vão todas para o mesmo documento, numa só passagem
+        pdf = PDF()
+        for user_, session_info, athletes, drills_config, details in _export_tasks(user, data):
+            t0 = time.perf_counter()
+            add_training_session(pdf, user_, session_info, athletes, drills_config, details)
+            timings.append({'documento': f"{session_info['start_date']} | {session_info['title']}", 'segundos': time.perf_counter() - t0})
+            done()
+        if data.sessions.empty: pdf.add_page(); pdf.cell(0, 10, "Sem sessoes de treino no periodo.", 0, 1)
+        out.write(bytes(pdf.output()))
+        return timings
+    workers = min(workers or EXPORT_MAX_WORKERS, os.cpu_count() or 1)
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_STORED) as zf:
+        def add(name, pdf_data, secs):
+            zf.writestr(name, pdf_data)
+            timings.append({'documento': name, 'segundos': secs})
+            done()
+        tasks = _export_tasks(user, data)
+        # Uma semana ou um só CPU: em série (ver EXPORT_POOL_MIN_SESSIONS)
+        if workers <= 1 or len(data.sessions) < EXPORT_POOL_MIN_SESSIONS:
+            for result in map(_render_task, tasks): add(*result)
+        else:
+            for result in _bounded_map(_export_pool(workers), _render_task, tasks, workers * 2): add(*result)
+    return timings
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def _export_pool(workers):
+    # Um pool por processo, reaproveitado entre exportações (o arranque dos workers é o custo maior)
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None: _pool.shutdown(wait=False)
+            # spawn: o processo do Streamlit tem várias threads, fork não é seguro
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+def _bounded_map(pool, fn, items, window):
+    # Como pool.map, mas com no máximo `window` documentos em curso/por escrever de cada vez
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window: yield pending.popleft().result()
+    while pending: yield pending.popleft().result()
@@ -0,0 +1,149 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# ==========================================
+# INSTRUMENTAÇÃO (TEMPOS POR RERUN)
+# ==========================================
+# Desligada por omissão: só há medições dentro de rerun(enabled=True), ligado pelo toggle de debug
+# na barra lateral ou por GK_PERF=1. Fora disso as ligações/cursores custam um getattr por chamada.
+PERF_ALWAYS_ON = os.environ.get('GK_PERF') == '1'
+PERF_LOG = os.environ.get('GK_PERF_LOG', 'gk_perf.log')
+PERF_HISTORY = 500  # reruns guardados por página para médias/p95
+
+_local = threading.local()
+
+class RerunStats:
+    def __init__(self):
+        self.page = None
+        self.queries = 0
+        self.sql_s = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.pdfs = 0
+        self.pdf_s = 0.0
+        self.sections = {}
+        self.total_s = 0.0
+
+    def as_dict(self):
+        return {'page': self.page, 'queries': self.queries, 'sql_ms': self.sql_s * 1000, 'rows': self.rows, 'bytes': self.bytes,
+                'pdfs': self.pdfs, 'pdf_ms': self.pdf_s * 1000, 'total_ms': self.total_s * 1000,
+                **{f"{k}_ms": v * 1000 for k, v in self.sections.items()}}
+
+def current():
+    return getattr(_local, 'stats', None)
+
+def set_page(page):
+    s = current()
+    if s is not None: s.page = page
+
+@contextmanager
+def rerun(enabled=False):
+    # Envolve um rerun inteiro; devolve as medições (ou None quando desligado)
+    if not (enabled or PERF_ALWAYS_ON):
+        yield None; return
+    s = _local.stats = RerunStats()
+    t0 = time.perf_counter()
+    try: yield s
+    finally:
+        s.total_s = time.perf_counter() - t0
+        _local.stats = None
+        _record(s)
+
+@contextmanager
+def section(name):
+    # Tempo de um bloco (ex: 'pdf'); sem efeito fora de um rerun medido
+    s = current()
+    if s is None:
+        yield; return
+    t0 = time.perf_counter()
+    try: yield
+    finally:
+        dt = time.perf_counter() - t0
+        if name == 'pdf': s.pdfs += 1; s.pdf_s += dt
+        else: s.sections[name] = s.sections.get(name, 0.0) + dt
+
+def _row_bytes(rows):
+    # Estimativa do volume devolvido: tamanho de texto/BLOB, 8 bytes para números
+    return sum(len(v) if isinstance(v, (str, bytes)) else 8 for row in rows for v in row)
+
+# ==========================================
+# SQLITE: LIGAÇÃO E CURSOR MEDIDOS
+# ==========================================
+class TimedCursor(sqlite3.Cursor):
+    def _timed(self, fn, *args):
+        s = current()
+        if s is None: return fn(*args)
+        t0 = time.perf_counter()
+        try: return fn(*args)
+        finally: s.sql_s += time.perf_counter() - t0
+
+    def execute(self, *args):
+        s = current()
+        if s is not None: s.queries += 1
+        return self._timed(super().execute, *args)
+
+    def executemany(self, *args):
+        s = current()
+        if s is not None: s.queries += 1
+        return self._timed(super().executemany, *args)
+
+    def _fetched(self, rows):
+        s = current()
+        if s is not None: s.rows += len(rows); s.bytes += _row_bytes(rows)
+        return rows
+
+    def fetchall(self): return self._fetched(self._timed(super().fetchall))
+    def fetchmany(self, *args): return self._fetched(self._timed(super().fetchmany, *args))
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is not None: self._fetched([row])
+        return row
+
+    def __next__(self):
+        row = self._timed(super().__next__)
+        self._fetched([row])
+        return row
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor): return super().cursor(factory)
+    def execute(self, *args): return self.cursor().execute(*args)
+    def executemany(self, *args): return self.cursor().executemany(*args)
+
+# ==========================================
+# AGREGADOS E REGISTO EM FICHEIRO
+# ==========================================
+_history = {}
+_history_lock = threading.Lock()
+
+def _record(s):
+    with _history_lock:
+        _history.setdefault(s.page or '-', deque(maxlen=PERF_HISTORY)).append(s.as_dict())
+
+def summary():
+    # Por página: nº de reruns, média e p95 do tempo total, médias de queries/SQL/linhas/bytes/PDF
+    out = {}
+    with _history_lock: hist = {p: list(d) for p, d in _history.items()}
+    for page, runs in hist.items():
+        totals = sorted(r['total_ms'] for r in runs)
+        mean = lambda k: sum(r[k] for r in runs) / len(runs)
+        out[page] = {'reruns': len(runs), 'total_ms_mean': mean('total_ms'), 'total_ms_p95': totals[min(len(totals) - 1, int(len(totals) * 0.95))],
+                     'queries_mean': mean('queries'), 'sql_ms_mean': mean('sql_ms'), 'rows_mean': mean('rows'),
+                     'bytes_mean': mean('bytes'), 'pdf_ms_mean': mean('pdf_ms')}
+    return out
+
+def dump(path=None, extra=None):
+    # Acrescenta uma linha JSON com os agregados atuais (para análise offline)
+    rec = {'at': datetime.now().isoformat(timespec='seconds'), 'pid': os.getpid(), 'pages': summary()}
+    if extra: rec.update(extra)
+    with open(path or PERF_LOG, 'a', encoding='utf-8') as f: f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    return path or PERF_LOG
+
+def reset():
+    with _history_lock: _history.clear()
@@ -0,0 +1,346 @@
+import json
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from cache import query_cache, cached_query, cached_rows, cached_lookup
+from db import connection, snapshot
+from images import get_print_renditions
+
+# ==========================================
+# CONSULTAS DE LEITURA (VISTAS)
+# ==========================================
+def parse_drills(drills_str):
+    # Formato antigo (sessions.drills_list); usado apenas para migrar para session_drills
+    if not drills_str: return []
+    try: return json.loads(drills_str)
+    except:
+        titles = drills_str.split(", ")
+        return [{"title": t, "reps": "", "sets": "", "time": ""} for t in titles if t]
+
+# Catálogo sem BLOBs: as imagens (exercise_images) só são lidas quando são mesmo precisas
+EXERCISE_COLUMNS = "e.id, e.user_id, e.title, e.moment, e.training_type, e.description, e.objective, e.materials, e.space, i.content_hash AS image_hash"
+EXERCISE_FROM = "exercises e LEFT JOIN exercise_images i ON i.exercise_id = e.id"
+
+Week = namedtuple('Week', ['days', 'sessions', 'drills', 'exercises', 'roster'])
+
+def load_session_drills(conn, session_ids):
+    # {session_id: [{exercise_id, title, sets, reps, time}, ...]} pela ordem do plano
+    # (exercise_id None: título de um plano antigo sem exercício no catálogo)
+    ids = [int(i) for i in session_ids]
+    drills = {i: [] for i in ids}
+    if not ids: return drills
+    ph = ','.join('?' for _ in ids)
+    rows = conn.execute(f'''SELECT sd.session_id, sd.exercise_id, COALESCE(e.title, sd.title), sd.sets, sd.reps, sd.time
+                            FROM session_drills sd LEFT JOIN exercises e ON e.id = sd.exercise_id
+                            WHERE sd.session_id IN ({ph}) ORDER BY sd.session_id, sd.position''', ids).fetchall()
+    for sid, ex_id, title, sets, reps, tm in rows:
+        drills[sid].append({"exercise_id": ex_id, "title": title, "sets": sets or "", "reps": reps or "", "time": tm or ""})
+    return drills
+
+WEEK_TABLES = ('sessions', 'session_drills', 'exercises', 'exercise_images', 'goalkeepers')
+
+def load_week(user, start_date, days=7):
+    return query_cache.get_or_load(user, WEEK_TABLES, ('week', str(start_date), days), lambda: _load_week(user, start_date, days))
+
+def _load_week(user, start_date, days):
+    base = datetime.strptime(str(start_date), '%Y-%m-%d')
+    day_list = [(base + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+    with snapshot() as conn:
+        sess = pd.read_sql_query("SELECT * FROM sessions WHERE user_id=? AND start_date BETWEEN ? AND ? ORDER BY start_date, id",
+                                 conn, params=(user, day_list[0], day_list[-1]))
+        exercises = pd.read_sql_query(f"SELECT {EXERCISE_COLUMNS} FROM {EXERCISE_FROM} WHERE e.user_id=?", conn, params=(user,))
+        roster = pd.read_sql_query("SELECT name, status FROM goalkeepers WHERE user_id=?", conn, params=(user,))
+        drills = load_session_drills(conn, sess['id'])
+    # Índice em memória por dia (a primeira sessão do dia, como antes)
+    sessions = {}
+    for _, row in sess.iterrows(): sessions.setdefault(row['start_date'], row)
+    return Week(day_list, sessions, drills, exercises, roster)
+
+def load_exercise(user, exercise_id):
+    # Uma ficha (para o formulário de edição), sem carregar o catálogo inteiro
+    def load():
+        with connection() as conn:
+            df = pd.read_sql_query(f"SELECT {EXERCISE_COLUMNS} FROM {EXERCISE_FROM} WHERE e.user_id=? AND e.id=?", conn, params=(user, int(exercise_id)))
+        return df.iloc[0] if not df.empty else None
+    return query_cache.get_or_load(user, ('exercises', 'exercise_images'), ('exercise', int(exercise_id)), load)
+
+def load_session_plan(user, session_id):
+    def load():
+        with connection() as conn: return load_session_drills(conn, [session_id])[int(session_id)]
+    return query_cache.get_or_load(user, ('session_drills', 'exercises'), ('plan', int(session_id)), load)
+
+# Listas pequenas lidas a cada rerun: registos leves (cache.cached_lookup), sem DataFrame
+def load_goalkeeper_names(user):
+    # Registos (id, name); .by = {id: registo}
+    return cached_lookup(user, ('goalkeepers',), "SELECT id, name FROM goalkeepers WHERE user_id=? ORDER BY id", (user,))
+
+def load_microcycles(user):
+    # Do mais recente; .by = {título: registo} (títulos repetidos: o mais recente)
+    return cached_lookup(user, ('microcycles',), "SELECT id, title, start_date, goal, report FROM microcycles WHERE user_id=? ORDER BY start_date DESC",
+                         (user,), key='title')
+
+def load_games(user):
+    # Sessões de jogo do calendário, da mais recente; .by = {data: registo}
+    return cached_lookup(user, ('sessions',), "SELECT start_date, title FROM sessions WHERE user_id=? AND type='Jogo' ORDER BY start_date DESC",
+                         (user,), key='start_date')
+
+def load_day_session(user, date):
+    # Primeira sessão do dia (ou None)
+    rows = cached_rows(user, ('sessions',), "SELECT * FROM sessions WHERE user_id=? AND start_date=? ORDER BY id", (user, str(date)))
+    return rows[0] if rows else None
+
+def load_day_ratings(user, date):
+    # {gk_id: registo (gk_id, rating, notes)} das notas já dadas nesse dia
+    return cached_lookup(user, ('training_ratings',), "SELECT gk_id, rating, notes FROM training_ratings WHERE user_id=? AND date=?",
+                         (user, str(date)), key='gk_id').by
+
+# Calendário: só a janela do mês visível, com margem para os dias das semanas vizinhas que a grelha mostra
+CALENDAR_MARGIN_DAYS = 7
+CALENDAR_TABLES = ('sessions', 'matches', 'microcycles')
+CALENDAR_SQL = """
+    SELECT title, start_date AS start, start_date AS "end", 'auto' AS display,
+           CASE type WHEN 'Jogo' THEN '#d9534f' WHEN 'Descanso' THEN '#28a745' ELSE '#3788d8' END AS backgroundColor
+      FROM sessions WHERE user_id=? AND start_date BETWEEN ? AND ?
+    UNION ALL
+    SELECT '🏁 ' || COALESCE(NULLIF(opponent, ''), 'Jogo') || CASE WHEN COALESCE(result, '') <> '' THEN ' (' || result || ')' ELSE '' END,
+           date, date, 'auto', '#8b1e1e'
+      FROM matches WHERE user_id=? AND date BETWEEN ? AND ?
+    UNION ALL
+    SELECT title, start_date, date(start_date, '+7 days'), 'background', '#f0ad4e'
+      FROM microcycles WHERE user_id=? AND start_date BETWEEN date(?, '-6 days') AND ?"""
+
+def load_calendar_month(user, year, month):
+    # Eventos do mês (sessões, fichas de jogo e microciclos em fundo) já no formato do FullCalendar
+    def load():
+        first = datetime(year, month, 1)
+        last = datetime(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+        lo = (first - timedelta(days=CALENDAR_MARGIN_DAYS)).strftime('%Y-%m-%d')
+        hi = (last + timedelta(days=CALENDAR_MARGIN_DAYS)).strftime('%Y-%m-%d')
+        with snapshot() as conn:
+            ev = pd.read_sql_query(CALENDAR_SQL, conn, params=(user, lo, hi) * 3)
+        ev['title'] = ev['title'].fillna('')
+        return ev.to_dict('records')
+    return query_cache.get_or_load(user, CALENDAR_TABLES, ('calendar', year, month), load)
+
+def attach_exercise_images(details_df):
+    # Acrescenta a coluna image (versão de impressão) apenas às linhas pedidas, para gerar PDFs
+    details = details_df.copy()
+    images = get_print_renditions(details['id'])
+    details['image'] = [images[int(i)][1] if int(i) in images else None for i in details['id']]
+    return details
+
+ExportData = namedtuple('ExportData', ['sessions', 'drills', 'exercises', 'roster'])
+
+def load_training_range(user, start_date, end_date):
+    # Todas as sessões de treino do período + exercícios usados (com imagem de impressão) + plantel
+    with snapshot() as conn:
+        sess = pd.read_sql_query("SELECT * FROM sessions WHERE user_id=? AND type='Treino' AND start_date BETWEEN ? AND ? ORDER BY start_date, id",
+                                 conn, params=(user, str(start_date), str(end_date)))
+        exercises = pd.read_sql_query(f"SELECT {EXERCISE_COLUMNS} FROM {EXERCISE_FROM} WHERE e.user_id=?", conn, params=(user,))
+        roster = pd.read_sql_query("SELECT name, status FROM goalkeepers WHERE user_id=?", conn, params=(user,))
+        drills = load_session_drills(conn, sess['id'])
+    used = {d['exercise_id'] for ds in drills.values() for d in ds}
+    exercises = attach_exercise_images(exercises[exercises['id'].isin(used)])
+    return ExportData(sess, drills, exercises, roster)
+
+def load_drill_usage(user):
+    # Quantas sessões usaram cada exercício e quando foi a última (junção indexada por exercise_id)
+    def load():
+        with connection() as conn:
+            rows = conn.execute('''SELECT sd.exercise_id, COUNT(DISTINCT sd.session_id), MAX(s.start_date)
+                                    FROM session_drills sd JOIN sessions s ON s.id = sd.session_id
+                                    WHERE s.user_id=? AND sd.exercise_id IS NOT NULL GROUP BY sd.exercise_id''', (user,)).fetchall()
+        return {ex_id: (n, last) for ex_id, n, last in rows}
+    return query_cache.get_or_load(user, ('sessions', 'session_drills'), 'drill_usage', load)
+
+# Pesquisa no catálogo (exercises_fts): pesos do bm25 por coluna, o título conta mais
+SEARCH_WEIGHTS = (10.0, 2.0, 4.0, 1.0, 1.0)  # title, description, objective, materials, space
+SearchPage = namedtuple('SearchPage', ['rows', 'total', 'page', 'page_size'])
+
+def fts_query(text):
+    # Cada palavra vira um prefixo entre aspas ("defe"* encontra "defesa"); todas têm de aparecer
+    words = [w.replace('"', '') for w in str(text).split()]
+    return " ".join(f'"{w}"*' for w in words if w)
+
+def search_exercises(user, text="", moment=None, training_type=None, page=0, page_size=20):
+    # Resultados ordenados por relevância (ou por título sem texto), só a página pedida e sem BLOBs
+    match = fts_query(text)
+    where, params = ["e.user_id=?"], [user]
+    if moment: where.append("e.moment=?"); params.append(moment)
+    if training_type: where.append("e.training_type=?"); params.append(training_type)
+    if match:
+        source = "exercises_fts f JOIN exercises e ON e.id = f.rowid LEFT JOIN exercise_images i ON i.exercise_id = e.id"
+        where.insert(0, "exercises_fts MATCH ?"); params.insert(0, match)
+        order = f"bm25(exercises_fts, {', '.join(map(str, SEARCH_WEIGHTS))}), e.id"
+    else: source, order = EXERCISE_FROM, "e.title COLLATE NOCASE, e.id"
+    cond = " AND ".join(where)
+    def load():
+        with snapshot() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM {source} WHERE {cond}", params).fetchone()[0]
+            rows = pd.read_sql_query(f"SELECT {EXERCISE_COLUMNS} FROM {source} WHERE {cond} ORDER BY {order} LIMIT ? OFFSET ?",
+                                     conn, params=(*params, page_size, page * page_size))
+        return SearchPage(rows, total, page, page_size)
+    return query_cache.get_or_load(user, ('exercises', 'exercise_images'), ('search', match, moment, training_type, page, page_size), load)
+
+def load_match(user, date):
+    # Ficha do dia para o formulário: (cabeçalho ou None, {métrica: valor})
+    def load():
+        with snapshot() as conn:
+            cur = conn.execute("SELECT id, opponent, gk_id, goals_conceded, saves, result, report, rating FROM matches WHERE user_id=? AND date=?", (user, date))
+            row = cur.fetchone()
+            if row is None: return None, {}
+            header = dict(zip([d[0] for d in cur.description], row))
+            return header, dict(conn.execute("SELECT metric, value FROM match_stats WHERE match_id=?", (row[0],)).fetchall())
+    return query_cache.get_or_load(user, ('matches', 'match_stats'), ('match', date), load)
+
+def load_match_events(match_id):
+    # Registo do jogo (mais recente primeiro), lido sempre da base de dados: muda a cada ação
+    with connection() as conn:
+        return pd.read_sql_query("SELECT id, minute, metric, gk_id, delta, created_at FROM match_events WHERE match_id=? ORDER BY id DESC",
+                                 conn, params=(int(match_id),))
+
+# ==========================================
+# ESCRITAS
+# ==========================================
+def save_session_drills(c, session_id, drills):
+    # Substitui o plano da sessão; corre dentro da transação de quem guarda a sessão.
+    # Entradas sem exercise_id (títulos de planos antigos) guardam o título
+    c.execute("DELETE FROM session_drills WHERE session_id=?", (session_id,))
+    c.executemany("INSERT INTO session_drills (session_id, exercise_id, position, sets, reps, time, title) VALUES (?,?,?,?,?,?,?)",
+                  [(session_id, None if d.get('exercise_id') is None else int(d['exercise_id']), pos, d.get('sets', ''), d.get('reps', ''),
+                    d.get('time', ''), d.get('title') if d.get('exercise_id') is None else None)
+                   for pos, d in enumerate(drills)])
+
+RATINGS_UPSERT = """INSERT INTO training_ratings (user_id, date, gk_id, rating, notes) VALUES (?,?,?,?,?)
+                    ON CONFLICT(user_id, date, gk_id) DO UPDATE SET rating=excluded.rating, notes=excluded.notes"""
+
+def upsert_training_ratings(c, user, rows):
+    # rows: (date, gk_id, rating, notes); um único executemany dentro da transação de quem chama
+    c.executemany(RATINGS_UPSERT, [(user, d, int(gid), int(r), n or "") for d, gid, r, n in rows])
+
+def parse_ratings_csv(buf, names):
+    # CSV com colunas date, rating, notes (opcional) e gk_id ou goalkeeper (nome); names = {id: nome} dos atletas.
+    # Devolve as linhas válidas para upsert_training_ratings e a lista de erros por linha
+    df = pd.read_csv(buf, dtype=str, keep_default_na=False)
+    df.columns = [c.strip().lower() for c in df.columns]
+    missing = {'date', 'rating'} - set(df.columns)
+    if missing: return [], [f"Colunas em falta: {', '.join(sorted(missing))}"]
+    if 'gk_id' not in df.columns and 'goalkeeper' not in df.columns: return [], ["Falta a coluna gk_id ou goalkeeper"]
+    by_name = {str(n).strip().lower(): i for i, n in names.items()}
+    dates = pd.to_datetime(df['date'].str.strip(), errors='coerce')
+    ratings = pd.to_numeric(df['rating'].str.strip(), errors='coerce')
+    rows, errors = [], []
+    for i, rec in enumerate(df.to_dict('records')):
+        line = i + 2
+        gid = rec.get('gk_id', '').strip()
+        gid = int(gid) if gid.isdigit() else by_name.get(rec.get('goalkeeper', '').strip().lower())
+        if gid not in names: errors.append(f"Linha {line}: guarda-redes desconhecido"); continue
+        if pd.isna(dates.iloc[i]): errors.append(f"Linha {line}: data inválida"); continue
+        r = ratings.iloc[i]
+        if pd.isna(r) or not 1 <= r <= 10: errors.append(f"Linha {line}: nota fora de 1-10"); continue
+        rows.append((dates.iloc[i].strftime("%Y-%m-%d"), gid, int(round(r)), rec.get('notes', '').strip()))
+    return rows, errors
+
+MATCH_UPSERT = """INSERT INTO matches (user_id, date, opponent, gk_id, goals_conceded, saves, result, report, rating) VALUES (?,?,?,?,?,?,?,?,?)
+                  ON CONFLICT(user_id, date) DO UPDATE SET opponent=excluded.opponent, gk_id=excluded.gk_id,
+                      goals_conceded=excluded.goals_conceded, saves=excluded.saves, result=excluded.result,
+                      report=excluded.report, rating=excluded.rating, version=matches.version + 1
+                  RETURNING id"""
+
+def save_match(c, user, date, header, stats):
+    # Uma ficha por dia: o cabeçalho é atualizado no lugar (o id mantém-se) e só os contadores
+    # diferentes de 0 ficam em match_stats; métricas do registo que voltaram a 0 são apagadas
+    match_id = c.execute(MATCH_UPSERT, (user, date, header['opponent'], header['gk_id'], header['goals_conceded'],
+                                        header['saves'], header['result'], header['report'], header['rating'])).fetchone()[0]
+    c.executemany("""INSERT INTO match_stats (match_id, metric, value) VALUES (?,?,?)
+                     ON CONFLICT(match_id, metric) DO UPDATE SET value=excluded.value""",
+                  [(match_id, code, int(v)) for code, v in stats.items() if v])
+    c.executemany("DELETE FROM match_stats WHERE match_id=? AND metric=?", [(match_id, code) for code, v in stats.items() if not v])
+    # Totais absolutos: os eventos ao vivo registados até aqui ficam incluídos (não voltam a ser somados)
+    c.execute("UPDATE matches SET events_applied=(SELECT COALESCE(MAX(id), 0) FROM match_events WHERE match_id=?) WHERE id=?", (match_id, match_id))
+    return match_id
+
+# Jogo ao vivo: cada ação é um INSERT em match_events; os contadores (match_stats e, para defesas/golos,
+# o cabeçalho de matches) são derivados do registo por apply_match_events, que só soma os eventos novos.
+# Anular uma ação é acrescentar o evento contrário (delta -1): o registo nunca é alterado.
+LIVE_HEADER_COUNTERS = ('saves', 'goals_conceded')
+
+def ensure_match(c, user, date, opponent, gk_id):
+    # Ficha do dia (criada vazia na primeira ação ao vivo); devolve (id, gk_id da ficha).
+    # Uma ficha tem um só guarda-redes (contadores e análise contam por matches.gk_id): as ações ao vivo
+    # ficam no da ficha; o escolhido só é usado se a ficha ainda não tiver nenhum
+    c.execute("""INSERT INTO matches (user_id, date, opponent, gk_id) VALUES (?,?,?,?)
+                 ON CONFLICT(user_id, date) DO UPDATE SET gk_id=excluded.gk_id WHERE COALESCE(matches.gk_id, 0) = 0""",
+              (user, date, opponent, gk_id))
+    return c.execute("SELECT id, gk_id FROM matches WHERE user_id=? AND date=?", (user, date)).fetchone()
+
+def log_match_event(c, match_id, minute, metric, gk_id, delta=1):
+    c.execute("INSERT INTO match_events (match_id, minute, metric, gk_id, delta, created_at) VALUES (?,?,?,?,?,datetime('now'))",
+              (match_id, int(minute), metric, gk_id, int(delta)))
+
+def pending_match_events(conn, match_id):
+    return conn.execute("""SELECT COUNT(*) FROM match_events e JOIN matches m ON m.id = e.match_id
+                           WHERE e.match_id=? AND e.id > m.events_applied""", (match_id,)).fetchone()[0]
+
+def apply_match_events(c, match_id):
+    # Soma aos contadores os eventos ainda não aplicados; devolve quantos foram
+    rows = c.execute("""SELECT e.metric, SUM(e.delta), MAX(e.id), COUNT(*) FROM match_events e JOIN matches m ON m.id = e.match_id
+                        WHERE e.match_id=? AND e.id > m.events_applied GROUP BY e.metric""", (match_id,)).fetchall()
+    if not rows: return 0
+    for metric, delta, _, _ in rows:
+        if metric in LIVE_HEADER_COUNTERS:
+            c.execute(f"UPDATE matches SET {metric}=MAX(0, COALESCE({metric}, 0) + ?) WHERE id=?", (delta, match_id))
+    c.executemany("""INSERT INTO match_stats (match_id, metric, value) VALUES (?,?,?)
+                     ON CONFLICT(match_id, metric) DO UPDATE SET value=value + excluded.value""",
+                  [(match_id, metric, delta) for metric, delta, _, _ in rows if metric not in LIVE_HEADER_COUNTERS and delta])
+    c.execute("DELETE FROM match_stats WHERE match_id=? AND value <= 0", (match_id,))
+    # version sobe: a análise de jogos (analytics) deteta a alteração
+    c.execute("UPDATE matches SET events_applied=?, version=version + 1 WHERE id=?", (max(r[2] for r in rows), match_id))
+    return sum(r[3] for r in rows)
+
+# Agregados das notas por atleta (semana, mês, microciclo), para a evolução e comparações do plantel
+ROLLUP_PERIODS = {
+    'week': "date(r.date, '-6 days', 'weekday 1')",
+    'month': "date(r.date, 'start of month')",
+    'micro': "m.start_date",
+}
+ROLLUP_SELECT = """
+    SELECT r.user_id, r.gk_id, ?, r.ps, COUNT(*), AVG(r.rating), MIN(r.rating), MAX(r.rating),
+           -- declive da reta de tendência (pontos por dia), com t = dias desde o início do período
+           (COUNT(*) * SUM(t * r.rating) - SUM(t) * SUM(r.rating)) / NULLIF(COUNT(*) * SUM(t * t) - SUM(t) * SUM(t), 0)
+      FROM (SELECT r.*, {start} AS ps, julianday(r.date) - julianday({start}) AS t
+              FROM training_ratings r {join} WHERE {where}) r
+     GROUP BY r.user_id, r.gk_id, r.ps"""
+MICRO_JOIN = "JOIN microcycles m ON m.user_id = r.user_id AND r.date BETWEEN m.start_date AND date(m.start_date, '+6 days')"
+
+def _period_starts(c, user, period, dates):
+    if period == 'week': return sorted({(d - timedelta(days=d.weekday())).strftime('%Y-%m-%d') for d in dates})
+    if period == 'month': return sorted({d.strftime('%Y-%m-01') for d in dates})
+    return sorted({r[0] for d in dates for r in c.execute(
+        "SELECT start_date FROM microcycles WHERE user_id=? AND ? BETWEEN start_date AND date(start_date, '+6 days')",
+        (user, d.strftime('%Y-%m-%d')))})
+
+def refresh_rating_rollups(c, user=None, dates=None):
+    # Recalcula, a partir das notas, só os períodos que contêm as datas indicadas;
+    # sem datas reconstrói tudo (do utilizador, ou de todos quando user é None)
+    for period, start in ROLLUP_PERIODS.items():
+        join = MICRO_JOIN if period == 'micro' else ""
+        if dates is None:
+            where, params = ("r.user_id=?", (user,)) if user is not None else ("1", ())
+            c.execute(f"DELETE FROM rating_rollups WHERE period=?{' AND user_id=?' if user is not None else ''}", (period,) + params)
+        else:
+            starts = _period_starts(c, user, period, [datetime.strptime(str(d)[:10], '%Y-%m-%d') for d in dates])
+            if not starts: continue
+            marks = ",".join("?" * len(starts))
+            c.execute(f"DELETE FROM rating_rollups WHERE user_id=? AND period=? AND period_start IN ({marks})", (user, period, *starts))
+            # O intervalo de datas deixa usar o índice (user_id, date); o IN fica com os períodos completos
+            where = f"r.user_id=? AND r.date BETWEEN ? AND date(?, '+1 month') AND {start} IN ({marks})"
+            params = (user, starts[0], starts[-1], *starts)
+        c.execute(f"INSERT INTO rating_rollups {ROLLUP_SELECT.format(start=start, join=join, where=where)}", (period,) + params)
+
+def load_rating_rollups(user, gk_id, period):
+    return cached_query(user, ('rating_rollups',),
+                        "SELECT period_start, n, avg_rating, min_rating, max_rating, slope FROM rating_rollups WHERE user_id=? AND gk_id=? AND period=? ORDER BY period_start",
+                        (user, int(gk_id), period))
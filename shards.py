@@ -0,0 +1,116 @@
+import argparse
+import os
+import sys
+import time
+
+from db import init_db, connection, transaction, default_shard, CATALOG_NAME
+
+# ==========================================
+# DIVIDIR A BASE DE DADOS ÚNICA EM SHARDS
+# ==========================================
+# Lê um ficheiro único (ex: gk_master_v35.db), cria em <pasta> o catálogo com as contas e um ficheiro
+# por treinador com os seus dados. Os ids mantêm-se (cada shard guarda só as linhas do seu utilizador),
+# por isso nada tem de ser remapeado. Depois basta arrancar a app com GK_SHARD_DIR=<pasta>.
+# Uso:
+#   python shards.py split gk_master_v35.db shards/
+#   python shards.py list shards/
+# O ficheiro original não é alterado (só migrado para o esquema atual).
+OWNED_TABLES = ['goalkeepers', 'exercises', 'microcycles', 'sessions', 'training_ratings', 'matches', 'rating_rollups']
+# Tabelas sem user_id: seguem a linha de que dependem
+CHILD_TABLES = [
+    ('exercise_images', 'exercise_id', 'exercises'),
+    ('session_drills', 'session_id', 'sessions'),
+    ('match_stats', 'match_id', 'matches'),
+    ('match_events', 'match_id', 'matches'),
+]
+
+def _columns(conn, schema, table):
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+def _copy_user(conn, user):
+    # Só as colunas que existem dos dois lados (bases antigas podem ter a ordem ou o conjunto diferentes)
+    counts = {}
+    for table in OWNED_TABLES:
+        cols = ', '.join(c for c in _columns(conn, 'main', table) if c in set(_columns(conn, 'src', table)))
+        counts[table] = conn.execute(f"INSERT INTO main.{table} ({cols}) SELECT {cols} FROM src.{table} WHERE user_id=?", (user,)).rowcount
+    for table, fk, parent in CHILD_TABLES:
+        cols = ', '.join(c for c in _columns(conn, 'main', table) if c in set(_columns(conn, 'src', table)))
+        counts[table] = conn.execute(f"""INSERT INTO main.{table} ({cols}) SELECT {cols} FROM src.{table}
+                                         WHERE {fk} IN (SELECT id FROM src.{parent} WHERE user_id=?)""", (user,)).rowcount
+    return counts
+
+def split(source, out_dir):
+    init_db(source)
+    os.makedirs(out_dir, exist_ok=True)
+    catalog = os.path.join(out_dir, CATALOG_NAME)
+    with connection(source) as conn:
+        accounts = conn.execute("SELECT username, password FROM users").fetchall()
+        owners = {u for t in OWNED_TABLES for (u,) in conn.execute(f"SELECT DISTINCT user_id FROM {t} WHERE user_id IS NOT NULL")}
+    with transaction(catalog) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT, shard TEXT)")
+        conn.executemany("INSERT OR REPLACE INTO users (username, password, shard) VALUES (?,?,?)",
+                         [(u, p, default_shard(u)) for u, p in accounts])
+
+    report = {}
+    for user in sorted({u for u, _ in accounts} | owners):
+        path = os.path.join(out_dir, default_shard(user))
+        if os.path.exists(path): raise FileExistsError(f"{path} já existe (dividir para uma pasta vazia)")
+        init_db(path)
+        with connection(path) as conn:
+            conn.execute("ATTACH DATABASE ? AS src", (source,))
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try: counts = _copy_user(conn, user)
+                except BaseException:
+                    conn.rollback(); raise
+                conn.commit()
+            finally: conn.execute("DETACH DATABASE src")
+            conn.execute("ANALYZE")
+        report[user] = (path, counts)
+    orphans = sorted(owners - {u for u, _ in accounts})
+    return catalog, report, orphans
+
+def check(source, report):
+    # Soma das linhas nos shards = linhas com dono no ficheiro original
+    missing = {}
+    with connection(source) as conn:
+        for table in OWNED_TABLES:
+            total = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE user_id IS NOT NULL").fetchone()[0]
+            copied = sum(counts[table] for _, counts in report.values())
+            if total != copied: missing[table] = total - copied
+    return missing
+
+# ==========================================
+# LINHA DE COMANDOS
+# ==========================================
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Dividir a base de dados do GK Manager num ficheiro por clube")
+    sub = p.add_subparsers(dest='cmd', required=True)
+    ps = sub.add_parser('split', help="criar o catálogo e um shard por utilizador")
+    ps.add_argument('source'); ps.add_argument('out_dir')
+    pl = sub.add_parser('list', help="listar as contas e os respetivos ficheiros")
+    pl.add_argument('out_dir')
+    args = p.parse_args(argv)
+
+    if args.cmd == 'list':
+        with connection(os.path.join(args.out_dir, CATALOG_NAME)) as conn:
+            for user, shard in conn.execute("SELECT username, shard FROM users ORDER BY username"):
+                shard = shard or default_shard(user)
+                size = os.path.getsize(os.path.join(args.out_dir, shard)) if os.path.exists(os.path.join(args.out_dir, shard)) else 0
+                print(f"  {user:<20} {shard:<50} {size / 1024:>8.0f} KB")
+        return 0
+
+    t0 = time.perf_counter()
+    catalog, report, orphans = split(args.source, args.out_dir)
+    print(f"{catalog}: {len(report)} shards a partir de {args.source}")
+    for user, (path, counts) in report.items():
+        print(f"  {user:<20} {os.path.basename(path):<50} " + " ".join(f"{t}={n}" for t, n in counts.items() if n))
+    if orphans: print(f"Aviso: dados sem conta no catálogo (sem login possível): {', '.join(orphans)}")
+    missing = check(args.source, report)
+    if missing:
+        print(f"ERRO: linhas por copiar {missing}"); return 1
+    print(f"  ({time.perf_counter() - t0:.2f}s) Arrancar com GK_SHARD_DIR={args.out_dir}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+from cache import query_cache
+from db import snapshot
+from metrics import MATCH_CATEGORIES
+
+# ==========================================
+# COMPARAÇÃO DO PLANTEL
+# ==========================================
+# (coluna, rótulo, maior é melhor)
+SQUAD_METRICS = [
+    ("height", "Altura", True), ("wingspan", "Envergadura", True),
+    ("arm_len_left", "Braço E", True), ("arm_len_right", "Braço D", True),
+    ("jump_front_2", "Salto Frontal 2", True), ("jump_front_l", "Salto Frontal E", True), ("jump_front_r", "Salto Frontal D", True),
+    ("jump_lat_l", "Salto Lateral E", True), ("jump_lat_r", "Salto Lateral D", True),
+    ("test_res", "Resistência", True), ("test_agil", "Agilidade (s)", False), ("test_vel", "Velocidade (s)", False),
+    ("train_avg", "Nota Treino", True), ("train_n", "Treinos Avaliados", True),
+    ("match_avg", "Nota Jogo", True), ("games", "Jogos", True),
+    ("goals_per_game", "Golos Sofridos/Jogo", False), ("saves_per_game", "Defesas/Jogo", True),
+] + [(f"cat_{i}", f"{name}/Jogo", True) for i, name in enumerate(MATCH_CATEGORIES)]
+SQUAD_LABELS = {col: label for col, label, _ in SQUAD_METRICS}
+SQUAD_TABLES = ('goalkeepers', 'rating_rollups', 'matches', 'match_stats')
+# Biometria e testes a 0 / vazios são "não medido"
+UNMEASURED_ZERO = [col for col, _, _ in SQUAD_METRICS[:12]]
+
+def _squad_sql():
+    cats = ",\n               ".join(
+        f"SUM(CASE WHEN s.metric IN ({', '.join(repr(m) for m in codes)}) THEN s.value ELSE 0 END) AS cat_{i}"
+        for i, codes in enumerate(MATCH_CATEGORIES.values()))
+    return f"""
+    WITH tr AS (SELECT gk_id, SUM(n) AS train_n, SUM(avg_rating * n) / SUM(n) AS train_avg
+                  FROM rating_rollups WHERE user_id=? AND period='month' GROUP BY gk_id),
+         mt AS (SELECT gk_id, COUNT(*) AS games, AVG(rating) AS match_avg,
+                       1.0 * SUM(goals_conceded) / COUNT(*) AS goals_per_game, 1.0 * SUM(saves) / COUNT(*) AS saves_per_game
+                  FROM matches WHERE user_id=? GROUP BY gk_id),
+         ms AS (SELECT m.gk_id,
+               {cats}
+                  FROM matches m JOIN match_stats s ON s.match_id = m.id WHERE m.user_id=? GROUP BY m.gk_id)
+    SELECT g.id, g.name, g.status, g.height, g.wingspan, g.arm_len_left, g.arm_len_right,
+           g.jump_front_2, g.jump_front_l, g.jump_front_r, g.jump_lat_l, g.jump_lat_r, g.test_res, g.test_agil, g.test_vel,
+           tr.train_avg, COALESCE(tr.train_n, 0) AS train_n, mt.match_avg, COALESCE(mt.games, 0) AS games,
+           mt.goals_per_game, mt.saves_per_game, ms.*
+      FROM goalkeepers g
+      LEFT JOIN tr ON tr.gk_id = g.id LEFT JOIN mt ON mt.gk_id = g.id LEFT JOIN ms ON ms.gk_id = g.id
+     WHERE g.user_id=? ORDER BY g.name"""
+
+class SquadComparison:
+    def __init__(self, raw):
+        cols = [c for c, _, _ in SQUAD_METRICS]
+        cat_cols = [c for c in cols if c.startswith("cat_")]
+        v = raw.reindex(columns=cols).apply(lambda s: pd.to_numeric(s.astype(str).str.replace(",", "."), errors='coerce'))
+        v[UNMEASURED_ZERO] = v[UNMEASURED_ZERO].mask(v[UNMEASURED_ZERO] <= 0)
+        v[cat_cols] = v[cat_cols].fillna(0).div(v["games"].where(v["games"] > 0), axis=0)
+        v.index = raw["name"].values
+        self.values = v
+        # Sentido de cada métrica: +1 maior é melhor, -1 menor é melhor (ranking, percentil e z-score orientados)
+        sign = np.array([1.0 if hib else -1.0 for _, _, hib in SQUAD_METRICS])
+        oriented = v * sign
+        self.ranks = oriented.rank(ascending=False, method='min')
+        self.percentiles = (oriented.rank(pct=True, method='average') * 100)
+        std = oriented.std(ddof=0).replace(0, np.nan)
+        self.zscores = (oriented - oriented.mean()) / std
+
+    def table(self, kind):
+        df = {"values": self.values, "ranks": self.ranks, "percentiles": self.percentiles, "zscores": self.zscores}[kind]
+        return df.dropna(axis=1, how='all').rename(columns=SQUAD_LABELS)
+
+    def overall(self):
+        # Índice global: média dos z-scores disponíveis de cada atleta
+        return self.zscores.mean(axis=1).sort_values(ascending=False)
+
+def load_squad(user):
+    def load():
+        with snapshot() as conn:
+            raw = pd.read_sql_query(_squad_sql(), conn, params=(user, user, user, user))
+        return SquadComparison(raw)
+    return query_cache.get_or_load(user, SQUAD_TABLES, 'squad', load)
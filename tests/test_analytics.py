@@ -0,0 +1,58 @@
+import pandas as pd
+
+import analytics
+import db
+from queries import save_match
+
+USER = "coach"
+
+def _save(date, gk_id, rating, saves=0, **stats):
+    header = {'opponent': "X", 'gk_id': gk_id, 'goals_conceded': 1, 'saves': saves, 'result': "1-1", 'report': "", 'rating': rating}
+    with db.transaction() as conn: save_match(conn.cursor(), USER, date, header, stats)
+    analytics.refresh_match(USER, date)
+
+def _rebuilt():
+    analytics._cache.clear()
+    return analytics.get_match_analytics(USER)
+
+def test_category_totals_sum_metric_columns(db_path):
+    _save("2025-09-01", 1, 5, db_bloq_sq_rast=2, db_bloq_cq_alt=1, eto_pb_longo=4)
+    an = analytics.get_match_analytics(USER)
+    assert an.category_totals().loc[1, "Bloqueios"] == 3
+    assert an.category_totals().loc[1, "ETO"] == 4
+    assert an.season_splits().index.tolist() == [(1, "2025/26")]
+
+def test_refresh_drops_rolling_series_of_saved_goalkeeper(db_path):
+    _save("2025-09-01", 1, 5)
+    an = analytics.get_match_analytics(USER)
+    assert an.rolling(1)["rating"].tolist() == [5.0]
+    _save("2025-09-08", 1, 9)
+    an = analytics.get_match_analytics(USER)
+    assert an.per_goalkeeper().loc[1, "Nota Média"] == 7.0
+    assert an.rolling(1)["rating"].tolist() == [5.0, 7.0]
+
+def test_refresh_matches_full_rebuild(db_path):
+    _save("2025-09-01", 1, 5, saves=3, db_bloq_sq_rast=2)
+    _save("2026-02-01", 2, 6, saves=1)
+    analytics.get_match_analytics(USER).rolling(2)
+    # Regravar a ficha com outro guarda-redes: sai dos agregados do 1 e entra nos do 2
+    _save("2025-09-01", 2, 8, saves=4, db_bloq_sq_rast=1)
+    an = analytics.get_match_analytics(USER)
+    full = _rebuilt()
+    pd.testing.assert_frame_equal(an.per_goalkeeper(), full.per_goalkeeper(), check_dtype=False)
+    pd.testing.assert_frame_equal(an.season_splits(), full.season_splits(), check_dtype=False)
+    pd.testing.assert_frame_equal(an.rolling(2), full.rolling(2), check_dtype=False)
+    assert 1 not in an.gk_sums.index
+
+def test_applied_live_events_reach_the_analysis(db_path):
+    from queries import ensure_match, log_match_event, apply_match_events
+    _save("2025-09-01", 1, 5, saves=3)
+    analytics.get_match_analytics(USER)
+    with db.transaction() as conn:
+        c = conn.cursor()
+        mid, _ = ensure_match(c, USER, "2025-09-01", "X", 1)
+        log_match_event(c, mid, 30, "saves", 1)
+        apply_match_events(c, mid)
+    # O mesmo que fold_match_events faz depois de aplicar
+    analytics.refresh_match(USER, "2025-09-01")
+    assert analytics.get_match_analytics(USER).per_goalkeeper().loc[1, "Defesas"] == 4
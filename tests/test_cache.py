@@ -0,0 +1,38 @@
+from cache import QueryCache
+
+def test_invalidate_drops_only_entries_of_that_user_and_table():
+    cache = QueryCache()
+    cache.get_or_load("u", ('sessions', 'session_drills'), "week", lambda: "w1")
+    cache.get_or_load("u", ('exercises',), "catalog", lambda: "c1")
+    cache.get_or_load("v", ('sessions',), "week", lambda: "v1")
+    cache.invalidate("u", 'session_drills')
+    assert cache.get_or_load("u", ('sessions', 'session_drills'), "week", lambda: "w2") == "w2"
+    assert cache.get_or_load("u", ('exercises',), "catalog", lambda: "c2") == "c1"
+    assert cache.get_or_load("v", ('sessions',), "week", lambda: "v2") == "v1"
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_entries=2)
+    cache.get_or_load("u", ('sessions',), "a", lambda: 1)
+    cache.get_or_load("u", ('sessions',), "b", lambda: 2)
+    cache.get_or_load("u", ('sessions',), "a", lambda: None)
+    cache.get_or_load("u", ('sessions',), "c", lambda: 3)
+    assert cache.get_or_load("u", ('sessions',), "b", lambda: "reloaded") == "reloaded"
+    assert cache.stats()['entries'] == 2
+
+def test_load_racing_an_invalidate_is_not_stored():
+    cache = QueryCache()
+    def loader():
+        # Uma escrita noutra thread invalida a tabela enquanto a leitura decorre
+        cache.invalidate("u", "sessions")
+        return "old"
+    assert cache.get_or_load("u", ('sessions',), "k", loader) == "old"
+    assert cache.get_or_load("u", ('sessions',), "k", lambda: "new") == "new"
+    assert cache.get_or_load("u", ('sessions',), "k", lambda: "other") == "new"
+
+def test_invalidate_of_other_user_or_table_does_not_block_store():
+    cache = QueryCache()
+    def loader():
+        cache.invalidate("v", "sessions"); cache.invalidate("u", "matches")
+        return 1
+    cache.get_or_load("u", ('sessions',), "k", loader)
+    assert cache.get_or_load("u", ('sessions',), "k", lambda: 2) == 1
@@ -0,0 +1,48 @@
+import os
+import time
+
+import pytest
+
+import db
+import jobs
+import queries
+from cache import cached_query
+
+USER = "coach"
+
+@pytest.fixture
+def gk_db(db_path):
+    with db.transaction() as conn: conn.execute("INSERT INTO goalkeepers (user_id, name) VALUES (?, 'GK')", (USER,))
+    yield db_path
+
+def _wait(job_id, timeout=60):
+    deadline = time.time() + timeout
+    while True:
+        job = jobs.get_job(USER, job_id)
+        if job.status not in jobs.ACTIVE or time.time() > deadline: return job
+        time.sleep(0.05)
+
+def test_export_result_is_spooled_to_a_file(gk_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_SPOOL_DIR", str(tmp_path / "spool"))
+    job = _wait(jobs.submit(USER, 'training_export', {'start': "2025-09-01", 'end': "2025-09-07", 'mode': 'pdf'}))
+    assert job.status == 'done' and job.result_size > 0
+    with db.connection() as conn:
+        path, = conn.execute("SELECT result_path FROM jobs WHERE id=?", (job.id,)).fetchone()
+    assert os.path.dirname(path) == jobs.JOB_SPOOL_DIR and os.path.getsize(path) == job.result_size
+    assert jobs.job_result(USER, job.id).startswith(b"%PDF")
+    assert jobs.job_result("other", job.id) is None
+
+def test_failed_import_batch_still_invalidates_committed_ones(gk_db, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_BATCH_SIZE", 1)
+    real = queries.upsert_training_ratings
+    calls = []
+    def flaky(c, user, rows):
+        calls.append(rows)
+        if len(calls) == 2: raise RuntimeError("disco cheio")
+        real(c, user, rows)
+    monkeypatch.setattr(queries, "upsert_training_ratings", flaky)
+    sql = "SELECT date, rating FROM training_ratings WHERE user_id=?"
+    assert cached_query(USER, ('training_ratings',), sql, (USER,)).empty
+    with pytest.raises(RuntimeError):
+        jobs._ratings_import(USER, {}, b"date,goalkeeper,rating\n2026-02-02,GK,8\n2026-02-03,GK,6\n", lambda *a: None, None)
+    assert cached_query(USER, ('training_ratings',), sql, (USER,))['date'].tolist() == ["2026-02-02"]
@@ -0,0 +1,71 @@
+import os
+import shutil
+import sqlite3
+
+import db
+
+def _tables(path):
+    with sqlite3.connect(path) as conn:
+        return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")}
+
+def test_legacy_file_is_migrated_in_place(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    shutil.copy(os.path.join(os.path.dirname(db.__file__), "gk_master_v34.db"), path)
+    with sqlite3.connect(path) as conn:
+        before = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ('sessions', 'matches', 'exercises')}
+    assert db.migrate(path) == [v for v, _, _ in db.MIGRATIONS]
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] == db.MIGRATIONS[-1][0]
+        assert {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in before} == before
+    assert 'idx_sessions_user_date' in _tables(path)
+    # Segunda passagem não volta a correr nada
+    assert db.migrate(path) == []
+
+def test_missing_columns_are_added(tmp_path):
+    path = str(tmp_path / "old.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE goalkeepers (id INTEGER PRIMARY KEY, user_id TEXT, name TEXT)")
+        conn.execute("INSERT INTO goalkeepers (user_id, name) VALUES ('coach', 'Rui')")
+    db.migrate(path)
+    with sqlite3.connect(path) as conn:
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(goalkeepers)")}
+        assert {'height', 'glove_size', 'test_vel'} <= cols
+        assert conn.execute("SELECT name FROM goalkeepers").fetchall() == [('Rui',)]
+
+def test_session_plans_move_to_session_drills(tmp_path):
+    path = str(tmp_path / "plans.db")
+    shutil.copy(os.path.join(os.path.dirname(db.__file__), "gk_master_v34.db"), path)
+    with sqlite3.connect(path) as conn:
+        conn.execute("INSERT INTO exercises (id, user_id, title) VALUES (9001, 'coach', 'Saídas')")
+        conn.execute("""INSERT INTO sessions (id, user_id, type, start_date, drills_list)
+                        VALUES (9001, 'coach', 'Treino', '2025-09-01', '[{"title": "Saídas", "sets": "3"}, {"title": "Apagado"}]')""")
+    db.migrate(path)
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute("SELECT exercise_id, position, sets, title FROM session_drills WHERE session_id=9001 ORDER BY position").fetchall()
+    # O título sem exercício no catálogo fica guardado em vez de se perder
+    assert rows == [(9001, 0, "3", None), (None, 1, "", "Apagado")]
+
+def test_duplicate_ratings_keep_the_newest(tmp_path):
+    path = str(tmp_path / "ratings.db")
+    shutil.copy(os.path.join(os.path.dirname(db.__file__), "gk_master_v34.db"), path)
+    with sqlite3.connect(path) as conn:
+        conn.executemany("INSERT INTO training_ratings (user_id, date, gk_id, rating) VALUES ('coach', '2025-09-01', 1, ?)", [(5,), (8,)])
+    db.migrate(path)
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT rating FROM training_ratings WHERE user_id='coach'").fetchall() == [(8,)]
+        indexes = {r[1] for r in conn.execute("PRAGMA index_list(training_ratings)")}
+    assert 'ux_ratings_user_date_gk' in indexes
+
+def test_wide_match_counters_move_to_match_stats(tmp_path):
+    path = str(tmp_path / "matches.db")
+    shutil.copy(os.path.join(os.path.dirname(db.__file__), "gk_master_v34.db"), path)
+    with sqlite3.connect(path) as conn:
+        conn.execute("INSERT INTO matches (user_id, date, opponent, rating, db_bloq_sq_rast, eto_pb_longo) VALUES ('coach', '2025-09-06', 'A', 5, 1, 0)")
+        conn.execute("INSERT INTO matches (user_id, date, opponent, rating, db_bloq_sq_rast, eto_pb_longo) VALUES ('coach', '2025-09-06', 'B', 7, 2, 3)")
+    db.migrate(path)
+    with sqlite3.connect(path) as conn:
+        # Duas fichas no mesmo dia: fica a mais recente, só com os contadores diferentes de 0
+        (mid, opponent), = conn.execute("SELECT id, opponent FROM matches WHERE user_id='coach'").fetchall()
+        stats = conn.execute("SELECT metric, value FROM match_stats WHERE match_id=? ORDER BY metric", (mid,)).fetchall()
+    assert opponent == 'B'
+    assert stats == [("db_bloq_sq_rast", 2), ("eto_pb_longo", 3)]
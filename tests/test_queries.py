@@ -0,0 +1,87 @@
+import io
+
+import db
+from queries import (upsert_training_ratings, parse_ratings_csv, save_match, search_exercises, load_exercise,
+                     ensure_match, log_match_event, pending_match_events, apply_match_events)
+
+USER = "coach"
+
+def _ratings():
+    with db.connection() as conn:
+        return conn.execute("SELECT date, gk_id, rating, notes FROM training_ratings WHERE user_id=? ORDER BY date, gk_id", (USER,)).fetchall()
+
+def test_ratings_upsert_keeps_one_row_per_goalkeeper_and_day(db_path):
+    with db.transaction() as conn: upsert_training_ratings(conn.cursor(), USER, [("2025-09-01", 1, 6, "ok"), ("2025-09-01", 2, 7, None)])
+    with db.transaction() as conn: upsert_training_ratings(conn.cursor(), USER, [("2025-09-01", 1, 9, "melhor")])
+    assert _ratings() == [("2025-09-01", 1, 9, "melhor"), ("2025-09-01", 2, 7, "")]
+
+def test_parse_ratings_csv_reports_bad_lines():
+    names = {1: "Rui", 2: "Ana"}
+    csv = "date,goalkeeper,gk_id,rating,notes\n2025-09-01,rui,,7,bom\n2025-09-02,,2,8.6,\n2025-09-03,Zé,,5,\n2025-13-01,Ana,,5,\n2025-09-04,Ana,,11,\n"
+    rows, errors = parse_ratings_csv(io.StringIO(csv), names)
+    assert rows == [("2025-09-01", 1, 7, "bom"), ("2025-09-02", 2, 9, "")]
+    assert errors == ["Linha 4: guarda-redes desconhecido", "Linha 5: data inválida", "Linha 6: nota fora de 1-10"]
+
+def _match(date, gk_id=1, rating=6, **stats):
+    header = {'opponent': "X", 'gk_id': gk_id, 'goals_conceded': 0, 'saves': 2, 'result': "1-0", 'report': "", 'rating': rating}
+    with db.transaction() as conn: return save_match(conn.cursor(), USER, date, header, stats)
+
+def test_save_match_updates_the_day_in_place(db_path):
+    first = _match("2025-09-06", db_bloq_sq_rast=2, de_cabeca=1)
+    again = _match("2025-09-06", rating=8, db_bloq_sq_rast=3, de_cabeca=0)
+    assert again == first
+    with db.connection() as conn:
+        assert conn.execute("SELECT rating, version FROM matches WHERE user_id=?", (USER,)).fetchall() == [(8, 2)]
+        # Contadores a 0 não ficam guardados
+        assert conn.execute("SELECT metric, value FROM match_stats WHERE match_id=?", (first,)).fetchall() == [("db_bloq_sq_rast", 3)]
+
+def _exercises(*rows):
+    with db.transaction() as conn:
+        conn.executemany("INSERT INTO exercises (user_id, title, moment, description) VALUES (?,?,?,?)", rows)
+
+def test_search_ranks_title_matches_first(db_path):
+    _exercises((USER, "Mergulho lateral", "Defesa de Baliza", "Receção após mergulho"),
+               (USER, "Saída aos pés", "Duelos", "Termina com mergulho"),
+               (USER, "Receção alta", "Cruzamento", "Bola alta ao segundo poste"),
+               ("other", "Mergulho", "Defesa de Baliza", ""))
+    res = search_exercises(USER, "mergul")
+    assert res.rows['title'].tolist() == ["Mergulho lateral", "Saída aos pés"]
+    # Sem acentos na pesquisa
+    assert search_exercises(USER, "rececao alta").rows['title'].tolist() == ["Receção alta"]
+    assert search_exercises(USER, "mergulho", moment="Duelos").rows['title'].tolist() == ["Saída aos pés"]
+
+def test_search_pages_in_sql(db_path):
+    _exercises(*[(USER, f"Passe {i:02d}", "Distribuição", "") for i in range(25)])
+    first, last = search_exercises(USER, "passe", page_size=10), search_exercises(USER, "passe", page=2, page_size=10)
+    assert (first.total, len(first.rows), len(last.rows)) == (25, 10, 5)
+    # Sem texto: ordem alfabética
+    assert search_exercises(USER, moment="Distribuição", page=1, page_size=10).rows['title'].iloc[0] == "Passe 10"
+
+def test_moment_tab_reads_only_its_page(db_path):
+    _exercises(*[(USER, f"Bloqueio {i:02d}", "Defesa de Baliza", "") for i in range(12)], (USER, "Soco", "Cruzamento", ""))
+    tab = search_exercises(USER, moment="Defesa de Baliza", page=1, page_size=10)
+    assert (tab.total, tab.rows['title'].tolist()) == (12, ["Bloqueio 10", "Bloqueio 11"])
+    ex_id = int(search_exercises(USER, "soco").rows['id'].iloc[0])
+    assert load_exercise(USER, ex_id)['title'] == "Soco"
+    assert load_exercise("other", ex_id) is None
+
+def test_live_events_are_applied_once(db_path):
+    with db.transaction() as conn:
+        c = conn.cursor()
+        mid, gk = ensure_match(c, USER, "2025-09-06", "A", 1)
+        # A ficha já tem guarda-redes: outro selecionado no painel não o substitui
+        assert ensure_match(c, USER, "2025-09-06", "A", 2) == (mid, gk) == (mid, 1)
+        for metric, delta in (("saves", 1), ("saves", 1), ("de_cabeca", 1), ("de_cabeca", 1), ("de_cabeca", -1), ("goals_conceded", 1)):
+            log_match_event(c, mid, 10, metric, 1, delta)
+    with db.connection() as conn: assert pending_match_events(conn, mid) == 6
+    with db.transaction() as conn: assert apply_match_events(conn.cursor(), mid) == 6
+    with db.transaction() as conn: assert apply_match_events(conn.cursor(), mid) == 0
+    with db.transaction() as conn:
+        c = conn.cursor()
+        # Anular o único evento restante: o contador volta a 0 e sai de match_stats
+        log_match_event(c, mid, 12, "de_cabeca", 1, -1)
+        assert apply_match_events(c, mid) == 1
+    with db.connection() as conn:
+        assert conn.execute("SELECT saves, goals_conceded, version FROM matches WHERE id=?", (mid,)).fetchone() == (2, 1, 3)
+        assert conn.execute("SELECT COUNT(*) FROM match_stats WHERE match_id=?", (mid,)).fetchone()[0] == 0
+        assert pending_match_events(conn, mid) == 0
@@ -0,0 +1,57 @@
+import os
+import sqlite3
+
+import pytest
+
+import db
+from queries import save_match, save_session_drills
+from shards import split, check
+
+def _seed(path):
+    with db.transaction(path) as conn:
+        c = conn.cursor()
+        for user in ("ana", "rui"):
+            c.execute("INSERT INTO users VALUES (?, 'pw')", (user,))
+            c.execute("INSERT INTO exercises (user_id, title) VALUES (?, 'Saídas')", (user,))
+            ex = c.lastrowid
+            c.execute("INSERT INTO sessions (user_id, type, start_date) VALUES (?, 'Treino', '2025-09-01')", (user,))
+            save_session_drills(c, c.lastrowid, [{'exercise_id': ex, 'sets': '3'}])
+            save_match(c, user, "2025-09-06", {'opponent': "A", 'gk_id': 1, 'goals_conceded': 0, 'saves': 1, 'result': "1-0", 'report': "", 'rating': 7},
+                       {'de_cabeca': 1})
+        # Dados sem conta: ficam num shard próprio e são reportados
+        c.execute("INSERT INTO goalkeepers (user_id, name) VALUES ('ghost', 'X')")
+
+def test_split_gives_each_user_only_their_rows(db_path, tmp_path):
+    _seed(db_path)
+    out = str(tmp_path / "shards")
+    catalog, report, orphans = split(db_path, out)
+    assert orphans == ["ghost"]
+    assert check(db_path, report) == {}
+    with db.connection(catalog) as conn:
+        assert conn.execute("SELECT username, shard FROM users ORDER BY username").fetchall() == [(u, db.default_shard(u)) for u in ("ana", "rui")]
+    with db.connection(db_path) as conn:
+        rui_match = conn.execute("SELECT id FROM matches WHERE user_id='rui'").fetchone()[0]
+    path, counts = report["rui"]
+    assert path == os.path.join(out, db.default_shard("rui"))
+    assert (counts['exercises'], counts['session_drills'], counts['match_stats']) == (1, 1, 1)
+    with db.connection(path) as conn:
+        assert {u for (u,) in conn.execute("SELECT user_id FROM sessions UNION SELECT user_id FROM matches")} == {"rui"}
+        # Os ids mantêm-se: as tabelas filhas continuam a apontar para as mesmas linhas
+        assert conn.execute("SELECT match_id, metric FROM match_stats").fetchall() == [(rui_match, 'de_cabeca')]
+    with pytest.raises(FileExistsError): split(db_path, out)
+
+def test_least_recently_used_pool_is_closed(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "MAX_OPEN_POOLS", 2)
+    a, b, c = (str(tmp_path / f"{n}.db") for n in "abc")
+    with db.connection(a) as conn_a: pass
+    with db.connection(b): pass
+    with db.connection(c) as held:
+        db.get_pool(b)
+        # O pool de a (o mais antigo) sai e fecha as ligações paradas
+        assert list(db._pools) == [c, b]
+        with pytest.raises(sqlite3.ProgrammingError): conn_a.execute("SELECT 1")
+        db.get_pool(a)
+        # c saiu com uma ligação em uso: continua a funcionar e fecha-se quando é devolvida
+        assert c not in db._pools
+        held.execute("SELECT 1")
+    with pytest.raises(sqlite3.ProgrammingError): held.execute("SELECT 1")
@@ -0,0 +1,78 @@
+import io
+
+from PIL import Image
+
+import db
+from images import store_exercise_image
+from queries import save_session_drills, save_match, upsert_training_ratings, refresh_rating_rollups
+from transfer import export_user, import_user
+
+USER = "coach"
+
+def _png():
+    buf = io.BytesIO()
+    Image.new("RGB", (40, 30), "red").save(buf, format="PNG")
+    return buf.getvalue()
+
+def _seed(path):
+    with db.transaction(path) as conn:
+        c = conn.cursor()
+        c.execute("INSERT INTO users VALUES (?, 'pw')", (USER,))
+        c.execute("INSERT INTO goalkeepers (user_id, name) VALUES (?, 'Rui')", (USER,))
+        gk = c.lastrowid
+        c.execute("INSERT INTO exercises (user_id, title, moment) VALUES (?, 'Saídas', 'Duelos')", (USER,))
+        ex = c.lastrowid
+        store_exercise_image(c, ex, _png())
+        c.execute("INSERT INTO sessions (user_id, type, title, start_date) VALUES (?, 'Treino', 'Foco', '2025-09-01')", (USER,))
+        save_session_drills(c, c.lastrowid, [{'exercise_id': ex, 'sets': '3', 'reps': '8', 'time': ''}, {'exercise_id': None, 'title': "Antigo"}])
+        upsert_training_ratings(c, USER, [("2025-09-01", gk, 7, "bom")])
+        refresh_rating_rollups(c, USER)
+        save_match(c, USER, "2025-09-06", {'opponent': "A", 'gk_id': gk, 'goals_conceded': 1, 'saves': 4, 'result': "2-1", 'report': "", 'rating': 8},
+                   {'db_bloq_sq_rast': 2})
+
+def _dump(path, user):
+    with db.connection(path) as conn:
+        return {
+            'plan': conn.execute("""SELECT s.start_date, e.title, sd.title, sd.sets FROM session_drills sd JOIN sessions s ON s.id = sd.session_id
+                                    LEFT JOIN exercises e ON e.id = sd.exercise_id WHERE s.user_id=? ORDER BY sd.position""", (user,)).fetchall(),
+            'ratings': conn.execute("""SELECT r.date, g.name, r.rating, r.notes FROM training_ratings r JOIN goalkeepers g ON g.id = r.gk_id
+                                       WHERE r.user_id=?""", (user,)).fetchall(),
+            'matches': conn.execute("""SELECT m.date, g.name, m.rating, s.metric, s.value FROM matches m JOIN goalkeepers g ON g.id = m.gk_id
+                                       JOIN match_stats s ON s.match_id = m.id WHERE m.user_id=?""", (user,)).fetchall(),
+            'images': conn.execute("""SELECT e.title, i.content_hash, length(i.thumbnail) > 0 FROM exercise_images i
+                                      JOIN exercises e ON e.id = i.exercise_id WHERE e.user_id=?""", (user,)).fetchall(),
+            'rollups': conn.execute("SELECT COUNT(*) FROM rating_rollups WHERE user_id=?", (user,)).fetchone()[0],
+        }
+
+def test_export_import_round_trip(db_path, tmp_path):
+    _seed(db_path)
+    archive = io.BytesIO()
+    counts = export_user(USER, archive, db_path)
+    assert counts['images'] == 1 and counts['sessions'] == 1
+    other = str(tmp_path / "other.db")
+    user, _ = import_user(io.BytesIO(archive.getvalue()), other, as_user="copy")
+    assert user == "copy"
+    expected = _dump(db_path, USER)
+    assert _dump(other, "copy") == expected
+    assert expected['plan'] == [("2025-09-01", "Saídas", None, "3"), ("2025-09-01", None, "Antigo", "")]
+    # Importar outra vez atualiza em vez de duplicar
+    import_user(io.BytesIO(archive.getvalue()), other, as_user="copy")
+    assert _dump(other, "copy") == expected
+
+def test_import_without_ratings_still_refreshes_rollups(db_path, tmp_path):
+    # Só um microciclo no arquivo; as notas já estão na base de destino
+    with db.transaction(db_path) as conn:
+        conn.execute("INSERT INTO users VALUES (?, 'pw')", (USER,))
+        conn.execute("INSERT INTO microcycles (user_id, title, start_date) VALUES (?, 'M1', '2025-09-01')", (USER,))
+    archive = io.BytesIO()
+    export_user(USER, archive, db_path)
+    other = str(tmp_path / "other.db")
+    db.init_db(other)
+    with db.transaction(other) as conn:
+        c = conn.cursor()
+        c.execute("INSERT INTO goalkeepers (user_id, name) VALUES (?, 'Rui')", (USER,))
+        upsert_training_ratings(c, USER, [("2025-09-03", c.lastrowid, 7, "")])
+        refresh_rating_rollups(c, USER)
+    import_user(io.BytesIO(archive.getvalue()), other)
+    with db.connection(other) as conn:
+        assert conn.execute("SELECT period_start, n FROM rating_rollups WHERE user_id=? AND period='micro'", (USER,)).fetchall() == [("2025-09-01", 1)]
@@ -0,0 +1,230 @@
+import argparse
+import io
+import json
+import sys
+import time
+import zipfile
+from datetime import datetime
+
+from db import init_db, init_catalog, snapshot, transaction, schema_version, connection, catalog_path, shard_path
+from queries import save_session_drills, save_match, upsert_training_ratings, refresh_rating_rollups
+
+# ==========================================
+# EXPORTAR / IMPORTAR OS DADOS DE UM TREINADOR
+# ==========================================
+# Arquivo ZIP: um .ndjson por tabela (uma linha JSON por registo, lido e escrito em streaming)
+# e as imagens dos exercícios em images/<hash>/ (já normalizadas: não são recodificadas ao importar).
+# Uso:
+#   python transfer.py export <utilizador> arquivo.zip [--db ficheiro.db]
+#   python transfer.py import arquivo.zip [--db ficheiro.db] [--as outro_utilizador]
+# Sem --db, a conta vai para o catálogo e os dados para o ficheiro do utilizador (com GK_SHARD_DIR;
+# sem ele, ambos para DB_PATH).
+ARCHIVE_FORMAT = 1
+IMPORT_BATCH_SIZE = 500
+IMAGE_PARTS = ('original', 'thumbnail', 'print_rendition')
+# Colunas que não vão para o arquivo: antigas, já não lidas (substituídas por exercise_images e session_drills),
+# e de controlo interno de matches (recalculadas ao importar)
+SKIP_COLUMNS = {'exercises': {'image'}, 'sessions': {'drills_list'}, 'matches': {'version', 'events_applied'}}
+
+def _columns(conn, table):
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+def _rows(conn, table, user, order="id"):
+    cols = [c for c in _columns(conn, table) if c != 'user_id' and c not in SKIP_COLUMNS.get(table, ())]
+    cur = conn.execute(f"SELECT {', '.join(cols)} FROM {table} WHERE user_id=? ORDER BY {order}", (user,))
+    for row in cur: yield dict(zip(cols, row))
+
+def _write_ndjson(zf, name, records):
+    n = 0
+    with zf.open(name, 'w') as raw, io.TextIOWrapper(raw, encoding='utf-8') as f:
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n"); n += 1
+    return n
+
+def _read_ndjson(zf, name):
+    if name not in zf.namelist(): return
+    with zf.open(name) as raw:
+        for line in io.TextIOWrapper(raw, encoding='utf-8'):
+            if line.strip(): yield json.loads(line)
+
+def _batches(records, size=IMPORT_BATCH_SIZE):
+    batch = []
+    for rec in records:
+        batch.append(rec)
+        if len(batch) >= size: yield batch; batch = []
+    if batch: yield batch
+
+# ==========================================
+# EXPORTAR
+# ==========================================
+def export_user(user, out, path=None):
+    counts = {}
+    with connection(path or catalog_path()) as conn:
+        account = conn.execute("SELECT username, password FROM users WHERE username=?", (user,)).fetchone()
+    if account is None: raise ValueError(f"Utilizador '{user}' não existe")
+    with snapshot(path or shard_path(user)) as conn, zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as zf:
+        counts['users'] = _write_ndjson(zf, 'users.ndjson', [{'username': account[0], 'password': account[1]}])
+        counts['goalkeepers'] = _write_ndjson(zf, 'goalkeepers.ndjson', _rows(conn, 'goalkeepers', user))
+
+        # Imagens primeiro (o zip só aceita um membro aberto de cada vez); repetidas (mesmo hash) só vão uma vez
+        written = set()
+        for h, *data in conn.execute(f"""SELECT i.content_hash, {', '.join('i.' + p for p in IMAGE_PARTS)}
+                                         FROM exercise_images i JOIN exercises e ON e.id = i.exercise_id WHERE e.user_id=?""", (user,)):
+            if h in written: continue
+            for part, blob in zip(IMAGE_PARTS, data):
+                if blob is not None: zf.writestr(f"images/{h}/{part}", blob, compress_type=zipfile.ZIP_STORED)
+            written.add(h)
+        def exercises():
+            for rec in _rows(conn, 'exercises', user):
+                img = conn.execute("SELECT content_hash, mime, width, height FROM exercise_images WHERE exercise_id=?", (rec['id'],)).fetchone()
+                if img: rec['image'] = dict(zip(('hash', 'mime', 'width', 'height'), img))
+                yield rec
+        counts['exercises'] = _write_ndjson(zf, 'exercises.ndjson', exercises())
+        counts['microcycles'] = _write_ndjson(zf, 'microcycles.ndjson', _rows(conn, 'microcycles', user, "start_date, id"))
+
+        def sessions():
+            for rec in _rows(conn, 'sessions', user, "start_date, id"):
+                rec['drills'] = [dict(zip(('exercise_id', 'sets', 'reps', 'time', 'title'), r)) for r in conn.execute(
+                    "SELECT exercise_id, sets, reps, time, title FROM session_drills WHERE session_id=? ORDER BY position", (rec['id'],))]
+                yield rec
+        counts['sessions'] = _write_ndjson(zf, 'sessions.ndjson', sessions())
+        counts['training_ratings'] = _write_ndjson(zf, 'training_ratings.ndjson', _rows(conn, 'training_ratings', user, "date, id"))
+
+        def matches():
+            for rec in _rows(conn, 'matches', user, "date, id"):
+                rec['stats'] = dict(conn.execute("SELECT metric, value FROM match_stats WHERE match_id=?", (rec['id'],)).fetchall())
+                rec['events'] = [dict(zip(('minute', 'metric', 'gk_id', 'delta', 'created_at'), r)) for r in conn.execute(
+                    "SELECT minute, metric, gk_id, delta, created_at FROM match_events WHERE match_id=? ORDER BY id", (rec['id'],))]
+                yield rec
+        counts['matches'] = _write_ndjson(zf, 'matches.ndjson', matches())
+        counts['images'] = len(written)
+        zf.writestr('manifest.json', json.dumps({'format': ARCHIVE_FORMAT, 'user': user, 'schema_version': schema_version(conn),
+                                                 'exported_at': datetime.now().isoformat(timespec='seconds'), 'counts': counts}, indent=1))
+    return counts
+
+# ==========================================
+# IMPORTAR
+# ==========================================
+# Os ids mudam entre bases de dados: cada tabela mapeia id antigo -> id novo para as que dependem dela.
+# Registos que já existem (mesmo nome / título / data) são atualizados em vez de duplicados,
+# por isso importar o mesmo arquivo duas vezes não cria cópias.
+def _upsert_by(c, table, user, rec, key_cols, cols):
+    vals = [rec.get(k) for k in cols]
+    found = c.execute(f"SELECT id FROM {table} WHERE user_id=? AND {' AND '.join(f'{k}=?' for k in key_cols)} ORDER BY id LIMIT 1",
+                      (user, *[rec.get(k) for k in key_cols])).fetchone()
+    if found:
+        c.execute(f"UPDATE {table} SET {', '.join(f'{k}=?' for k in cols)} WHERE id=?", (*vals, found[0]))
+        return found[0]
+    c.execute(f"INSERT INTO {table} (user_id, {', '.join(cols)}) VALUES (?{',?' * len(cols)})", (user, *vals))
+    return c.lastrowid
+
+def _import_table(zf, name, path, handle):
+    n = 0
+    for batch in _batches(_read_ndjson(zf, f"{name}.ndjson")):
+        with transaction(path) as conn:
+            c = conn.cursor()
+            for rec in batch: handle(c, rec)
+        n += len(batch)
+    return n
+
+def import_user(archive, path=None, as_user=None):
+    if path: init_db(path)
+    else: init_catalog()
+    counts = {}
+    with zipfile.ZipFile(archive) as zf:
+        manifest = json.loads(zf.read('manifest.json'))
+        if manifest.get('format') != ARCHIVE_FORMAT: raise ValueError(f"Formato de arquivo desconhecido: {manifest.get('format')}")
+        user = as_user or manifest['user']
+        with transaction(path or catalog_path()) as conn:
+            for acc in _read_ndjson(zf, 'users.ndjson'):
+                conn.execute("INSERT OR IGNORE INTO users (username, password) VALUES (?,?)", (user, acc['password']))
+        path = path or shard_path(user)
+        with connection(path) as conn:
+            cols = {t: [c for c in _columns(conn, t) if c not in ('id', 'user_id')] for t in ('goalkeepers', 'exercises', 'microcycles')}
+
+        gk_ids, ex_ids, names = {}, {}, set(zf.namelist())
+        def goalkeeper(c, rec):
+            keep = [k for k in cols['goalkeepers'] if k in rec]
+            gk_ids[rec['id']] = _upsert_by(c, 'goalkeepers', user, rec, ['name'], keep)
+        counts['goalkeepers'] = _import_table(zf, 'goalkeepers', path, goalkeeper)
+
+        def exercise(c, rec):
+            keep = [k for k in cols['exercises'] if k in rec and k not in SKIP_COLUMNS['exercises']]
+            eid = ex_ids[rec['id']] = _upsert_by(c, 'exercises', user, rec, ['title'], keep)
+            img = rec.get('image')
+            if img:
+                parts = [zf.read(f"images/{img['hash']}/{p}") if f"images/{img['hash']}/{p}" in names else None for p in IMAGE_PARTS]
+                c.execute(f'''INSERT OR REPLACE INTO exercise_images (exercise_id, content_hash, mime, width, height, {', '.join(IMAGE_PARTS)})
+                              VALUES (?,?,?,?,?,?,?,?)''', (eid, img['hash'], img['mime'], img['width'], img['height'], *parts))
+        counts['exercises'] = _import_table(zf, 'exercises', path, exercise)
+
+        def microcycle(c, rec):
+            _upsert_by(c, 'microcycles', user, rec, ['start_date', 'title'], [k for k in cols['microcycles'] if k in rec])
+        counts['microcycles'] = _import_table(zf, 'microcycles', path, microcycle)
+
+        def session(c, rec):
+            # Uma sessão por dia, como no planeamento
+            found = c.execute("SELECT id FROM sessions WHERE user_id=? AND start_date=?", (user, rec['start_date'])).fetchone()
+            if found:
+                sid = found[0]
+                c.execute("UPDATE sessions SET type=?, title=?, report=?, drills_list=NULL WHERE id=?", (rec.get('type'), rec.get('title'), rec.get('report'), sid))
+            else:
+                c.execute("INSERT INTO sessions (user_id, type, title, start_date, report) VALUES (?,?,?,?,?)",
+                          (user, rec.get('type'), rec.get('title'), rec['start_date'], rec.get('report')))
+                sid = c.lastrowid
+            # Entradas só com título (planos antigos sem exercício no catálogo) passam tal como estão
+            drills = [d for d in rec.get('drills', []) if d.get('exercise_id') in ex_ids or (d.get('exercise_id') is None and d.get('title'))]
+            save_session_drills(c, sid, [d if d.get('exercise_id') is None else dict(d, exercise_id=ex_ids[d['exercise_id']]) for d in drills])
+        counts['sessions'] = _import_table(zf, 'sessions', path, session)
+
+        # Notas: um executemany (upsert) por lote
+        n = 0
+        for batch in _batches(_read_ndjson(zf, 'training_ratings.ndjson')):
+            rows = [(r['date'], gk_ids[r['gk_id']], r['rating'], r.get('notes')) for r in batch if r.get('gk_id') in gk_ids and r.get('rating') is not None]
+            with transaction(path) as conn: upsert_training_ratings(conn.cursor(), user, rows)
+            n += len(rows)
+        counts['training_ratings'] = n
+
+        def match(c, rec):
+            header = {k: rec.get(k) for k in ('opponent', 'goals_conceded', 'saves', 'result', 'report', 'rating')}
+            header['gk_id'] = gk_ids.get(rec.get('gk_id'), 0)
+            mid = save_match(c, user, rec['date'], header, rec.get('stats', {}))
+            # Registo ao vivo: substituído (não duplicado) e já incluído nos totais importados
+            if rec.get('events'):
+                c.execute("DELETE FROM match_events WHERE match_id=?", (mid,))
+                c.executemany("INSERT INTO match_events (match_id, minute, metric, gk_id, delta, created_at) VALUES (?,?,?,?,?,?)",
+                              [(mid, e['minute'], e['metric'], gk_ids.get(e.get('gk_id')), e['delta'], e.get('created_at')) for e in rec['events']])
+                c.execute("UPDATE matches SET events_applied=(SELECT MAX(id) FROM match_events WHERE match_id=?) WHERE id=?", (mid, mid))
+        counts['matches'] = _import_table(zf, 'matches', path, match)
+
+        # Sempre: os agregados por microciclo também mudam com os microciclos importados, mesmo sem notas
+        with transaction(path) as conn: refresh_rating_rollups(conn.cursor(), user)
+    return user, counts
+
+# ==========================================
+# LINHA DE COMANDOS
+# ==========================================
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Exportar/importar todos os dados de um treinador (GK Manager)")
+    sub = p.add_subparsers(dest='cmd', required=True)
+    pe = sub.add_parser('export', help="exportar para um arquivo .zip")
+    pe.add_argument('user'); pe.add_argument('archive'); pe.add_argument('--db')
+    pi = sub.add_parser('import', help="importar um arquivo .zip")
+    pi.add_argument('archive'); pi.add_argument('--db'); pi.add_argument('--as', dest='as_user')
+    args = p.parse_args(argv)
+
+    t0 = time.perf_counter()
+    if args.cmd == 'export':
+        if args.db: init_db(args.db)
+        else: init_catalog()
+        counts = export_user(args.user, args.archive, args.db)
+        print(f"{args.archive}: exportado '{args.user}' de {args.db or shard_path(args.user)}")
+    else:
+        user, counts = import_user(args.archive, args.db, args.as_user)
+        print(f"{args.db or shard_path(user)}: importado '{user}' de {args.archive}")
+        print("Nota: uma app já aberta sobre esta base de dados deve ser reiniciada para limpar as caches.")
+    for table, n in counts.items(): print(f"  {table:<18} {n}")
+    print(f"  ({time.perf_counter() - t0:.2f}s)")
+
+if __name__ == "__main__":
+    sys.exit(main())